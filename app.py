@@ -1,19 +1,44 @@
+import click
 import datetime
+import hashlib
 import jwt
+import logging
 import mongoengine
+import orjson
 import os
+import pymongo
+import re
+import shutil
+import threading
+import time
+from collections import OrderedDict
 from flask import Flask, jsonify, request
-from werkzeug.security import generate_password_hash, check_password_hash
-from functools import wraps
+from flask.json.provider import DefaultJSONProvider
+from functools import lru_cache, wraps
 from dotenv import load_dotenv
 
 # --- NEW: Import Firebase Admin SDK ---
+import base64
+import json
 import firebase_admin
 from firebase_admin import credentials, firestore, messaging
 
+from fcm_fanout import FcmFanout
+from fcm_token_pruner import TokenPruner
+from lazy_services import LazyService
+from observability import instrument_flask, register_mongo_listener, setup_logging, timed
+from password_hashing import PasswordHasher
+from refresh_tokens import RefreshTokenError, RefreshTokenStore
+from user_import import ImportJobs, UserImporter, detect_format, read_records
+from volunteer_dispatch import CallExistsError, DispatchScheduler
+from volunteer_registry import VolunteerRegistry
+
 # Load environment variables from .env file
 load_dotenv()
 
+setup_logging(os.environ.get("LOG_LEVEL", "INFO"))
+logger = logging.getLogger(__name__)
+
 # --- Configuration ---
 MONGO_URI = os.environ.get("MONGODB_URI")
 JWT_SECRET = os.environ.get("JWT_SECRET")
@@ -25,51 +50,131 @@ JWT_ALGORITHM = 'HS256'
 JWT_ACCESS_EXPIRATION = datetime.timedelta(minutes=30)
 JWT_REFRESH_EXPIRATION = datetime.timedelta(days=1)
 
+# Password hashing: werkzeug method spec and hashing processes (0 = hash on the request thread)
+PASSWORD_HASH_METHOD = os.environ.get("PASSWORD_HASH_METHOD", "scrypt:32768:8:1")
+PASSWORD_HASH_WORKERS = int(os.environ.get("PASSWORD_HASH_WORKERS", "2"))
+
+# In-process user cache used by jwt_required (0 disables caching)
+USER_CACHE_SIZE = int(os.environ.get("USER_CACHE_SIZE", "1024"))
+USER_CACHE_TTL = float(os.environ.get("USER_CACHE_TTL_SECONDS", "60"))
+# Opt-in: authenticate from signed access-token claims without touching Mongo
+JWT_STATELESS_AUTH = os.environ.get("JWT_STATELESS_AUTH", "false").lower() in ("1", "true", "yes")
+# How often each worker picks up sessions revoked (logout, token reuse) by other workers
+REVOCATION_SYNC_INTERVAL = float(os.environ.get("REVOCATION_SYNC_INTERVAL_SECONDS", "5"))
+# Bulk user import: rows per insert_many and hashing processes (separate from the login pool)
+USER_IMPORT_BATCH_SIZE = int(os.environ.get("USER_IMPORT_BATCH_SIZE", "500"))
+USER_IMPORT_HASH_WORKERS = int(os.environ.get("USER_IMPORT_HASH_WORKERS", "2"))
+# Uploads to /admin/users/import above this many bytes are spooled to disk before the import starts
+USER_IMPORT_SPOOL_BYTES = int(os.environ.get("USER_IMPORT_SPOOL_BYTES", str(1024 * 1024)))
+# Keep available volunteers in memory via a Firestore snapshot listener
+VOLUNTEER_REGISTRY_ENABLED = os.environ.get("VOLUNTEER_REGISTRY_ENABLED", "true").lower() in ("1", "true", "yes")
+# Worker threads used to send FCM batches in parallel
+FCM_FANOUT_WORKERS = int(os.environ.get("FCM_FANOUT_WORKERS", "4"))
+# Retries (with exponential backoff) for tokens that failed transiently
+FCM_RETRY_ATTEMPTS = int(os.environ.get("FCM_RETRY_ATTEMPTS", "3"))
+# "broadcast" notifies every available volunteer; "waves" reserves and rings them in escalating waves
+DISPATCH_MODE = os.environ.get("DISPATCH_MODE", "broadcast")
+DISPATCH_WAVES = [int(size) for size in os.environ.get("DISPATCH_WAVES", "5,20,0").split(",")]
+DISPATCH_WAVE_INTERVAL = float(os.environ.get("DISPATCH_WAVE_INTERVAL_SECONDS", "15"))
+# Open Mongo and Firebase connections when a worker starts instead of on its first request
+PRELOAD_CONNECTIONS = os.environ.get("PRELOAD_CONNECTIONS", "false").lower() in ("1", "true", "yes")
+# Time limit of each dependency check made by /ready
+READY_CHECK_TIMEOUT = float(os.environ.get("READY_CHECK_TIMEOUT_SECONDS", "2"))
+
 # --- App Initialization and DB Connection ---
+class OrjsonProvider(DefaultJSONProvider):
+    """
+    jsonify and request.get_json through orjson. Same values as the default
+    provider, dates included (handed to its default(), so still HTTP dates),
+    but without whitespace and with non-ASCII text written as UTF-8 instead of
+    \\u escapes; both decode to the same JSON.
+    """
+
+    def dumps(self, obj, **kwargs):
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        return orjson.dumps(obj, default=self.default, option=option).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+
 app = Flask(__name__)
 app.config["SECRET_KEY"] = JWT_SECRET
+app.json = OrjsonProvider(app)
+# Per-route latency histograms and /metrics
+instrument_flask(app)
 
-# Connect to MongoDB
-try:
-    mongoengine.connect(host=MONGO_URI)
-    print("Successfully connected to MongoDB.")
-except Exception as e:
-    print(f"Error connecting to MongoDB: {e}")
+# --- MongoDB and Firebase (connected lazily, once per worker process) ---
+register_mongo_listener()
 
-# --- NEW: Initialize Firebase Admin SDK (Production-Ready) ---
-import base64
-import json
 
-try:
+def connect_mongo():
+    # connect() hands back the client already registered under the alias, which
+    # after a fork is the parent's; drop it so this process gets its own
+    mongoengine.disconnect()
+    client = mongoengine.connect(host=MONGO_URI)
+    logger.info("Connected to MongoDB.")
+    return client
+
+
+_firebase_pid = None
+
+
+def init_firebase():
+    """Initializes Firebase Admin from the environment or serviceAccountKey.json; None if neither exists."""
+    global _firebase_pid
+    if firebase_admin._apps:
+        if _firebase_pid in (None, os.getpid()):
+            # Set up by the embedding process (tests, benchmarks)
+            return firebase_admin.get_app()
+        # Inherited from the parent process across a fork; start over with fresh channels
+        firebase_admin.delete_app(firebase_admin.get_app())
+    _firebase_pid = os.getpid()
+
     # Check for the production environment variable first
     encoded_service_account = os.environ.get("FIREBASE_SERVICE_ACCOUNT_BASE64")
-
     if encoded_service_account:
-        print("Found Firebase credentials in environment variable. Initializing for production.")
-        # Decode the Base64 string
-        decoded_service_account = base64.b64decode(encoded_service_account).decode('utf-8')
-        # Parse the JSON string into a dictionary
-        service_account_info = json.loads(decoded_service_account)
-        # Initialize the app with the credentials dictionary
-        cred = credentials.Certificate(service_account_info)
-        firebase_admin.initialize_app(cred)
-        print("Successfully initialized Firebase Admin SDK from environment variable.")
-    else:
-        # Fallback to local file for development
-        print("Firebase environment variable not found. Looking for local serviceAccountKey.json file.")
-        cred_path = os.path.join(os.path.dirname(__file__), 'serviceAccountKey.json')
-        if os.path.exists(cred_path):
-            cred = credentials.Certificate(cred_path)
-            firebase_admin.initialize_app(cred)
-            print("Successfully initialized Firebase Admin SDK from local file.")
-        else:
-            print("WARNING: 'serviceAccountKey.json' not found. Firebase features will be unavailable.")
-            
-except Exception as e:
-    print(f"FATAL: Error initializing Firebase Admin SDK: {e}")
+        logger.info("Found Firebase credentials in environment variable. Initializing for production.")
+        # Decode the Base64 string and parse the JSON into a dictionary
+        service_account_info = json.loads(base64.b64decode(encoded_service_account).decode('utf-8'))
+        firebase_app = firebase_admin.initialize_app(credentials.Certificate(service_account_info))
+        logger.info("Successfully initialized Firebase Admin SDK from environment variable.")
+        return firebase_app
+
+    # Fallback to local file for development
+    cred_path = os.path.join(os.path.dirname(__file__), 'serviceAccountKey.json')
+    if os.path.exists(cred_path):
+        firebase_app = firebase_admin.initialize_app(credentials.Certificate(cred_path))
+        logger.info("Successfully initialized Firebase Admin SDK from local file.")
+        return firebase_app
+    logger.warning("'serviceAccountKey.json' not found. Firebase features will be unavailable.")
+    return None
+
+
+mongo = LazyService('MongoDB', connect_mongo)
+firebase = LazyService('Firebase Admin SDK', init_firebase)
+
+
+def firebase_configured():
+    return bool(os.environ.get("FIREBASE_SERVICE_ACCOUNT_BASE64")) or os.path.exists(
+        os.path.join(os.path.dirname(__file__), 'serviceAccountKey.json'))
+
+
+@app.before_request
+def ensure_mongo_connection():
+    mongo.get()
+
+
+password_hasher = PasswordHasher(PASSWORD_HASH_METHOD, PASSWORD_HASH_WORKERS)
 
 
 # --- Models (defined with core mongoengine) ---
+def normalize_email(email):
+    return email.strip().casefold()
+
+
 class User(mongoengine.Document):
     name = mongoengine.StringField(required=True, max_length=255)
     email = mongoengine.EmailField(required=True, unique=True)
@@ -80,11 +185,19 @@ class User(mongoengine.Document):
 
     meta = {'collection': 'users'}
 
+    def clean(self):
+        # Stored case-folded, so the unique index and lookups ignore case
+        if isinstance(self.email, str):
+            self.email = normalize_email(self.email)
+
     def set_password(self, password):
-        self.password = generate_password_hash(password)
+        self.password = password_hasher.hash(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password, password)
+        return password_hasher.verify(self.password, password)
+
+    def password_needs_rehash(self):
+        return password_hasher.needs_rehash(self.password)
 
     def to_json(self):
         return {
@@ -94,15 +207,151 @@ class User(mongoengine.Document):
             'account_type': self.account_type,
         }
 
+# --- User Cache ---
+class UserCache:
+    """
+    Bounded LRU cache of User documents keyed by user id, with a TTL.
+    Entries are dropped whenever a User is saved or deleted (see signals below).
+    """
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            user, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return user
+
+    def put(self, user_id, user):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[user_id] = (user, time.monotonic() + self.ttl)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+user_cache = UserCache(USER_CACHE_SIZE, USER_CACHE_TTL)
+
+
+def _invalidate_cached_user(sender, document, **kwargs):
+    if document.id is not None:
+        user_cache.invalidate(str(document.id))
+
+# Note: QuerySet.update() bypasses these signals; reload or save() the document instead.
+mongoengine.signals.post_save.connect(_invalidate_cached_user, sender=User)
+mongoengine.signals.post_delete.connect(_invalidate_cached_user, sender=User)
+
+# --- Bulk user import ---
+# Own hashing pool, so an import does not queue logins behind thousands of hashes
+user_importer = UserImporter(User, PasswordHasher(PASSWORD_HASH_METHOD, USER_IMPORT_HASH_WORKERS), USER_IMPORT_BATCH_SIZE)
+user_import_jobs = ImportJobs(user_importer, USER_IMPORT_SPOOL_BYTES)
+
+# --- Refresh-token sessions ---
+token_store = RefreshTokenStore(JWT_REFRESH_EXPIRATION, JWT_ACCESS_EXPIRATION, REVOCATION_SYNC_INTERVAL)
+
+
+# Fields loaded for request.user: what to_json and the role checks read
+USER_READ_FIELDS = ('name', 'email', 'account_type')
+
+
+def get_user(user_id):
+    """Returns the User for user_id, served from the cache when possible."""
+    user = user_cache.get(user_id)
+    if user is None:
+        user = User.objects.only(*USER_READ_FIELDS).get(id=user_id)
+        user_cache.put(user_id, user)
+    return user
+
+
+class TokenPrincipal:
+    """
+    Lightweight request user built from the signed claims of an access token.
+    It has no email; views that return the profile load the stored user.
+    """
+
+    def __init__(self, payload):
+        self.id = payload['user_id']
+        self.name = payload['name']
+        self.account_type = payload['account_type']
+
+
+# --- Profile responses ---
+@lru_cache(maxsize=1024)
+def _profile_body(user_items):
+    body = app.json.dumps({
+        'message': 'Successfully accessed protected route.',
+        'user': dict(user_items)
+    }).encode()
+    return body, hashlib.blake2b(body, digest_size=12).hexdigest()
+
+
+def profile_payload(user):
+    """
+    The serialized /profile body and its ETag. Keyed by the profile fields, so
+    a changed profile gets a new body and tag while an unchanged one is
+    served without serializing it again.
+    """
+    return _profile_body(tuple(user.to_json().items()))
+
 # --- Helper Functions and Decorators ---
-def generate_tokens(user_id):
+# meetingId is copied into the FCM data payload, which FCM caps at 4 KB per message
+MEETING_ID_PATTERN = re.compile(r'[A-Za-z0-9._:-]{1,128}')
+
+
+def valid_meeting_id(meeting_id):
+    return isinstance(meeting_id, str) and MEETING_ID_PATTERN.fullmatch(meeting_id) is not None
+
+def user_claims(user):
+    """
+    Claims embedded in access tokens so jwt_required can skip the user lookup,
+    or None unless JWT_STATELESS_AUTH is on. Tokens are only signed, not
+    encrypted, so they carry no email.
+    """
+    if not JWT_STATELESS_AUTH:
+        return None
+    return {
+        'name': user.name,
+        'account_type': user.account_type,
+    }
+
+def generate_tokens(user_id, claims=None, session=None):
+    """
+    Returns (access_token, refresh_token). `session` is the (family, jti) pair
+    the refresh token is issued for; without it a new session is started.
+    """
+    family, jti = session or token_store.start_family(user_id)
     access_payload = {
         'user_id': user_id,
+        'sid': family,
         'exp': datetime.datetime.utcnow() + JWT_ACCESS_EXPIRATION,
         'type': 'access'
     }
+    if claims:
+        access_payload.update(claims)
     refresh_payload = {
         'user_id': user_id,
+        'sid': family,
+        'jti': jti,
         'exp': datetime.datetime.utcnow() + JWT_REFRESH_EXPIRATION,
         'type': 'refresh'
     }
@@ -121,17 +370,35 @@ def jwt_required(f):
             payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
             if payload.get('type') != 'access':
                 return jsonify({'error': 'Invalid token type'}), 401
+            # In-memory lookup; see RefreshTokenStore
+            if token_store.is_revoked(payload.get('sid')):
+                return jsonify({'error': 'Session has been revoked'}), 401
+            request.session_id = payload.get('sid')
             user_id = payload.get('user_id')
-            user = User.objects.get(id=user_id)
-            request.user = user
+            if JWT_STATELESS_AUTH and 'account_type' in payload:
+                request.user = TokenPrincipal(payload)
+            else:
+                request.user = get_user(user_id)
         except jwt.ExpiredSignatureError:
             return jsonify({'error': 'Token has expired'}), 401
-        except (jwt.InvalidTokenError, mongoengine.errors.DoesNotExist):
+        except (jwt.InvalidTokenError, mongoengine.errors.DoesNotExist, mongoengine.errors.ValidationError):
             return jsonify({'error': 'Authentication failed'}), 401
         return f(*args, **kwargs)
     return decorated
 
+def admin_required(f):
+    @wraps(f)
+    @jwt_required
+    def decorated(*args, **kwargs):
+        if request.user.account_type != 'admin':
+            return jsonify({'error': 'Admin access required'}), 403
+        return f(*args, **kwargs)
+    return decorated
+
 # --- API Routes ---
+# Account types anyone may sign up as; admins are only made by hand
+SIGNUP_ACCOUNT_TYPES = ('volunteer', 'blind')
+
 @app.route('/signup', methods=['POST'])
 def signup_view():
     data = request.get_json()
@@ -143,18 +410,27 @@ def signup_view():
     account_type = data.get('account_type')
     if not all([name, email, password, account_type]):
         return jsonify({'error': 'All fields are required'}), 400
-    if User.objects(email=email).first():
-        return jsonify({'error': 'User with this email already exists'}), 400
+    if not all(isinstance(value, str) for value in (name, email, password)):
+        return jsonify({'error': 'name, email and password must be strings'}), 400
+    if account_type not in SIGNUP_ACCOUNT_TYPES:
+        return jsonify({'error': f'account_type must be one of {", ".join(SIGNUP_ACCOUNT_TYPES)}'}), 400
     user = User(name=name, email=email, account_type=account_type)
     user.set_password(password)
-    user.save()
-    access_token, refresh_token = generate_tokens(str(user.id))
+    # The unique email index decides; checking first would cost a query and still race
+    try:
+        user.save(force_insert=True)
+    except mongoengine.errors.NotUniqueError:
+        return jsonify({'error': 'User with this email already exists'}), 400
+    access_token, refresh_token = generate_tokens(str(user.id), user_claims(user))
     return jsonify({
         'user': user.to_json(),
         'access_token': access_token,
         'refresh_token': refresh_token
     }), 201
 
+# What login needs: the password hash and the fields of the response and token claims
+LOGIN_FIELDS = ('name', 'email', 'password', 'account_type')
+
 @app.route('/login', methods=['POST'])
 def login_view():
     data = request.get_json()
@@ -164,9 +440,16 @@ def login_view():
     password = data.get('password')
     if not all([email, password]):
         return jsonify({'error': 'Email and password are required'}), 400
-    user = User.objects(email=email).first()
+    if not isinstance(email, str):
+        # No stored email matches a non-string, as before emails were normalized
+        return jsonify({'error': 'Invalid credentials'}), 401
+    user = User.objects(email=normalize_email(email)).only(*LOGIN_FIELDS).first()
     if user and user.check_password(password):
-        access_token, refresh_token = generate_tokens(str(user.id))
+        if user.password_needs_rehash():
+            # Stored with outdated parameters; upgrade while we have the plain password
+            user.set_password(password)
+            user.save()
+        access_token, refresh_token = generate_tokens(str(user.id), user_claims(user))
         return jsonify({
             'user': user.to_json(),
             'access_token': access_token,
@@ -178,68 +461,166 @@ def login_view():
 
 
 
+# --- Volunteer Registry ---
+def available_volunteers_query():
+    db = firestore.client()
+    return db.collection('volunteers').where(filter=firestore.FieldFilter('isAvailable', '==', True))
+
+
+def start_volunteer_registry():
+    registry = VolunteerRegistry(available_volunteers_query)
+    registry.start()
+    return registry
+
+
+# Listeners are per process, so per worker; a forked worker starts its own
+volunteer_registry = LazyService('volunteer registry', start_volunteer_registry)
+
+
+def available_volunteer_tokens():
+    """Returns {volunteer_id: fcm_token} for all available volunteers."""
+    if VOLUNTEER_REGISTRY_ENABLED:
+        return volunteer_registry.get().available()
+    available = {}
+    with timed('firestore', 'volunteers.stream'):
+        for volunteer_doc in available_volunteers_query().stream():
+            token = volunteer_doc.to_dict().get('fcmToken')
+            if isinstance(token, str) and token: # Only add if the token exists, is a string and is not empty
+                available[volunteer_doc.id] = token
+    return available
+
+
+fcm_fanout = FcmFanout(max_workers=FCM_FANOUT_WORKERS)
+# Removes dead tokens from Firestore and retries transient failures in the background
+fcm_token_pruner = TokenPruner(fcm_fanout, firestore.client, max_retries=FCM_RETRY_ATTEMPTS)
+
+dispatch_scheduler = DispatchScheduler(
+    firestore.client,
+    available_volunteer_tokens,
+    fcm_fanout,
+    pruner=fcm_token_pruner,
+    waves=DISPATCH_WAVES,
+    wave_interval=DISPATCH_WAVE_INTERVAL,
+)
+
+
+def _log_fanout_result(future):
+    try:
+        result = future.result()
+    except Exception as e:
+        logger.error(f"FCM fan-out failed: {type(e).__name__}: {e}")
+        return
+    logger.info("FCM fan-out finished", extra={'success_count': result.success_count,
+                                               'failure_count': result.failure_count})
+
+
 # --- NEW: Endpoint to replace Cloud Function (Simplified) ---
 @app.route('/call-volunteer', methods=['POST'])
 def call_volunteer_view():
     """
     Finds ALL available volunteers and sends them a push notification with the meeting ID.
+    Pass "wait": false to get a 202 right away while the notifications are sent in the background.
+    With DISPATCH_MODE=waves, volunteers are reserved and notified in waves until one accepts.
     """
-    if not firebase_admin._apps:
+    if firebase.get() is None:
         return jsonify({'error': 'Firebase is not configured on the server.'}), 500
 
-    data = request.get_json()
+    data = request.get_json(silent=True) or {}
     meeting_id = data.get('meetingId')
     if not meeting_id:
         return jsonify({'error': 'meetingId is required'}), 400
+    if not valid_meeting_id(meeting_id):
+        return jsonify({'error': 'meetingId must be at most 128 letters, digits or ._:-'}), 400
+
+    notification = messaging.Notification(
+        title='Incoming Call for Assistance!',
+        body='Someone needs your help. Tap to join the call.',
+    )
+    message_data = {
+        'meetingId': meeting_id,
+        'click_action': 'FLUTTER_NOTIFICATION_CLICK', 
+    }
 
     try:
-        db = firestore.client()
-        
-        # The query is now simpler: just find all documents where isAvailable is true.
-        # We don't need to order or limit anymore.
-        volunteers_ref = db.collection('volunteers').where(filter=firestore.FieldFilter('isAvailable', '==', True)).stream()
-        
-        # Collect all the valid device tokens
-        fcm_tokens = []
-        for volunteer_doc in volunteers_ref:
-            volunteer_data = volunteer_doc.to_dict()
-            token = volunteer_data.get('fcmToken')
-            if token: # Only add if the token exists and is not empty
-                fcm_tokens.append(token)
+        if DISPATCH_MODE == 'waves':
+            try:
+                notified = dispatch_scheduler.dispatch(meeting_id, notification, message_data)
+            except CallExistsError:
+                return jsonify({'error': 'A call with this meetingId was already placed.'}), 409
+            if not notified:
+                return jsonify({'error': 'No volunteers are available right now. Please try again later.'}), 404
+            return jsonify({'message': f'Notifying volunteers, first {notified} notified.'}), 202
+
+        # Served from the in-memory registry; falls back to a query if its listener is down.
+        volunteers = available_volunteer_tokens()
+        fcm_tokens = list(volunteers.values())
 
         # Check if we found any volunteers at all
         if not fcm_tokens:
-            print("No available volunteers with FCM tokens were found.")
+            logger.info("No available volunteers with FCM tokens were found.")
             return jsonify({'error': 'No volunteers are available right now. Please try again later.'}), 404
 
-        print(f"Found {len(fcm_tokens)} available volunteers. Sending notifications.")
-
-        # Construct a single message to send to multiple devices
-        message = messaging.MulticastMessage(
-            notification=messaging.Notification(
-                title='Incoming Call for Assistance!',
-                body='Someone needs your help. Tap to join the call.',
-            ),
-            data={
-                'meetingId': meeting_id,
-                'click_action': 'FLUTTER_NOTIFICATION_CLICK', 
-            },
-            tokens=fcm_tokens, # The list of all tokens
-        )
-
-        # Use send_multicast to efficiently notify everyone at once
-        response = messaging.send_multicast(message)
-        print(f'Successfully sent messages to {response.success_count} devices.')
-        if response.failure_count > 0:
-            print(f'Failed to send messages to {response.failure_count} devices.')
-
-        return jsonify({'message': f'Successfully notified {response.success_count} volunteers.'}), 200
+        logger.info("Found available volunteers. Sending notifications.", extra={'volunteers': len(fcm_tokens)})
+
+        # Sent in 500-token batches on the fan-out pool
+        future = fcm_fanout.submit(fcm_tokens, notification, message_data)
+        future.add_done_callback(_log_fanout_result)
+        fcm_token_pruner.track(future, {token: vid for vid, token in volunteers.items()}, notification, message_data)
+
+        if not data.get('wait', True):
+            # Caller opted out of waiting; the send finishes in the background
+            return jsonify({'message': f'Notifying {len(fcm_tokens)} volunteers.'}), 202
+
+        result = future.result()
+        return jsonify({'message': f'Successfully notified {result.success_count} volunteers.'}), 200
 
     except Exception as e:
-        print(f"An error occurred inside call_volunteer_view: {type(e).__name__}: {e}")
+        logger.exception(f"An error occurred inside call_volunteer_view: {type(e).__name__}: {e}")
         return jsonify({'error': f'An internal server error occurred while contacting volunteers.: {type(e).__name__}: {e}'}), 500
 
 
+@app.route('/call-volunteer/accept', methods=['POST'])
+@jwt_required
+def accept_call_view():
+    """
+    Called by a volunteer's app to take a call rung in waves mode.
+    Only the first volunteer to accept gets the call; the others are released.
+    The volunteer is the signed-in user: volunteers/{id} documents are keyed by user id.
+    """
+    if firebase.get() is None:
+        return jsonify({'error': 'Firebase is not configured on the server.'}), 500
+    if request.user.account_type != 'volunteer':
+        return jsonify({'error': 'Only volunteers can accept calls'}), 403
+
+    data = request.get_json(silent=True) or {}
+    meeting_id = data.get('meetingId')
+    volunteer_id = str(request.user.id)
+    if not meeting_id:
+        return jsonify({'error': 'meetingId is required'}), 400
+    if not valid_meeting_id(meeting_id):
+        return jsonify({'error': 'meetingId must be at most 128 letters, digits or ._:-'}), 400
+    # Older apps still send their id; it has to be their own
+    if data.get('volunteerId') not in (None, volunteer_id):
+        return jsonify({'error': 'volunteerId does not match the signed-in user'}), 403
+
+    try:
+        if not dispatch_scheduler.accept(meeting_id, volunteer_id):
+            return jsonify({'error': 'This call is no longer available.'}), 409
+        return jsonify({'message': 'Call accepted.', 'meetingId': meeting_id})
+    except Exception as e:
+        logger.exception(f"An error occurred inside accept_call_view: {type(e).__name__}: {e}")
+        return jsonify({'error': f'An internal server error occurred while accepting the call.: {type(e).__name__}: {e}'}), 500
+
+
+@app.route('/call-volunteer/<meeting_id>', methods=['GET'])
+def call_status_view(meeting_id):
+    if firebase.get() is None:
+        return jsonify({'error': 'Firebase is not configured on the server.'}), 500
+    state = dispatch_scheduler.state(meeting_id)
+    if state is None:
+        return jsonify({'error': 'Call not found'}), 404
+    return jsonify({'meetingId': meeting_id, 'state': state})
+
 
 @app.route('/token/refresh', methods=['POST'])
 def token_refresh_view():
@@ -252,29 +633,176 @@ def token_refresh_view():
         if payload.get('type') != 'refresh':
             return jsonify({'error': 'Invalid token type'}), 400
         user_id = payload.get('user_id')
-        access_token, new_refresh_token = generate_tokens(user_id)
+        claims = None
+        if JWT_STATELESS_AUTH:
+            # Refresh is the one place stateless tokens pick up profile changes
+            claims = user_claims(get_user(user_id))
+        # Each refresh token works once; presenting a used one ends the session
+        family = payload.get('sid')
+        new_jti = token_store.rotate(family, payload.get('jti'))
+        access_token, new_refresh_token = generate_tokens(user_id, claims, (family, new_jti))
         return jsonify({
             'access_token': access_token,
             'refresh_token': new_refresh_token
         })
     except jwt.ExpiredSignatureError:
         return jsonify({'error': 'Token expired'}), 401
-    except jwt.InvalidTokenError:
+    except RefreshTokenError as e:
+        if e.reason == 'reused':
+            return jsonify({'error': 'Refresh token was already used. Please log in again.'}), 401
+        return jsonify({'error': 'Invalid token'}), 401
+    except (jwt.InvalidTokenError, mongoengine.errors.DoesNotExist, mongoengine.errors.ValidationError):
         return jsonify({'error': 'Invalid token'}), 401
 
 @app.route('/logout', methods=['POST'])
 @jwt_required
 def logout_view():
+    # Tokens issued before sessions were tracked carry no sid and simply expire
+    if request.session_id:
+        token_store.revoke(request.session_id)
     return jsonify({'message': 'Successfully logged out'})
 
+@app.route('/admin/users/import', methods=['POST'])
+@admin_required
+def import_users_view():
+    """
+    Creates users from a CSV (text/csv) or NDJSON (application/x-ndjson) request body.
+    Returns 202 once the body is received; the import runs in the background and
+    GET /admin/users/import/<job_id> reports its progress.
+    """
+    fmt = request.args.get('format') or detect_format(request.content_type)
+    if fmt not in ('csv', 'ndjson'):
+        return jsonify({'error': 'Send text/csv or application/x-ndjson, or pass ?format=csv|ndjson'}), 400
+    body = user_import_jobs.spool()
+    shutil.copyfileobj(request.stream, body)
+    job = user_import_jobs.start(body, fmt, str(request.user.id))
+    status_url = f'/admin/users/import/{job.job_id}'
+    return jsonify(dict(job.to_json(), status_url=status_url)), 202, {'Location': status_url}
+
+
+@app.route('/admin/users/import/<job_id>', methods=['GET'])
+@admin_required
+def import_status_view(job_id):
+    job = user_import_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Import not found'}), 404
+    return jsonify(job.to_json())
+
+
+@app.cli.command('import-users')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'ndjson']), help='Defaults to the file extension.')
+@click.option('--workers', type=int, help='Hashing processes (default USER_IMPORT_HASH_WORKERS).')
+def import_users_command(path, fmt, workers):
+    """Creates users from a CSV or NDJSON file: flask --app app import-users volunteers.csv"""
+    fmt = fmt or detect_format(filename=path)
+    if fmt is None:
+        raise click.UsageError('Cannot tell the format from the file name; pass --format.')
+    mongo.get()
+    importer = user_importer
+    if workers is not None:
+        importer = UserImporter(User, PasswordHasher(PASSWORD_HASH_METHOD, workers), USER_IMPORT_BATCH_SIZE)
+
+    def progress(report):
+        click.echo(f"{report.received} read, {report.inserted} inserted, "
+                   f"{report.duplicate_count} duplicates, {report.invalid_count} invalid", err=True)
+
+    with open(path, encoding='utf-8-sig', newline='') as f:
+        report = importer.run(read_records(f, fmt), on_batch=progress)
+    click.echo(json.dumps(report.to_json(), indent=2))
+
+
+@app.cli.command('normalize-emails')
+def normalize_emails_command():
+    """Case-folds emails stored before signup normalized them. Run once after upgrading."""
+    mongo.get()
+    updated, conflicts = 0, []
+    for user in User.objects.only('email').no_cache():
+        normalized = normalize_email(user.email)
+        if normalized == user.email:
+            continue
+        try:
+            User.objects(id=user.id).update_one(set__email=normalized)
+            updated += 1
+        except mongoengine.errors.NotUniqueError:
+            conflicts.append(user.email)
+    click.echo(f"{updated} emails normalized")
+    for email in conflicts:
+        click.echo(f"{email}: another account already uses {normalize_email(email)}; merge or rename it by hand", err=True)
+
+
 @app.route('/profile', methods=['GET'])
 @jwt_required
 def profile_view():
     user = request.user
-    return jsonify({
-        'message': 'Successfully accessed protected route.',
-        'user': user.to_json()
-    })
+    if isinstance(user, TokenPrincipal):
+        # The email is not in the token; served from the user cache
+        try:
+            user = get_user(user.id)
+        except (mongoengine.errors.DoesNotExist, mongoengine.errors.ValidationError):
+            return jsonify({'error': 'Authentication failed'}), 401
+    body, etag = profile_payload(user)
+    if request.if_none_match.contains_weak(etag):
+        response = app.response_class(status=304)
+    else:
+        response = app.response_class(body, mimetype='application/json')
+    response.set_etag(etag)
+    # Clients may keep the body but must revalidate it on every poll
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+# --- Startup and readiness ---
+def warm_up():
+    """
+    Opens this worker's connections now rather than on its first request.
+    Runs after fork (see gunicorn.conf.py), so every worker gets its own.
+    """
+    started = time.perf_counter()
+    check_mongo()
+    if firebase.get() is not None:
+        firestore.client()
+        if VOLUNTEER_REGISTRY_ENABLED:
+            volunteer_registry.get()
+    password_hasher.warm_up()
+    logger.info("Worker warmed up", extra={'pid': os.getpid(), 'seconds': round(time.perf_counter() - started, 3)})
+
+
+def check_mongo():
+    started = time.perf_counter()
+    try:
+        client = mongo.get()
+        if client is None:
+            return {'ok': False, 'error': mongo.error}
+        with pymongo.timeout(READY_CHECK_TIMEOUT):
+            client.admin.command('ping')
+    except Exception as e:
+        return {'ok': False, 'error': f"{type(e).__name__}: {e}"}
+    return {'ok': True, 'latency_ms': round((time.perf_counter() - started) * 1000, 1)}
+
+
+def check_firebase():
+    if firebase.get() is None:
+        # Without credentials Firebase is optional (push features are off), so this is not fatal
+        configured = firebase_configured()
+        return {'ok': not configured, 'configured': configured, 'error': firebase.error}
+    result = {'ok': True, 'configured': True}
+    if VOLUNTEER_REGISTRY_ENABLED and volunteer_registry.initialized:
+        registry = volunteer_registry.get()
+        # Informational: /call-volunteer falls back to a query while the listener is down
+        result['volunteer_registry'] = 'live' if registry is not None and registry.healthy else 'fallback'
+    return result
+
+
+@app.route('/ready', methods=['GET'])
+def ready_view():
+    """Readiness probe: 200 when MongoDB answers and Firebase (if configured) is initialized."""
+    checks = {'mongo': check_mongo(), 'firebase': check_firebase()}
+    ready = all(check['ok'] for check in checks.values())
+    return jsonify({'ready': ready, 'checks': checks}), 200 if ready else 503
+
 
 if __name__ == '__main__':
+    if PRELOAD_CONNECTIONS:
+        warm_up()
     app.run(debug=True, host='0.0.0.0', port=7860, threaded=True)
\ No newline at end of file
@@ -0,0 +1,428 @@
+"""
+Async (ASGI) serving mode for the main backend.
+
+Exposes the same routes and responses as app.py, but user reads and writes go
+through PyMongo's async driver with an explicitly sized connection pool, and the
+blocking Firebase Admin calls run off the event loop. Configuration, models,
+token helpers and the Firebase subsystems are shared with app.py.
+
+    uvicorn asgi_app:app --host 0.0.0.0 --port 7860
+"""
+import asyncio
+import contextlib
+import logging
+import os
+import re
+import sys
+import time
+
+import bson
+import jwt
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response
+from pymongo import AsyncMongoClient
+from pymongo.errors import DuplicateKeyError
+from prometheus_client import CONTENT_TYPE_LATEST
+
+from observability import REQUEST_LATENCY, metrics_payload
+from user_import import detect_format
+
+import app as backend
+from app import (
+    JWT_ALGORITHM, JWT_SECRET, JWT_STATELESS_AUTH, DISPATCH_MODE, LOGIN_FIELDS, MONGO_URI,
+    SIGNUP_ACCOUNT_TYPES, USER_READ_FIELDS,
+    normalize_email, profile_payload,
+    RefreshTokenError, TokenPrincipal, User, generate_tokens, token_store, user_cache, user_claims, user_import_jobs,
+)
+
+# Connection pool of the async Mongo client
+ASYNC_MONGO_POOL_SIZE = int(os.environ.get("ASYNC_MONGO_POOL_SIZE", "100"))
+ASYNC_MONGO_MIN_POOL_SIZE = int(os.environ.get("ASYNC_MONGO_MIN_POOL_SIZE", "0"))
+
+logger = logging.getLogger(__name__)
+
+mongo_client = AsyncMongoClient(
+    MONGO_URI,
+    maxPoolSize=ASYNC_MONGO_POOL_SIZE,
+    minPoolSize=ASYNC_MONGO_MIN_POOL_SIZE,
+)
+users = mongo_client.get_default_database(default='test')[User._meta['collection']]
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    # Writes bypass mongoengine, so make sure the unique email index exists up front
+    await asyncio.to_thread(backend.mongo.get)
+    await asyncio.to_thread(User.ensure_indexes)
+    if backend.PRELOAD_CONNECTIONS:
+        await asyncio.to_thread(backend.warm_up)
+    for method, path in missing_routes():
+        logger.warning("Route of app.py not served in ASGI mode", extra={'method': method, 'path': path})
+    yield
+
+
+app = FastAPI(lifespan=lifespan)
+
+
+@app.middleware('http')
+async def record_latency(request: Request, call_next):
+    started = time.perf_counter()
+    response = await call_next(request)
+    route = request.scope.get('route')
+    REQUEST_LATENCY.labels(request.method, route.path if route else 'unmatched', response.status_code).observe(
+        time.perf_counter() - started)
+    return response
+
+
+@app.get('/metrics')
+async def metrics_view():
+    return Response(metrics_payload(), media_type=CONTENT_TYPE_LATEST)
+
+
+@app.get('/ready')
+async def ready_view():
+    """Same checks as app.ready_view, pinging the async client this mode actually uses."""
+    started = time.perf_counter()
+    try:
+        await asyncio.wait_for(mongo_client.admin.command('ping'), backend.READY_CHECK_TIMEOUT)
+        mongo = {'ok': True, 'latency_ms': round((time.perf_counter() - started) * 1000, 1)}
+    except Exception as e:
+        mongo = {'ok': False, 'error': f"{type(e).__name__}: {e}"}
+    checks = {'mongo': mongo, 'firebase': await asyncio.to_thread(backend.check_firebase)}
+    ready = all(check['ok'] for check in checks.values())
+    return JSONResponse({'ready': ready, 'checks': checks}, status_code=200 if ready else 503)
+
+
+def error(message, status_code):
+    return JSONResponse({'error': message}, status_code=status_code)
+
+
+async def read_json(request):
+    try:
+        data = await request.json()
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+def if_none_match(request, etag):
+    """Weak comparison of If-None-Match against an unquoted etag, as werkzeug does for app.py."""
+    header = request.headers.get('if-none-match')
+    if not header:
+        return False
+    tags = [tag.strip().removeprefix('W/').strip('"') for tag in header.split(',')]
+    return '*' in tags or etag in tags
+
+
+async def find_user(projection=None, **query):
+    son = await users.find_one(query, projection)
+    return User._from_son(son) if son else None
+
+
+async def get_user(user_id):
+    """Async counterpart of app.get_user, sharing its cache."""
+    user = user_cache.get(user_id)
+    if user is None:
+        try:
+            object_id = bson.ObjectId(user_id)
+        except (bson.errors.InvalidId, TypeError):
+            return None
+        user = await find_user(USER_READ_FIELDS, _id=object_id)
+        if user is not None:
+            user_cache.put(user_id, user)
+    return user
+
+
+async def authenticate(request):
+    """
+    Returns (user, None) or (None, error response), mirroring app.jwt_required.
+    The session id of the token is left in request.state.session_id.
+    """
+    auth_header = request.headers.get('Authorization')
+    if not auth_header or not auth_header.startswith('Bearer '):
+        return None, error('Authentication token is required', 401)
+    token = auth_header.split(' ')[1]
+    try:
+        payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+    except jwt.ExpiredSignatureError:
+        return None, error('Token has expired', 401)
+    except jwt.InvalidTokenError:
+        return None, error('Authentication failed', 401)
+    if payload.get('type') != 'access':
+        return None, error('Invalid token type', 401)
+    if token_store.is_revoked(payload.get('sid')):
+        return None, error('Session has been revoked', 401)
+    request.state.session_id = payload.get('sid')
+    if JWT_STATELESS_AUTH and 'account_type' in payload:
+        return TokenPrincipal(payload), None
+    user = await get_user(payload.get('user_id'))
+    if user is None:
+        return None, error('Authentication failed', 401)
+    return user, None
+
+
+# --- API Routes ---
+@app.post('/signup')
+async def signup_view(request: Request):
+    data = await read_json(request)
+    if not data:
+        return error('Invalid JSON', 400)
+    name = data.get('name')
+    email = data.get('email')
+    password = data.get('password')
+    account_type = data.get('account_type')
+    if not all([name, email, password, account_type]):
+        return error('All fields are required', 400)
+    if not all(isinstance(value, str) for value in (name, email, password)):
+        return error('name, email and password must be strings', 400)
+    if account_type not in SIGNUP_ACCOUNT_TYPES:
+        return error(f'account_type must be one of {", ".join(SIGNUP_ACCOUNT_TYPES)}', 400)
+    user = User(name=name, email=email, account_type=account_type)
+    await asyncio.to_thread(user.set_password, password)
+    user.validate()
+    try:
+        result = await users.insert_one(user.to_mongo().to_dict())
+    except DuplicateKeyError:
+        return error('User with this email already exists', 400)
+    user.id = result.inserted_id
+    access_token, refresh_token = await asyncio.to_thread(generate_tokens, str(user.id), user_claims(user))
+    return JSONResponse({
+        'user': user.to_json(),
+        'access_token': access_token,
+        'refresh_token': refresh_token
+    }, status_code=201)
+
+
+@app.post('/login')
+async def login_view(request: Request):
+    data = await read_json(request)
+    if not data:
+        return error('Invalid JSON', 400)
+    email = data.get('email')
+    password = data.get('password')
+    if not all([email, password]):
+        return error('Email and password are required', 400)
+    if not isinstance(email, str):
+        # No stored email matches a non-string, as before emails were normalized
+        return error('Invalid credentials', 401)
+    user = await find_user(LOGIN_FIELDS, email=normalize_email(email))
+    if user and await asyncio.to_thread(user.check_password, password):
+        if user.password_needs_rehash():
+            await asyncio.to_thread(user.set_password, password)
+            await users.update_one({'_id': user.id}, {'$set': {'password': user.password}})
+            user_cache.invalidate(str(user.id))
+        access_token, refresh_token = await asyncio.to_thread(generate_tokens, str(user.id), user_claims(user))
+        return JSONResponse({
+            'user': user.to_json(),
+            'access_token': access_token,
+            'refresh_token': refresh_token
+        })
+    return error('Invalid credentials', 401)
+
+
+@app.post('/call-volunteer')
+async def call_volunteer_view(request: Request):
+    if await asyncio.to_thread(backend.firebase.get) is None:
+        return error('Firebase is not configured on the server.', 500)
+
+    data = await read_json(request) or {}
+    meeting_id = data.get('meetingId')
+    if not meeting_id:
+        return error('meetingId is required', 400)
+    if not backend.valid_meeting_id(meeting_id):
+        return error('meetingId must be at most 128 letters, digits or ._:-', 400)
+
+    notification = backend.messaging.Notification(
+        title='Incoming Call for Assistance!',
+        body='Someone needs your help. Tap to join the call.',
+    )
+    message_data = {
+        'meetingId': meeting_id,
+        'click_action': 'FLUTTER_NOTIFICATION_CLICK',
+    }
+
+    try:
+        if DISPATCH_MODE == 'waves':
+            try:
+                notified = await asyncio.to_thread(
+                    backend.dispatch_scheduler.dispatch, meeting_id, notification, message_data)
+            except backend.CallExistsError:
+                return error('A call with this meetingId was already placed.', 409)
+            if not notified:
+                return error('No volunteers are available right now. Please try again later.', 404)
+            return JSONResponse({'message': f'Notifying volunteers, first {notified} notified.'}, status_code=202)
+
+        volunteers = await asyncio.to_thread(backend.available_volunteer_tokens)
+        fcm_tokens = list(volunteers.values())
+        if not fcm_tokens:
+            return error('No volunteers are available right now. Please try again later.', 404)
+
+        future = backend.fcm_fanout.submit(fcm_tokens, notification, message_data)
+        future.add_done_callback(backend._log_fanout_result)
+        backend.fcm_token_pruner.track(
+            future, {token: vid for vid, token in volunteers.items()}, notification, message_data)
+
+        if not data.get('wait', True):
+            return JSONResponse({'message': f'Notifying {len(fcm_tokens)} volunteers.'}, status_code=202)
+
+        result = await asyncio.wrap_future(future)
+        return JSONResponse({'message': f'Successfully notified {result.success_count} volunteers.'})
+
+    except Exception as e:
+        logger.exception(f"An error occurred inside call_volunteer_view: {type(e).__name__}: {e}")
+        return error(f'An internal server error occurred while contacting volunteers.: {type(e).__name__}: {e}', 500)
+
+
+@app.post('/call-volunteer/accept')
+async def accept_call_view(request: Request):
+    user, response = await authenticate(request)
+    if response:
+        return response
+    if await asyncio.to_thread(backend.firebase.get) is None:
+        return error('Firebase is not configured on the server.', 500)
+    if user.account_type != 'volunteer':
+        return error('Only volunteers can accept calls', 403)
+
+    data = await read_json(request) or {}
+    meeting_id = data.get('meetingId')
+    volunteer_id = str(user.id)
+    if not meeting_id:
+        return error('meetingId is required', 400)
+    if not backend.valid_meeting_id(meeting_id):
+        return error('meetingId must be at most 128 letters, digits or ._:-', 400)
+    if data.get('volunteerId') not in (None, volunteer_id):
+        return error('volunteerId does not match the signed-in user', 403)
+
+    try:
+        if not await asyncio.to_thread(backend.dispatch_scheduler.accept, meeting_id, volunteer_id):
+            return error('This call is no longer available.', 409)
+        return JSONResponse({'message': 'Call accepted.', 'meetingId': meeting_id})
+    except Exception as e:
+        logger.exception(f"An error occurred inside accept_call_view: {type(e).__name__}: {e}")
+        return error(f'An internal server error occurred while accepting the call.: {type(e).__name__}: {e}', 500)
+
+
+@app.get('/call-volunteer/{meeting_id}')
+async def call_status_view(meeting_id: str):
+    if await asyncio.to_thread(backend.firebase.get) is None:
+        return error('Firebase is not configured on the server.', 500)
+    state = await asyncio.to_thread(backend.dispatch_scheduler.state, meeting_id)
+    if state is None:
+        return error('Call not found', 404)
+    return JSONResponse({'meetingId': meeting_id, 'state': state})
+
+
+@app.post('/token/refresh')
+async def token_refresh_view(request: Request):
+    data = await read_json(request) or {}
+    refresh_token = data.get('refresh_token')
+    if not refresh_token:
+        return error('Refresh token is required', 400)
+    try:
+        payload = jwt.decode(refresh_token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+    except jwt.ExpiredSignatureError:
+        return error('Token expired', 401)
+    except jwt.InvalidTokenError:
+        return error('Invalid token', 401)
+    if payload.get('type') != 'refresh':
+        return error('Invalid token type', 400)
+    user_id = payload.get('user_id')
+    claims = None
+    if JWT_STATELESS_AUTH:
+        user = await get_user(user_id)
+        if user is None:
+            return error('Invalid token', 401)
+        claims = user_claims(user)
+    family = payload.get('sid')
+    try:
+        new_jti = await asyncio.to_thread(token_store.rotate, family, payload.get('jti'))
+    except RefreshTokenError as e:
+        if e.reason == 'reused':
+            return error('Refresh token was already used. Please log in again.', 401)
+        return error('Invalid token', 401)
+    access_token, new_refresh_token = generate_tokens(user_id, claims, (family, new_jti))
+    return JSONResponse({
+        'access_token': access_token,
+        'refresh_token': new_refresh_token
+    })
+
+
+@app.post('/logout')
+async def logout_view(request: Request):
+    user, response = await authenticate(request)
+    if response:
+        return response
+    if request.state.session_id:
+        await asyncio.to_thread(token_store.revoke, request.state.session_id)
+    return JSONResponse({'message': 'Successfully logged out'})
+
+
+@app.post('/admin/users/import')
+async def import_users_view(request: Request):
+    user, response = await authenticate(request)
+    if response:
+        return response
+    if user.account_type != 'admin':
+        return error('Admin access required', 403)
+    fmt = request.query_params.get('format') or detect_format(request.headers.get('content-type'))
+    if fmt not in ('csv', 'ndjson'):
+        return error('Send text/csv or application/x-ndjson, or pass ?format=csv|ndjson', 400)
+    # Buffered (on disk past USER_IMPORT_SPOOL_BYTES), then imported on a background thread
+    body = user_import_jobs.spool()
+    async for chunk in request.stream():
+        body.write(chunk)
+    job = await asyncio.to_thread(user_import_jobs.start, body, fmt, str(user.id))
+    status_url = f'/admin/users/import/{job.job_id}'
+    return JSONResponse(dict(job.to_json(), status_url=status_url), status_code=202, headers={'Location': status_url})
+
+
+@app.get('/admin/users/import/{job_id}')
+async def import_status_view(job_id: str, request: Request):
+    user, response = await authenticate(request)
+    if response:
+        return response
+    if user.account_type != 'admin':
+        return error('Admin access required', 403)
+    job = await asyncio.to_thread(user_import_jobs.get, job_id)
+    if job is None:
+        return error('Import not found', 404)
+    return JSONResponse(job.to_json())
+
+
+@app.get('/profile')
+async def profile_view(request: Request):
+    user, response = await authenticate(request)
+    if response:
+        return response
+    if isinstance(user, TokenPrincipal):
+        # The email is not in the token; served from the user cache
+        user = await get_user(user.id)
+        if user is None:
+            return error('Authentication failed', 401)
+    body, etag = profile_payload(user)
+    headers = {'ETag': f'"{etag}"', 'Cache-Control': 'private, no-cache'}
+    if if_none_match(request, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type='application/json', headers=headers)
+
+
+# --- Route parity with app.py ---
+def missing_routes():
+    """(method, path) pairs app.py serves and this app does not, in FastAPI path syntax."""
+    flask_routes = set()
+    for rule in backend.app.url_map.iter_rules():
+        if rule.endpoint == 'static':
+            continue
+        # <name> and <converter:name> become {name}
+        path = re.sub(r'<(?:[^:<>]+:)?([^<>]+)>', r'{\1}', rule.rule)
+        flask_routes.update((method, path) for method in rule.methods - {'HEAD', 'OPTIONS'})
+    asgi_routes = {(method, route.path) for route in app.routes for method in getattr(route, 'methods', None) or ()}
+    return sorted(flask_routes - asgi_routes)
+
+
+if __name__ == '__main__':
+    # python asgi_app.py: exits 1 listing the routes of app.py this app lacks
+    gaps = missing_routes()
+    for method, path in gaps:
+        print(f'missing: {method} {path}')
+    sys.exit(1 if gaps else 0)
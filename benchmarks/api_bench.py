@@ -0,0 +1,316 @@
+"""
+Latency and throughput benchmark for the auth and dispatch endpoints of app.py.
+
+Drives /signup, /login, /token/refresh, /profile and /call-volunteer through
+the Flask test client from `--concurrency` threads and reports p50/p95/p99
+latency and requests per second for each. FCM is always stubbed (no pushes
+are sent; `--fcm-latency` simulates the round trip). Storage:
+
+    --mongomock                 in-memory MongoDB (default: MONGODB_URI)
+    --firestore memory          in-memory Firestore (benchmarks/fake_firestore.py)
+    --firestore emulator        FIRESTORE_EMULATOR_HOST, e.g. localhost:8080
+
+    python benchmarks/api_bench.py --mongomock --requests 200 --concurrency 8 --output bench.json
+    python benchmarks/api_bench.py --mongomock --output new.json --baseline bench.json
+
+With --baseline, exits with status 1 if any endpoint's p95 latency or
+throughput got worse than --max-regression (default 25%) against that file.
+App settings (JWT_STATELESS_AUTH, PASSWORD_HASH_WORKERS, ...) come from the
+environment as usual and are recorded in the output.
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+SCENARIOS = ('signup', 'login', 'refresh', 'profile', 'call-volunteer')
+# Settings worth recording next to the numbers
+RECORDED_SETTINGS = (
+    'JWT_STATELESS_AUTH', 'USER_CACHE_SIZE', 'USER_CACHE_TTL', 'PASSWORD_HASH_METHOD', 'PASSWORD_HASH_WORKERS',
+    'VOLUNTEER_REGISTRY_ENABLED', 'FCM_FANOUT_WORKERS', 'DISPATCH_MODE', 'DISPATCH_WAVES',
+)
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, check=True,
+                              capture_output=True, text=True).stdout.strip()
+    except Exception:
+        return None
+
+
+# --- Backends ---
+def use_mongomock():
+    import mongoengine
+    import mongomock
+    _connect = mongoengine.connect
+    mongoengine.connect = lambda host=None, **kw: _connect(
+        'bench', host='mongodb://localhost', mongo_client_class=mongomock.MongoClient)
+    os.environ.setdefault('MONGODB_URI', 'mongodb://localhost/bench')
+
+
+def use_firestore(mode):
+    """Points firebase_admin at the fake or the emulator; must run before app is imported."""
+    import firebase_admin
+    from firebase_admin import credentials, firestore
+    from google.auth.credentials import AnonymousCredentials
+
+    class BenchCredential(credentials.Base):
+        def get_credential(self):
+            return AnonymousCredentials()
+
+    if mode == 'memory':
+        from fake_firestore import FakeFirestore
+        db = FakeFirestore()
+        firestore.client = lambda app=None, database_id=None: db
+    elif not os.environ.get('FIRESTORE_EMULATOR_HOST'):
+        sys.exit('--firestore emulator needs FIRESTORE_EMULATOR_HOST (e.g. localhost:8080)')
+    # app.py only initializes Firebase when it finds real credentials
+    if not firebase_admin._apps:
+        firebase_admin.initialize_app(BenchCredential(), {'projectId': 'seeforme-bench'})
+
+
+def stub_fcm(fanout, latency):
+    """Replaces the FCM transport: every token succeeds after `latency` seconds per batch."""
+    from firebase_admin import messaging
+
+    def send(message):
+        if latency:
+            time.sleep(latency)
+        return messaging.BatchResponse([
+            messaging.SendResponse({'name': f'projects/bench/messages/{i}'}, None)
+            for i in range(len(message.tokens))
+        ])
+
+    fanout._send = send
+
+
+def seed_volunteers(db, backend, count, run_id):
+    """Volunteer accounts plus their volunteers/{user id} documents; returns {user id: access token}."""
+    backend.mongo.get()
+    users = [backend.User(name=f'Bench Volunteer {i}', email=f'bench-{run_id}-volunteer-{i}@example.com',
+                          password='-', account_type='volunteer') for i in range(count)]
+    ids = backend.User._get_collection().insert_many([user.to_mongo().to_dict() for user in users]).inserted_ids
+    volunteers = db.collection('volunteers')
+    tokens = {}
+    for start in range(0, count, 500):
+        batch = db.batch()
+        for i in range(start, min(count, start + 500)):
+            user_id = str(ids[i])
+            users[i].id = ids[i]
+            tokens[user_id] = backend.generate_tokens(user_id, backend.user_claims(users[i]))[0]
+            batch.set(volunteers.document(user_id), {'isAvailable': True, 'fcmToken': f'bench-token-{i}'})
+        batch.commit()
+    return tokens
+
+
+# --- Scenarios ---
+class Bench:
+    def __init__(self, backend, args):
+        from firebase_admin import firestore
+        self.backend = backend
+        self.args = args
+        self.db = firestore.client()
+        self.run_id = f'{os.getpid()}-{int(time.time())}'
+        self._counter = itertools.count()
+        self._local = threading.local()
+        self.users = []
+        self.volunteer_tokens = {}
+
+    @property
+    def client(self):
+        # Test clients keep a cookie jar, so give each thread its own
+        if not hasattr(self._local, 'client'):
+            self._local.client = self.backend.app.test_client()
+        return self._local.client
+
+    def credentials(self, i):
+        return {'email': f'bench-{self.run_id}-{i}@example.com', 'password': 'correct horse battery staple'}
+
+    def signup(self, i):
+        credentials = self.credentials(next(self._counter))
+        response = self.client.post('/signup', json=dict(credentials, name='Bench User', account_type='blind'))
+        if response.status_code == 201:
+            self.users.append(dict(response.get_json(), credentials=credentials, lock=threading.Lock()))
+        return response.status_code == 201
+
+    def login(self, i):
+        return self.client.post('/login', json=self.users[i % len(self.users)]['credentials']).status_code == 200
+
+    def refresh(self, i):
+        # Refresh tokens are single-use: presenting one twice revokes the session
+        user = self.users[i % len(self.users)]
+        with user['lock']:
+            response = self.client.post('/token/refresh', json={'refresh_token': user['refresh_token']})
+            if response.status_code != 200:
+                return False
+            user['refresh_token'] = response.get_json()['refresh_token']
+        return True
+
+    def profile(self, i):
+        token = self.users[i % len(self.users)]['access_token']
+        return self.client.get('/profile', headers={'Authorization': f'Bearer {token}'}).status_code == 200
+
+    def call_volunteer(self, i):
+        meeting_id = f'bench-{self.run_id}-{i}'
+        response = self.client.post('/call-volunteer', json={'meetingId': meeting_id, 'wait': self.args.wait})
+        if response.status_code not in (200, 202):
+            return False
+        if self.backend.DISPATCH_MODE == 'waves':
+            # Free the volunteers again so later calls still find someone to ring
+            notified = self.db.collection('calls').document(meeting_id).get().to_dict()['notified']
+            response = self.client.post('/call-volunteer/accept', json={'meetingId': meeting_id},
+                                        headers={'Authorization': f'Bearer {self.volunteer_tokens[notified[0]]}'})
+            self.db.collection('volunteers').document(notified[0]).update({'isAvailable': True})
+            return response.status_code == 200
+        return True
+
+    def run(self, operation, requests):
+        latencies = []
+        errors = 0
+        lock = threading.Lock()
+
+        def timed_call(i):
+            nonlocal errors
+            start = time.perf_counter()
+            try:
+                ok = operation(i)
+            except Exception:
+                ok = False
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+                errors += not ok
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.args.concurrency) as pool:
+            list(pool.map(timed_call, range(requests)))
+        wall = time.perf_counter() - start
+        return {
+            'requests': requests,
+            'errors': errors,
+            'concurrency': self.args.concurrency,
+            'throughput_rps': round(requests / wall, 2),
+            'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+            'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+            'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+            'max_ms': round(max(latencies) * 1000, 3) if latencies else 0.0,
+        }
+
+
+def compare(results, baseline, max_regression):
+    """Returns a description of every endpoint that regressed past max_regression."""
+    regressions = []
+    for name, result in results.items():
+        before = baseline.get('results', {}).get(name)
+        if not before:
+            continue
+        if before['p95_ms'] and result['p95_ms'] > before['p95_ms'] * (1 + max_regression):
+            regressions.append(f"{name}: p95 {before['p95_ms']:.1f}ms -> {result['p95_ms']:.1f}ms")
+        if result['throughput_rps'] < before['throughput_rps'] * (1 - max_regression):
+            regressions.append(f"{name}: {before['throughput_rps']:.1f} -> {result['throughput_rps']:.1f} req/s")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=200, help='requests per endpoint')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS),
+                        help=f'comma-separated subset of {",".join(SCENARIOS)}')
+    parser.add_argument('--mongomock', action='store_true')
+    parser.add_argument('--firestore', choices=('memory', 'emulator'), default='memory')
+    parser.add_argument('--volunteers', type=int, default=200, help='available volunteers to seed')
+    parser.add_argument('--fcm-latency', type=float, default=0.05, help='stubbed FCM round trip per batch, seconds')
+    parser.add_argument('--no-wait', dest='wait', action='store_false',
+                        help='call /call-volunteer with "wait": false (202 without waiting for FCM)')
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    parser.add_argument('--baseline', help='JSON results of an earlier run to compare against')
+    parser.add_argument('--max-regression', type=float, default=0.25)
+    args = parser.parse_args()
+
+    scenarios = [name.strip() for name in args.scenarios.split(',') if name.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f'unknown scenarios: {", ".join(sorted(unknown))}')
+
+    os.environ.setdefault('JWT_SECRET', 'benchmark-secret-benchmark-secret-0123')
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    if args.mongomock:
+        use_mongomock()
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    use_firestore(args.firestore)
+    import app as backend
+
+    stub_fcm(backend.fcm_fanout, args.fcm_latency)
+    bench = Bench(backend, args)
+    if 'call-volunteer' in scenarios:
+        bench.volunteer_tokens = seed_volunteers(bench.db, backend, args.volunteers, bench.run_id)
+
+    # Login, refresh and profile need accounts; signup creates them (timed only if selected)
+    operations = {
+        'signup': bench.signup,
+        'login': bench.login,
+        'refresh': bench.refresh,
+        'profile': bench.profile,
+        'call-volunteer': bench.call_volunteer,
+    }
+    results = {}
+    if 'signup' in scenarios:
+        results['signup'] = bench.run(bench.signup, args.requests)
+    elif set(scenarios) & {'login', 'refresh', 'profile'}:
+        bench.run(bench.signup, min(args.requests, 50))
+    for name in scenarios:
+        if name != 'signup':
+            results[name] = bench.run(operations[name], args.requests)
+
+    report = {
+        'commit': git_commit(),
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'cpus': os.cpu_count(),
+        'backends': {'mongo': 'mongomock' if args.mongomock else 'mongod', 'firestore': args.firestore,
+                     'fcm': f'stub ({args.fcm_latency * 1000:g}ms)'},
+        'settings': {name: getattr(backend, name) for name in RECORDED_SETTINGS},
+        'results': results,
+    }
+
+    print(f"{'endpoint':<16} {'req/s':>8} {'p50':>9} {'p95':>9} {'p99':>9} {'errors':>7}")
+    for name, result in results.items():
+        print(f"{name:<16} {result['throughput_rps']:>8.1f} {result['p50_ms']:>7.1f}ms "
+              f"{result['p95_ms']:>7.1f}ms {result['p99_ms']:>7.1f}ms {result['errors']:>7}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, default=str)
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.max_regression)
+        for regression in regressions:
+            print(f'REGRESSION {regression}')
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions against {baseline.get('commit') or args.baseline}.")
+
+
+if __name__ == '__main__':
+    main()
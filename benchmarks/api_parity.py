@@ -0,0 +1,166 @@
+"""
+Behaviour parity check of the Flask (app.py) and ASGI (asgi_app.py) serving modes.
+
+Runs the same requests through both apps' test clients (signup, duplicate
+signup, login, refresh and refresh-token reuse, logout, /profile with its 304,
+call-volunteer and call accept/status) and compares status codes, error and
+message texts, and the shape of every JSON body. Exits with status 1 listing
+every step where the two apps answer differently.
+
+    python benchmarks/api_parity.py --mongomock
+    MONGODB_URI=mongodb://localhost/parity JWT_SECRET=... python benchmarks/api_parity.py
+
+With --mongomock the async app's user collection is served by mongomock
+through a thin async wrapper, so no mongod is needed. Firestore is always the
+in-memory fake and FCM is stubbed, as in api_bench.py.
+"""
+import argparse
+import os
+import sys
+import uuid
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+sys.path.insert(0, HERE)
+
+from api_bench import seed_volunteers, stub_fcm, use_firestore, use_mongomock
+
+# Response fields whose values differ between runs and apps
+VARYING_FIELDS = {'access_token', 'refresh_token', 'id'}
+
+
+class AsyncCollection:
+    """Just enough of an AsyncCollection over a mongomock collection for asgi_app.py."""
+
+    def __init__(self, collection):
+        self._collection = collection
+
+    async def find_one(self, query, projection=None):
+        return self._collection.find_one(query, list(projection) if projection else None)
+
+    async def insert_one(self, document):
+        return self._collection.insert_one(document)
+
+    async def update_one(self, query, update):
+        return self._collection.update_one(query, update)
+
+
+class Client:
+    """Uniform (status, JSON body, headers) calls over Flask's and Starlette's test clients."""
+
+    def __init__(self, name, client):
+        self.name = name
+        self._client = client
+
+    def call(self, method, path, body=None, token=None, headers=None):
+        headers = dict(headers or {})
+        if token:
+            headers['Authorization'] = f'Bearer {token}'
+        if self.name == 'asgi':
+            response = self._client.request(method, path, json=body, headers=headers)
+            data = response.json() if response.content else None
+        else:
+            response = self._client.open(path, method=method, json=body, headers=headers)
+            data = response.get_json(silent=True)
+        return response.status_code, data, response.headers
+
+
+def shape(value):
+    """The comparable part of a JSON body: texts and structure, without per-run values."""
+    if isinstance(value, dict):
+        return {key: '<varies>' if key in VARYING_FIELDS else shape(item) for key, item in sorted(value.items())}
+    if isinstance(value, list):
+        return [shape(item) for item in value]
+    return value
+
+
+def scenario(client, run_id, volunteer_token):
+    """Yields (step, status, comparable body) for one app."""
+    email = f'parity-{run_id}-{client.name}@example.com'
+    signup = {'name': 'Parity', 'email': email, 'password': 'parity-password', 'account_type': 'blind'}
+
+    status, body, _ = client.call('POST', '/signup', signup)
+    yield 'signup', status, shape(dict(body, user=dict(body['user'], email='<varies>')))
+    refresh_token = body['refresh_token']
+    yield 'duplicate signup', *client.call('POST', '/signup', dict(signup, email=email.upper()))[:2]
+    yield 'signup as admin', *client.call('POST', '/signup', dict(signup, email='x' + email, account_type='admin'))[:2]
+    yield 'signup without fields', *client.call('POST', '/signup', {'email': email})[:2]
+
+    yield 'login wrong password', *client.call('POST', '/login', {'email': email, 'password': 'nope'})[:2]
+    yield 'login non-string email', *client.call('POST', '/login', {'email': 123, 'password': 'x'})[:2]
+    status, body, _ = client.call('POST', '/login', {'email': email.upper(), 'password': 'parity-password'})
+    yield 'login', status, shape(dict(body, user=dict(body['user'], email='<varies>')))
+    access_token = body['access_token']
+
+    status, body, _ = client.call('POST', '/token/refresh', {'refresh_token': refresh_token})
+    yield 'refresh', status, shape(body)
+    yield 'refresh token reuse', *client.call('POST', '/token/refresh', {'refresh_token': refresh_token})[:2]
+    yield 'refresh after reuse', *client.call('POST', '/token/refresh', {'refresh_token': body['refresh_token']})[:2]
+    yield 'refresh with access token', *client.call('POST', '/token/refresh', {'refresh_token': access_token})[:2]
+
+    status, body, headers = client.call('GET', '/profile', token=access_token)
+    yield 'profile', status, shape(dict(body, user=dict(body['user'], email='<varies>')))
+    yield 'profile cache headers', status, {'etag': bool(headers.get('ETag')), 'cache': headers.get('Cache-Control')}
+    status, _, headers = client.call('GET', '/profile', token=access_token, headers={'If-None-Match': headers['ETag']})
+    yield 'profile revalidated', status, bool(headers.get('ETag'))
+    yield 'profile without token', *client.call('GET', '/profile')[:2]
+    yield 'profile with bad token', *client.call('GET', '/profile', token='not-a-token')[:2]
+
+    meeting_id = f'parity-{run_id}-{client.name}'
+    yield 'call-volunteer', *client.call('POST', '/call-volunteer', {'meetingId': meeting_id})[:2]
+    yield 'call-volunteer without meetingId', *client.call('POST', '/call-volunteer', {})[:2]
+    yield 'call-volunteer bad meetingId', *client.call('POST', '/call-volunteer', {'meetingId': 'a b'})[:2]
+    yield 'call status unknown', *client.call('GET', f'/call-volunteer/{meeting_id}-none')[:2]
+    yield 'accept without token', *client.call('POST', '/call-volunteer/accept', {'meetingId': meeting_id})[:2]
+    yield 'accept as blind user', *client.call('POST', '/call-volunteer/accept', {'meetingId': meeting_id},
+                                               token=access_token)[:2]
+    yield 'accept unknown call', *client.call('POST', '/call-volunteer/accept', {'meetingId': meeting_id + '-none'},
+                                              token=volunteer_token)[:2]
+    yield 'import as non-admin', *client.call('POST', '/admin/users/import', token=access_token)[:2]
+
+    yield 'logout', *client.call('POST', '/logout', token=access_token)[:2]
+    yield 'profile after logout', *client.call('GET', '/profile', token=access_token)[:2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mongomock', action='store_true')
+    args = parser.parse_args()
+
+    os.environ.setdefault('JWT_SECRET', 'parity-secret-parity-secret-0123456789')
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    if args.mongomock:
+        use_mongomock()
+    use_firestore('memory')
+    import app as backend
+    import asgi_app
+    from fastapi.testclient import TestClient
+    from firebase_admin import firestore
+
+    if args.mongomock:
+        backend.mongo.get()
+        asgi_app.users = AsyncCollection(backend.User._get_collection())
+    stub_fcm(backend.fcm_fanout, 0)
+    run_id = uuid.uuid4().hex[:8]
+    volunteer_token = next(iter(seed_volunteers(firestore.client(), backend, 50, run_id).values()))
+
+    with TestClient(asgi_app.app) as asgi_client:
+        results = {
+            'flask': list(scenario(Client('flask', backend.app.test_client()), run_id, volunteer_token)),
+            'asgi': list(scenario(Client('asgi', asgi_client), run_id, volunteer_token)),
+        }
+
+    differences = 0
+    for (step, *flask_result), (_, *asgi_result) in zip(results['flask'], results['asgi']):
+        same = flask_result == asgi_result
+        differences += not same
+        print(f"{'ok  ' if same else 'DIFF'} {step:<34} {flask_result[0]}")
+        if not same:
+            print(f'       flask: {flask_result}')
+            print(f'       asgi:  {asgi_result}')
+    print(f'{len(results["flask"])} steps, {differences} differences')
+    sys.exit(1 if differences else 0)
+
+
+if __name__ == '__main__':
+    main()
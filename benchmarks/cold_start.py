@@ -0,0 +1,124 @@
+"""
+Cold-start benchmark: how long a fresh worker process takes to import app.py
+and to answer its first request.
+
+Each run is a new interpreter that imports the app, then sends POST /login
+for an unknown user (one MongoDB query, 401) twice through the Flask test
+client. Reported: import time, first and second request latency, and process
+spawn to first response.
+
+    python benchmarks/cold_start.py --mongomock --runs 5
+    python benchmarks/cold_start.py --mongomock --service-account     # exercise the Firebase credential path
+    git worktree add /tmp/before HEAD~1 && python benchmarks/cold_start.py --mongomock --app-dir /tmp/before
+
+--service-account sets FIREBASE_SERVICE_ACCOUNT_BASE64 to a throwaway key so
+the Firebase initialization runs (nothing is sent to Google). --app-dir
+measures another checkout, e.g. to compare before and after a change.
+"""
+import argparse
+import base64
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def throwaway_service_account():
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    pem = key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                            serialization.NoEncryption()).decode()
+    account = {
+        'type': 'service_account',
+        'project_id': 'seeforme-bench',
+        'private_key_id': 'bench',
+        'private_key': pem,
+        'client_email': 'bench@seeforme-bench.iam.gserviceaccount.com',
+        'client_id': '0',
+        'token_uri': 'https://oauth2.googleapis.com/token',
+    }
+    return base64.b64encode(json.dumps(account).encode()).decode()
+
+
+def run_child(args):
+    if args.mongomock:
+        import mongoengine
+        import mongomock
+        _connect = mongoengine.connect
+        mongoengine.connect = lambda host=None, **kw: _connect(
+            'bench', host='mongodb://localhost', mongo_client_class=mongomock.MongoClient)
+    sys.path.insert(0, args.app_dir)
+    os.chdir(args.app_dir)
+
+    started = time.perf_counter()
+    import app as backend
+    imported = time.perf_counter()
+    client = backend.app.test_client()
+    credentials = {'email': 'nobody@example.com', 'password': 'wrong'}
+    assert client.post('/login', json=credentials).status_code == 401
+    first = time.perf_counter()
+    assert client.post('/login', json=credentials).status_code == 401
+    second = time.perf_counter()
+    return {
+        'import_s': imported - started,
+        'first_request_s': first - imported,
+        'second_request_s': second - first,
+        'responded_at': time.time(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--app-dir', default=ROOT, help='checkout whose app.py is measured')
+    parser.add_argument('--mongomock', action='store_true')
+    parser.add_argument('--service-account', action='store_true')
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    args.app_dir = os.path.abspath(args.app_dir)
+
+    if args.child:
+        print(json.dumps(run_child(args)))
+        return
+
+    env = dict(os.environ, LOG_LEVEL='WARNING')
+    env.setdefault('JWT_SECRET', 'benchmark-secret-benchmark-secret-0123')
+    if args.mongomock:
+        env.setdefault('MONGODB_URI', 'mongodb://localhost/bench')
+    if args.service_account:
+        env['FIREBASE_SERVICE_ACCOUNT_BASE64'] = throwaway_service_account()
+
+    command = [sys.executable, os.path.abspath(__file__), '--child', '--app-dir', args.app_dir]
+    if args.mongomock:
+        command.append('--mongomock')
+    runs = []
+    for _ in range(args.runs):
+        spawned = time.time()
+        output = subprocess.run(command, env=env, check=True, capture_output=True, text=True).stdout
+        # stdout also carries the app's JSON log lines
+        result = next(json.loads(line) for line in output.splitlines() if line.startswith('{"import_s"'))
+        result['spawn_to_first_response_s'] = result.pop('responded_at') - spawned - result['second_request_s']
+        runs.append(result)
+
+    summary = {key: statistics.median(run[key] for run in runs) for key in runs[0]}
+    print(f"{args.app_dir} ({args.runs} runs, median)")
+    print(f"  import app.py          {summary['import_s'] * 1000:8.1f} ms")
+    print(f"  first request          {summary['first_request_s'] * 1000:8.1f} ms")
+    print(f"  second request         {summary['second_request_s'] * 1000:8.1f} ms")
+    print(f"  spawn to first response{summary['spawn_to_first_response_s'] * 1000:8.1f} ms")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'app_dir': args.app_dir, 'service_account': args.service_account,
+                       'median': summary, 'runs': runs}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
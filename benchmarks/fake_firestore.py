@@ -0,0 +1,337 @@
+"""
+In-memory stand-in for the Firestore client, for benchmarks without the emulator.
+
+Covers what the backend uses: documents (get/create/set/update/delete), equality
+queries with stream() and on_snapshot(), get_all, write batches with
+last_update_time preconditions, and transactions driven by
+@firestore.transactional. Transforms (SERVER_TIMESTAMP, DELETE_FIELD,
+ArrayUnion, ArrayRemove, Increment) are applied on write. Transactions take
+one database-wide lock, so they are serializable but never contend like the
+real service; latency numbers measure the backend, not Firestore.
+
+    db = FakeFirestore()
+    firebase_admin.firestore.client = lambda app=None, database_id=None: db
+"""
+import copy
+import itertools
+import queue
+import threading
+from datetime import datetime, timezone
+
+from google.api_core import exceptions
+from google.cloud.firestore_v1 import transforms
+from google.cloud.firestore_v1.watch import ChangeType
+
+_OPERATORS = {
+    '==': lambda a, b: a == b,
+    '!=': lambda a, b: a != b,
+    '<': lambda a, b: a is not None and a < b,
+    '<=': lambda a, b: a is not None and a <= b,
+    '>': lambda a, b: a is not None and a > b,
+    '>=': lambda a, b: a is not None and a >= b,
+    'in': lambda a, b: a in b,
+    'array_contains': lambda a, b: isinstance(a, list) and b in a,
+}
+
+
+def _apply_fields(data, fields):
+    for key, value in fields.items():
+        if value is transforms.DELETE_FIELD:
+            data.pop(key, None)
+        elif value is transforms.SERVER_TIMESTAMP:
+            data[key] = datetime.now(timezone.utc)
+        elif isinstance(value, transforms.ArrayUnion):
+            current = list(data.get(key) or [])
+            data[key] = current + [v for v in value.values if v not in current]
+        elif isinstance(value, transforms.ArrayRemove):
+            data[key] = [v for v in data.get(key) or [] if v not in value.values]
+        elif isinstance(value, transforms.Increment):
+            data[key] = (data.get(key) or 0) + value.value
+        else:
+            data[key] = copy.deepcopy(value)
+    return data
+
+
+class FakeWriteOption:
+    def __init__(self, last_update_time=None, exists=None):
+        self.last_update_time = last_update_time
+        self.exists = exists
+
+
+class FakeSnapshot:
+    def __init__(self, reference, data, update_time, read_time):
+        self.reference = reference
+        self._data = data
+        self.update_time = update_time
+        self.read_time = read_time
+
+    @property
+    def id(self):
+        return self.reference.id
+
+    @property
+    def exists(self):
+        return self._data is not None
+
+    def to_dict(self):
+        return copy.deepcopy(self._data)
+
+    def get(self, field_path):
+        if self._data is None or field_path not in self._data:
+            raise KeyError(field_path)
+        return copy.deepcopy(self._data[field_path])
+
+
+class FakeDocumentReference:
+    def __init__(self, db, collection, document_id):
+        self._db = db
+        self.collection_name = collection
+        self.id = document_id
+
+    @property
+    def _key(self):
+        return (self.collection_name, self.id)
+
+    def get(self, transaction=None):
+        return self._db._snapshot(self)
+
+    def create(self, document_data):
+        self._db._commit([('create', self, document_data, None)])
+
+    def set(self, document_data, merge=False):
+        self._db._commit([('set', self, document_data, merge)])
+
+    def update(self, field_updates, option=None):
+        self._db._commit([('update', self, field_updates, option)])
+
+    def delete(self, option=None):
+        self._db._commit([('delete', self, None, option)])
+
+
+class FakeQuery:
+    def __init__(self, db, collection, filters=()):
+        self._db = db
+        self._collection = collection
+        self._filters = tuple(filters)
+
+    def where(self, field_path=None, op_string=None, value=None, filter=None):
+        if filter is not None:
+            field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        return FakeQuery(self._db, self._collection, self._filters + ((field_path, _OPERATORS[op_string], value),))
+
+    def _matches(self, data):
+        return data is not None and all(op(data.get(field), value) for field, op, value in self._filters)
+
+    def stream(self, transaction=None):
+        return iter(self.get())
+
+    def get(self, transaction=None):
+        return self._db._query(self)
+
+    def on_snapshot(self, callback):
+        return self._db._listen(self, callback)
+
+
+class FakeCollectionReference(FakeQuery):
+    def __init__(self, db, collection):
+        super().__init__(db, collection)
+        self.id = collection
+
+    def document(self, document_id=None):
+        if document_id is None:
+            document_id = f'doc{next(self._db._ids)}'
+        return FakeDocumentReference(self._db, self._collection, document_id)
+
+
+class FakeWriteBatch:
+    def __init__(self, db):
+        self._db = db
+        self._writes = []
+
+    def create(self, reference, document_data):
+        self._writes.append(('create', reference, document_data, None))
+
+    def set(self, reference, document_data, merge=False):
+        self._writes.append(('set', reference, document_data, merge))
+
+    def update(self, reference, field_updates, option=None):
+        self._writes.append(('update', reference, field_updates, option))
+
+    def delete(self, reference, option=None):
+        self._writes.append(('delete', reference, None, option))
+
+    def commit(self):
+        writes, self._writes = self._writes, []
+        self._db._commit(writes)
+        return []
+
+
+class FakeTransaction(FakeWriteBatch):
+    """Implements the private hooks @firestore.transactional calls."""
+    _read_only = False
+    _max_attempts = 5
+
+    def __init__(self, db):
+        super().__init__(db)
+        self._id = None
+        self._held = False
+
+    def _clean_up(self):
+        self._writes = []
+        self._id = None
+
+    def _begin(self, retry_id=None):
+        self._db._lock.acquire()
+        self._held = True
+        self._id = b'fake-transaction'
+
+    def _release(self):
+        if self._held:
+            self._held = False
+            self._db._lock.release()
+
+    def _commit(self):
+        try:
+            self.commit()
+        finally:
+            self._clean_up()
+            self._release()
+        return []
+
+    def _rollback(self):
+        self._clean_up()
+        self._release()
+
+
+class FakeWatch:
+    def __init__(self, db, query, callback):
+        self._db = db
+        self.query = query
+        self.callback = callback
+        self.is_active = True
+
+    def unsubscribe(self):
+        self.is_active = False
+        with self._db._lock:
+            if self in self._db._watches:
+                self._db._watches.remove(self)
+
+
+class FakeChange:
+    def __init__(self, change_type, document):
+        self.type = change_type
+        self.document = document
+
+
+class FakeFirestore:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._documents = {}  # (collection, id) -> (data, update_time)
+        self._clock = itertools.count(1)
+        self._ids = itertools.count(1)
+        self._watches = []
+        self._events = None
+
+    def collection(self, collection_id):
+        return FakeCollectionReference(self, collection_id)
+
+    def batch(self):
+        return FakeWriteBatch(self)
+
+    def transaction(self, **kwargs):
+        return FakeTransaction(self)
+
+    def write_option(self, **kwargs):
+        return FakeWriteOption(**kwargs)
+
+    def get_all(self, references, field_paths=None, transaction=None):
+        with self._lock:
+            return [self._snapshot(reference) for reference in references]
+
+    def _snapshot(self, reference):
+        with self._lock:
+            data, update_time = self._documents.get(reference._key, (None, None))
+            return FakeSnapshot(reference, copy.deepcopy(data), update_time, datetime.now(timezone.utc))
+
+    def _query(self, query):
+        with self._lock:
+            return [
+                FakeSnapshot(FakeDocumentReference(self, collection, document_id), copy.deepcopy(data),
+                             update_time, datetime.now(timezone.utc))
+                for (collection, document_id), (data, update_time) in self._documents.items()
+                if collection == query._collection and query._matches(data)
+            ]
+
+    def _commit(self, writes):
+        """Applies writes atomically: every precondition is checked before anything changes."""
+        with self._lock:
+            staged = {}
+            for kind, reference, payload, extra in writes:
+                key = reference._key
+                if key in staged:
+                    current = staged[key][0]
+                else:
+                    current, update_time = self._documents.get(key, (None, None))
+                    option = extra if kind != 'set' else None
+                    if option is not None and option.last_update_time is not None \
+                            and option.last_update_time != update_time:
+                        raise exceptions.FailedPrecondition(f'{reference.id} was modified')
+                if kind == 'create':
+                    if current is not None:
+                        raise exceptions.AlreadyExists(f'Document already exists: {reference.id}')
+                    staged[key] = (_apply_fields({}, payload), reference)
+                elif kind == 'set':
+                    base = copy.deepcopy(current) if extra and current is not None else {}
+                    staged[key] = (_apply_fields(base, payload), reference)
+                elif kind == 'update':
+                    if current is None:
+                        raise exceptions.NotFound(f'No document to update: {reference.id}')
+                    staged[key] = (_apply_fields(copy.deepcopy(current), payload), reference)
+                else:
+                    staged[key] = (None, reference)
+
+            changed = []
+            for key, (data, reference) in staged.items():
+                before = self._documents.get(key, (None, None))[0]
+                if data is None:
+                    self._documents.pop(key, None)
+                else:
+                    self._documents[key] = (data, next(self._clock))
+                changed.append((reference, before, data))
+            self._notify(changed)
+
+    # --- Snapshot listeners (delivered on a background thread, like the real client) ---
+    def _listen(self, query, callback):
+        watch = FakeWatch(self, query, callback)
+        with self._lock:
+            self._watches.append(watch)
+            docs = self._query(query)
+            self._deliver(watch, docs, [])
+        return watch
+
+    def _notify(self, changed):
+        for watch in self._watches:
+            changes = []
+            for reference, before, after in changed:
+                if reference.collection_name != watch.query._collection:
+                    continue
+                was_in, is_in = watch.query._matches(before), watch.query._matches(after)
+                if not (was_in or is_in):
+                    continue
+                change_type = ChangeType.MODIFIED if was_in and is_in else (
+                    ChangeType.ADDED if is_in else ChangeType.REMOVED)
+                changes.append(FakeChange(change_type, self._snapshot(reference)))
+            if changes:
+                self._deliver(watch, self._query(watch.query), changes)
+
+    def _deliver(self, watch, docs, changes):
+        if self._events is None:
+            self._events = queue.Queue()
+            threading.Thread(target=self._dispatch_events, name='fake-firestore-watch', daemon=True).start()
+        self._events.put((watch, docs, changes))
+
+    def _dispatch_events(self):
+        while True:
+            watch, docs, changes = self._events.get()
+            if watch.is_active:
+                watch.callback(docs, changes, datetime.now(timezone.utc))
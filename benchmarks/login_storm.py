@@ -0,0 +1,115 @@
+"""
+Login-storm benchmark for the password hashing backend.
+
+Fires concurrent /login requests while a probe thread keeps hitting /profile,
+once with hashing inline (PASSWORD_HASH_WORKERS=0) and once on the process pool,
+and prints login throughput plus the /profile latency seen during the storm.
+
+    python benchmarks/login_storm.py --logins 200 --concurrency 16 --workers 4
+
+Uses MONGODB_URI from the environment; pass --mongomock to run without a mongod.
+Each configuration runs in its own subprocess because app.py reads its settings at import.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def run_storm(args):
+    if args.mongomock:
+        import mongoengine
+        import mongomock
+        _connect = mongoengine.connect
+        mongoengine.connect = lambda host=None, **kw: _connect(
+            'bench', host='mongodb://localhost', mongo_client_class=mongomock.MongoClient)
+        os.environ.setdefault('MONGODB_URI', 'mongodb://localhost/bench')
+    os.environ.setdefault('JWT_SECRET', 'benchmark-secret-benchmark-secret-0123')
+    sys.path.insert(0, ROOT)
+    import app as backend
+
+    client = backend.app.test_client()
+    credentials = {'email': 'storm@example.com', 'password': 'correct horse battery'}
+    response = client.post('/signup', json=dict(credentials, name='Storm', account_type='blind'))
+    access_token = response.get_json()['access_token']
+    headers = {'Authorization': f'Bearer {access_token}'}
+
+    probe_latencies = []
+    stop = threading.Event()
+
+    def probe():
+        probe_client = backend.app.test_client()
+        while not stop.is_set():
+            start = time.perf_counter()
+            probe_client.get('/profile', headers=headers)
+            probe_latencies.append(time.perf_counter() - start)
+            time.sleep(0.005)
+
+    def login(_):
+        assert backend.app.test_client().post('/login', json=credentials).status_code == 200
+
+    probe_thread = threading.Thread(target=probe, daemon=True)
+    probe_thread.start()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(login, range(args.logins)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    probe_thread.join()
+
+    return {
+        'hash_workers': backend.PASSWORD_HASH_WORKERS,
+        'logins_per_second': args.logins / elapsed,
+        'profile_p50_ms': percentile(probe_latencies, 50) * 1000,
+        'profile_p99_ms': percentile(probe_latencies, 99) * 1000,
+        'profile_mean_ms': statistics.mean(probe_latencies) * 1000 if probe_latencies else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--logins', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 2,
+                        help='PASSWORD_HASH_WORKERS for the pooled run')
+    parser.add_argument('--mongomock', action='store_true')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_storm(args)))
+        return
+
+    results = []
+    for workers in (0, args.workers):
+        env = dict(os.environ, PASSWORD_HASH_WORKERS=str(workers))
+        command = [sys.executable, __file__, '--child', '--logins', str(args.logins),
+                   '--concurrency', str(args.concurrency)]
+        if args.mongomock:
+            command.append('--mongomock')
+        output = subprocess.run(command, env=env, check=True, capture_output=True, text=True).stdout
+        # stdout also carries the app's JSON log lines
+        results.append(next(json.loads(line) for line in output.splitlines() if line.startswith('{"hash_workers"')))
+
+    print(f"{'hash workers':>12} {'logins/s':>10} {'profile p50':>12} {'profile p99':>12}")
+    for result in results:
+        print(f"{result['hash_workers']:>12} {result['logins_per_second']:>10.1f} "
+              f"{result['profile_p50_ms']:>10.1f}ms {result['profile_p99_ms']:>10.1f}ms")
+
+
+if __name__ == '__main__':
+    main()
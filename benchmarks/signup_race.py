@@ -0,0 +1,142 @@
+"""
+Signup under contention: concurrent signups for one address, and MongoDB
+operations per signup.
+
+`--racers` threads sign up with the same email (in different letter cases)
+at the same moment; exactly one may get 201 and exactly one account may
+exist afterwards. Then `--signups` distinct users sign up one after another
+while MongoDB operations are counted.
+
+    python benchmarks/signup_race.py --mongomock
+    git worktree add /tmp/before HEAD~1 && python benchmarks/signup_race.py --mongomock --app-dir /tmp/before
+
+Against a real server (MONGODB_URI) operations are counted by a command
+listener; with --mongomock, by counting calls on its collections.
+"""
+import argparse
+import collections
+import os
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class OperationCounter:
+    def __init__(self):
+        self.counts = collections.Counter()
+        self._lock = threading.Lock()
+
+    def add(self, name):
+        with self._lock:
+            self.counts[name] += 1
+
+    def total(self):
+        return sum(self.counts.values())
+
+    def listen_to_pymongo(self):
+        from pymongo import monitoring
+
+        counter = self
+
+        class Listener(monitoring.CommandListener):
+            def started(self, event):
+                if event.command_name not in ('ping', 'hello', 'isMaster', 'endSessions'):
+                    counter.add(event.command_name)
+
+            def succeeded(self, event):
+                pass
+
+            def failed(self, event):
+                pass
+
+        monitoring.register(Listener())
+
+    def wrap_mongomock(self):
+        import mongomock
+
+        # find_one, count_documents... go through find
+        for name in ('find', 'insert_one', 'insert_many', 'update_one', 'update_many', 'delete_one',
+                     'find_one_and_update', 'create_index'):
+            original = getattr(mongomock.collection.Collection, name)
+
+            def counted(collection, *args, _name=name, _original=original, **kwargs):
+                self.add(_name)
+                return _original(collection, *args, **kwargs)
+
+            setattr(mongomock.collection.Collection, name, counted)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--racers', type=int, default=16)
+    parser.add_argument('--signups', type=int, default=50)
+    parser.add_argument('--app-dir', default=ROOT, help='checkout whose app.py is measured')
+    parser.add_argument('--mongomock', action='store_true')
+    args = parser.parse_args()
+
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    os.environ.setdefault('JWT_SECRET', 'benchmark-secret-benchmark-secret-0123')
+    # Hash cost is not what is measured here
+    os.environ.setdefault('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:1000')
+    os.environ.setdefault('PASSWORD_HASH_WORKERS', '0')
+    counter = OperationCounter()
+    if args.mongomock:
+        import mongoengine
+        import mongomock
+        _connect = mongoengine.connect
+        mongoengine.connect = lambda host=None, **kw: _connect(
+            'bench', host='mongodb://localhost', mongo_client_class=mongomock.MongoClient)
+        os.environ.setdefault('MONGODB_URI', 'mongodb://localhost/bench')
+        counter.wrap_mongomock()
+    else:
+        counter.listen_to_pymongo()
+    sys.path.insert(0, os.path.abspath(args.app_dir))
+    os.chdir(args.app_dir)
+    import app as backend
+
+    run_id = f'{os.getpid()}-{int(time.time())}'
+    # Warm up: connection, indexes, first-request setup
+    backend.app.test_client().post('/signup', json={
+        'name': 'Warm Up', 'email': f'warmup-{run_id}@example.com', 'password': 'x', 'account_type': 'blind'})
+
+    # --- Same email, all at once ---
+    email = f'race-{run_id}@example.com'
+    barrier = threading.Barrier(args.racers)
+    statuses = collections.Counter()
+
+    def race(i):
+        client = backend.app.test_client()
+        variant = email.upper() if i % 2 else email
+        barrier.wait()
+        response = client.post('/signup', json={
+            'name': f'Racer {i}', 'email': variant, 'password': 'x', 'account_type': 'blind'})
+        statuses[response.status_code] += 1
+
+    threads = [threading.Thread(target=race, args=(i,)) for i in range(args.racers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stored = backend.User.objects(email__iexact=email).count()
+
+    # --- Operations per signup ---
+    client = backend.app.test_client()
+    counter.counts.clear()
+    for i in range(args.signups):
+        client.post('/signup', json={
+            'name': 'Bench User', 'email': f'ops-{run_id}-{i}@example.com', 'password': 'x', 'account_type': 'blind'})
+    per_signup = {name: count / args.signups for name, count in sorted(counter.counts.items())}
+
+    print(f"{args.app_dir}")
+    print(f"  {args.racers} concurrent signups, one email: "
+          + ', '.join(f'{count}x {status}' for status, count in sorted(statuses.items())))
+    print(f"  accounts stored for that email: {stored}{'' if stored == 1 else '  <-- DUPLICATES'}")
+    print(f"  MongoDB operations per signup: {counter.total() / args.signups:.2f}  {per_signup}")
+    if stored != 1 or statuses[201] != 1:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+"""
+Side-by-side load benchmark of the Flask (app.py, gunicorn) and ASGI (asgi_app.py,
+uvicorn) serving modes.
+
+Starts each server on a local port against the same MONGODB_URI, signs up a user,
+then drives /profile, /token/refresh and /login at a fixed concurrency and prints
+throughput and latency percentiles per server and route.
+
+    MONGODB_URI=mongodb://localhost/bench JWT_SECRET=... \\
+        python benchmarks/sync_vs_async.py --requests 2000 --concurrency 64
+
+A real mongod is required: the async driver cannot run against mongomock.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SERVERS = {
+    'flask+gunicorn': lambda port, threads: [
+        sys.executable, '-m', 'gunicorn', '-w', '1', '--threads', str(threads),
+        '-b', f'127.0.0.1:{port}', 'app:app'],
+    'asgi+uvicorn': lambda port, threads: [
+        sys.executable, '-m', 'uvicorn', '--workers', '1', '--port', str(port), 'asgi_app:app'],
+}
+
+
+def call(base_url, method, path, body=None, token=None):
+    data = json.dumps(body).encode() if body is not None else None
+    req = urllib.request.Request(base_url + path, data=data, method=method)
+    req.add_header('Content-Type', 'application/json')
+    if token:
+        req.add_header('Authorization', f'Bearer {token}')
+    try:
+        with urllib.request.urlopen(req, timeout=30) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read() or b'{}')
+
+
+def wait_ready(base_url, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            call(base_url, 'GET', '/profile')
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f'{base_url} did not start')
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))] if values else 0.0
+
+
+def drive(base_url, requests, concurrency):
+    email = f'bench-{uuid.uuid4().hex}@example.com'
+    credentials = {'email': email, 'password': 'benchmark-password'}
+    status, body = call(base_url, 'POST', '/signup', dict(credentials, name='Bench', account_type='blind'))
+    assert status == 201, body
+    access_token, refresh_token = body['access_token'], body['refresh_token']
+
+    routes = {
+        '/profile': lambda: call(base_url, 'GET', '/profile', token=access_token),
+        '/token/refresh': lambda: call(base_url, 'POST', '/token/refresh', {'refresh_token': refresh_token}),
+        '/login': lambda: call(base_url, 'POST', '/login', credentials),
+    }
+    results = {}
+    for route, request in routes.items():
+        count = requests if route != '/login' else max(1, requests // 20)
+
+        def timed(_):
+            start = time.perf_counter()
+            status, _body = request()
+            return status, time.perf_counter() - start
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            samples = list(pool.map(timed, range(count)))
+        elapsed = time.perf_counter() - start
+        latencies = [latency for _status, latency in samples]
+        results[route] = {
+            'requests': count,
+            'errors': sum(1 for status, _latency in samples if status >= 400),
+            'rps': count / elapsed,
+            'p50_ms': percentile(latencies, 50) * 1000,
+            'p99_ms': percentile(latencies, 99) * 1000,
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--threads', type=int, default=8, help='gunicorn threads for the Flask server')
+    parser.add_argument('--port', type=int, default=18600)
+    args = parser.parse_args()
+
+    print(f"{'server':<16} {'route':<16} {'rps':>8} {'p50':>9} {'p99':>9} {'errors':>7}")
+    for offset, (name, command) in enumerate(SERVERS.items()):
+        port = args.port + offset
+        base_url = f'http://127.0.0.1:{port}'
+        server = subprocess.Popen(command(port, args.threads), cwd=ROOT,
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            wait_ready(base_url)
+            for route, result in drive(base_url, args.requests, args.concurrency).items():
+                print(f"{name:<16} {route:<16} {result['rps']:>8.1f} {result['p50_ms']:>7.1f}ms "
+                      f"{result['p99_ms']:>7.1f}ms {result['errors']:>7}")
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from firebase_admin import messaging
+
+from observability import record_fcm_batch
+
+# FCM accepts at most 500 tokens per multicast message
+FCM_MULTICAST_LIMIT = 500
+
+
+class FanoutResult:
+    """Per-token results of a fan-out, in the same order as the tokens that were sent."""
+
+    def __init__(self, tokens, responses):
+        self.tokens = tokens
+        self.responses = responses
+
+    @property
+    def success_count(self):
+        return sum(1 for resp in self.responses if resp.success)
+
+    @property
+    def failure_count(self):
+        return len(self.responses) - self.success_count
+
+    def failures(self):
+        """Returns [(token, SendResponse)] for every token that failed."""
+        return [(token, resp) for token, resp in zip(self.tokens, self.responses) if not resp.success]
+
+
+class FcmFanout:
+    """
+    Sends one notification to any number of tokens by splitting them into
+    500-token multicast batches and sending the batches on a bounded worker pool.
+    """
+
+    def __init__(self, max_workers=4, batch_size=FCM_MULTICAST_LIMIT, send=None):
+        self.batch_size = min(batch_size, FCM_MULTICAST_LIMIT)
+        self._send = send or messaging.send_each_for_multicast
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='fcm-fanout')
+
+    def _send_batch(self, batch, notification, data):
+        start = time.perf_counter()
+        try:
+            # Built in here too: MulticastMessage rejects a malformed token or data payload
+            message = messaging.MulticastMessage(notification=notification, data=data, tokens=batch)
+            responses = self._send(message).responses
+        except Exception as e:
+            # The whole batch failed (bad input, network, auth...); report it against every token
+            responses = [messaging.SendResponse(None, e) for _ in batch]
+        record_fcm_batch(time.perf_counter() - start, responses)
+        return responses
+
+    def submit(self, tokens, notification, data=None):
+        """
+        Starts the fan-out and returns a Future resolving to a FanoutResult.
+        Returns immediately; the batches are sent on the worker pool.
+        """
+        tokens = list(tokens)
+        batches = [tokens[i:i + self.batch_size] for i in range(0, len(tokens), self.batch_size)]
+        result = Future()
+        if not batches:
+            result.set_result(FanoutResult([], []))
+            return result
+
+        batch_responses = [None] * len(batches)
+        remaining = [len(batches)]
+        lock = threading.Lock()
+
+        def on_batch_done(index, future):
+            try:
+                batch_responses[index] = future.result()
+            except Exception as e:
+                # Never leave `result` pending: callers block on it
+                batch_responses[index] = [messaging.SendResponse(None, e) for _ in batches[index]]
+            with lock:
+                remaining[0] -= 1
+                finished = remaining[0] == 0
+            if finished:
+                responses = [resp for batch in batch_responses for resp in batch]
+                result.set_result(FanoutResult(tokens, responses))
+
+        for index, batch in enumerate(batches):
+            future = self._executor.submit(self._send_batch, batch, notification, data)
+            future.add_done_callback(lambda f, index=index: on_batch_done(index, f))
+        return result
+
+    def send(self, tokens, notification, data=None, timeout=None):
+        """Sends to all tokens and blocks until every batch has completed."""
+        return self.submit(tokens, notification, data).result(timeout=timeout)
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
@@ -0,0 +1,157 @@
+import logging
+import threading
+
+from firebase_admin import exceptions, firestore, messaging
+
+from observability import timed
+
+logger = logging.getLogger(__name__)
+
+# Failure classes for a single token
+UNREGISTERED = 'UNREGISTERED'
+INVALID_ARGUMENT = 'INVALID_ARGUMENT'
+TRANSIENT = 'TRANSIENT'
+OTHER = 'OTHER'
+
+# Firestore allows at most 500 writes per batch
+FIRESTORE_BATCH_LIMIT = 500
+
+_TRANSIENT_ERRORS = (
+    exceptions.UnavailableError,
+    exceptions.InternalError,
+    exceptions.DeadlineExceededError,
+    exceptions.ResourceExhaustedError,  # includes messaging.QuotaExceededError
+    exceptions.UnknownError,
+)
+
+
+def is_token_error(exception):
+    """
+    INVALID_ARGUMENT also means a bad message (payload over 4 KB, malformed
+    data...). Only FCM's "registration token is not valid" says the token is dead.
+    """
+    return 'registration token' in str(exception).lower()
+
+
+def classify_send_error(exception):
+    """Maps the exception of a failed SendResponse to one of the failure classes above."""
+    if isinstance(exception, (messaging.UnregisteredError, messaging.SenderIdMismatchError)):
+        return UNREGISTERED
+    if isinstance(exception, exceptions.InvalidArgumentError):
+        return INVALID_ARGUMENT
+    if isinstance(exception, _TRANSIENT_ERRORS) or not isinstance(exception, exceptions.FirebaseError):
+        # Non-Firebase errors are transport failures (connection reset, timeouts...)
+        return TRANSIENT
+    return OTHER
+
+
+class TokenPruner:
+    """
+    Watches fan-out results: removes tokens FCM reports as dead from their
+    `volunteers` documents and retries transiently failed tokens with backoff.
+    Retries are scheduled on timers, so no fan-out worker sleeps.
+    """
+
+    def __init__(self, fanout, db_factory, collection='volunteers', max_retries=3, base_delay=1.0):
+        self._fanout = fanout
+        self._db_factory = db_factory
+        self._collection = collection
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self._lock = threading.Lock()
+        self.stats = {'pruned': 0, 'retried': 0, 'gave_up': 0, 'other_failures': 0, 'rejected_messages': 0}
+
+    def _count(self, key, amount=1):
+        with self._lock:
+            self.stats[key] += amount
+
+    def track(self, future, volunteer_ids, notification, data=None, attempt=0):
+        """
+        Handles the FanoutResult of `future` once it completes.
+        `volunteer_ids` maps each sent token to the volunteer document it came from.
+        """
+        def on_done(done):
+            try:
+                self._handle_result(done.result(), volunteer_ids, notification, data, attempt)
+            except Exception as e:
+                logger.exception(f"TokenPruner: could not process fan-out result: {type(e).__name__}: {e}")
+        future.add_done_callback(on_done)
+
+    def _handle_result(self, result, volunteer_ids, notification, data, attempt):
+        failures = result.failures()
+        invalid = [response.exception for _, response in failures
+                   if classify_send_error(response.exception) == INVALID_ARGUMENT]
+        # Every token refused, not all for token reasons: the message is at fault, not the tokens
+        message_rejected = (len(result.tokens) > 1 and len(invalid) == len(result.tokens)
+                            and not all(is_token_error(exception) for exception in invalid))
+        if message_rejected:
+            self._count('rejected_messages')
+            logger.error("FCM rejected the message for every token; not pruning",
+                         extra={'tokens': len(invalid), 'error': str(invalid[0])})
+
+        dead = {}
+        transient = []
+        for token, response in failures:
+            failure = classify_send_error(response.exception)
+            if failure == UNREGISTERED or (
+                    failure == INVALID_ARGUMENT and not message_rejected and is_token_error(response.exception)):
+                volunteer_id = volunteer_ids.get(token)
+                if volunteer_id:
+                    dead[volunteer_id] = token
+            elif failure == INVALID_ARGUMENT:
+                self._count('other_failures')
+            elif failure == TRANSIENT:
+                transient.append(token)
+            else:
+                self._count('other_failures')
+
+        if dead:
+            self.prune(dead)
+
+        if transient:
+            if attempt >= self.max_retries:
+                self._count('gave_up', len(transient))
+                return
+            delay = self.base_delay * (2 ** attempt)
+            self._count('retried', len(transient))
+            timer = threading.Timer(delay, self._retry, args=(transient, volunteer_ids, notification, data, attempt + 1))
+            timer.daemon = True
+            timer.start()
+
+    def _retry(self, tokens, volunteer_ids, notification, data, attempt):
+        future = self._fanout.submit(tokens, notification, data)
+        self.track(future, volunteer_ids, notification, data, attempt)
+
+    def prune(self, dead):
+        """
+        Clears `fcmToken` on each volunteer in `dead` ({volunteer_id: token}), unless the
+        volunteer has registered a different token since the send.
+        """
+        db = self._db_factory()
+        refs = [db.collection(self._collection).document(volunteer_id) for volunteer_id in dead]
+        stale = []
+        with timed('firestore', 'volunteers.get_all'):
+            snapshots = list(db.get_all(refs))
+        for snapshot in snapshots:
+            if snapshot.exists and (snapshot.to_dict() or {}).get('fcmToken') == dead.get(snapshot.id):
+                stale.append(snapshot)
+
+        for i in range(0, len(stale), FIRESTORE_BATCH_LIMIT):
+            chunk = stale[i:i + FIRESTORE_BATCH_LIMIT]
+            batch = db.batch()
+            for snapshot in chunk:
+                batch.update(snapshot.reference, {'fcmToken': firestore.DELETE_FIELD},
+                             option=db.write_option(last_update_time=snapshot.update_time))
+            try:
+                with timed('firestore', 'volunteers.prune_batch'):
+                    batch.commit()
+                self._count('pruned', len(chunk))
+            except Exception:
+                # A document changed after we read it; the batch is atomic, so apply one by one
+                for snapshot in chunk:
+                    try:
+                        snapshot.reference.update({'fcmToken': firestore.DELETE_FIELD},
+                                                  option=db.write_option(last_update_time=snapshot.update_time))
+                        self._count('pruned')
+                    except Exception:
+                        pass  # Changed since the send (new token); leave it alone
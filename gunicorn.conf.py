@@ -0,0 +1,13 @@
+# Picked up automatically by `gunicorn app:app` from this directory.
+#
+# With --preload the app is imported once in the master and forked; importing
+# opens no connections, so nothing is shared between workers. Set
+# PRELOAD_CONNECTIONS=true to have each worker connect right after it starts
+# instead of on its first request.
+
+
+def post_worker_init(worker):
+    import app
+
+    if app.PRELOAD_CONNECTIONS:
+        app.warm_up()
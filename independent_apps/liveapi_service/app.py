@@ -1,105 +1,281 @@
 import asyncio
 import base64
+import collections
+import contextlib
 import json
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+import logging
+from fastapi import FastAPI, Response, WebSocket, WebSocketDisconnect
 from google import genai
 from google.genai import types
 import os
 
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+
+from frame_protocol import FrameError, KIND_AUDIO_STREAM_END, decode_frame
+from observability import (
+    LIVE_BYTES, LIVE_FRAMES, LIVE_SESSIONS, LIVE_SESSIONS_ENDED, LIVE_SESSIONS_REJECTED, setup_logging,
+)
+from realtime_forwarder import RealtimeForwarder
+from session_budget import REAP_REASONS, SessionBudget
+from session_pool import LiveSessionPool
+from tool_executor import ToolExecutor
+
 
 prompt_path = os.path.join(os.path.dirname(__file__), "prompt.txt")
 with open(prompt_path, "r", encoding="utf-8") as f:
     prompt_text = f.read().strip()
 
-app = FastAPI()
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    if session_pool is not None:
+        session_pool.start()
+    yield
+    if session_pool is not None:
+        await session_pool.stop()
+
+
+app = FastAPI(lifespan=lifespan)
+
+setup_logging(os.environ.get("LOG_LEVEL", "INFO"))
+logger = logging.getLogger(__name__)
 
 GOOGLE_API_KEY = "GEMINI_API_KEY"
 
 if not GOOGLE_API_KEY:
     raise RuntimeError("GOOGLE_API_KEY is not set")
 
-@app.websocket("/ws/live")
-async def websocket_endpoint(websocket: WebSocket):
-    await websocket.accept()
-    print("Client connected.")
-    await websocket.send_json({"type": "instantiating_connection"})
-
-    client = genai.Client(api_key=GOOGLE_API_KEY)
-    model = "gemini-2.0-flash-live-001" # "gemini-2.5-flash-preview-native-audio-dialog"
-
-    # Define function declarations for function calling
-    navigation_request = {
-        "name": "navigation_request",
-        "description": "Handle navigation requests from the user",
-        "parameters": {
-            "type": "object",
-            "properties": {
-                "destination": {
-                    "type": "string",
-                    "description": "The destination or location the user wants to navigate to"
-                },
-                "navigation_type": {
-                    "type": "string",
-                    "description": "Type of navigation (e.g., 'directions', 'location_info', 'route_planning')",
-                    "enum": ["directions", "location_info", "route_planning"]
-                }
+# Audio chunks buffered per session before the client is back-pressured
+LIVE_AUDIO_QUEUE_CHUNKS = int(os.environ.get("LIVE_AUDIO_QUEUE_CHUNKS", "64"))
+# Minimum time between two video frames sent to Gemini (newer frames replace pending ones)
+LIVE_MIN_VIDEO_INTERVAL = float(os.environ.get("LIVE_MIN_VIDEO_INTERVAL_MS", "500")) / 1000
+# Pre-connected live sessions kept ready (0 disables the pool) and their max idle age
+LIVE_SESSION_POOL_SIZE = int(os.environ.get("LIVE_SESSION_POOL_SIZE", "0"))
+LIVE_SESSION_POOL_MAX_AGE = float(os.environ.get("LIVE_SESSION_POOL_MAX_AGE_SECONDS", "300"))
+# Admission control: sessions one worker process serves before answering "busy"
+LIVE_MAX_SESSIONS = int(os.environ.get("LIVE_MAX_SESSIONS", "100"))
+LIVE_BUSY_RETRY_AFTER_MS = int(os.environ.get("LIVE_BUSY_RETRY_AFTER_MS", "2000"))
+# Tool calls: per-call timeout, threads for sync tools, and how long navigation results are reused
+LIVE_TOOL_TIMEOUT = float(os.environ.get("LIVE_TOOL_TIMEOUT_SECONDS", "10"))
+LIVE_TOOL_WORKERS = int(os.environ.get("LIVE_TOOL_WORKERS", "8"))
+LIVE_NAVIGATION_CACHE_TTL = float(os.environ.get("LIVE_NAVIGATION_CACHE_TTL_SECONDS", "60"))
+# Per-session budgets (0 = unlimited): length, client silence, bytes streamed both ways
+LIVE_MAX_SESSION_SECONDS = float(os.environ.get("LIVE_MAX_SESSION_SECONDS", "1800"))
+LIVE_IDLE_TIMEOUT = float(os.environ.get("LIVE_IDLE_TIMEOUT_SECONDS", "60"))
+LIVE_MAX_SESSION_BYTES = int(float(os.environ.get("LIVE_MAX_SESSION_MB", "512")) * 1024 * 1024)
+# Heartbeat events sent to the client; a send stuck for a whole interval ends the session
+LIVE_HEARTBEAT_INTERVAL = float(os.environ.get("LIVE_HEARTBEAT_INTERVAL_SECONDS", "15"))
+
+MODEL = "gemini-2.0-flash-live-001" # "gemini-2.5-flash-preview-native-audio-dialog"
+
+# Define function declarations for function calling
+NAVIGATION_REQUEST = {
+    "name": "navigation_request",
+    "description": "Handle navigation requests from the user",
+    "parameters": {
+        "type": "object",
+        "properties": {
+            "destination": {
+                "type": "string",
+                "description": "The destination or location the user wants to navigate to"
             },
-            "required": ["destination"]
-        }
+            "navigation_type": {
+                "type": "string",
+                "description": "Type of navigation (e.g., 'directions', 'location_info', 'route_planning')",
+                "enum": ["directions", "location_info", "route_planning"]
+            }
+        },
+        "required": ["destination"]
     }
+}
 
-    tools = [{"function_declarations": [navigation_request]}]
+TOOLS = [{"function_declarations": [NAVIGATION_REQUEST]}]
 
-    config = types.LiveConnectConfig(
-        response_modalities=[types.Modality.AUDIO],
-        realtime_input_config=types.RealtimeInputConfig(
-            automatic_activity_detection={
-                "prefix_padding_ms": 300,
-                "silence_duration_ms": 500,
-            }
-        ),
-        speech_config=types.SpeechConfig(
-            voice_config=types.VoiceConfig(
-                prebuilt_voice_config=types.PrebuiltVoiceConfig(
-                    voice_name="Zephyr"
-                )
-            ),
-            language_code="en-US"
-        ),
-        system_instruction=types.Content(
-            parts=[types.Part(text=prompt_text)]
-        ),
-        generation_config=types.GenerationConfig(
-            temperature=0.5,
-            top_k=64,
-            top_p=0.95,
+# Built once per process and shared by every session
+LIVE_CONFIG = types.LiveConnectConfig(
+    response_modalities=[types.Modality.AUDIO],
+    realtime_input_config=types.RealtimeInputConfig(
+        automatic_activity_detection={
+            "prefix_padding_ms": 300,
+            "silence_duration_ms": 500,
+        }
+    ),
+    speech_config=types.SpeechConfig(
+        voice_config=types.VoiceConfig(
+            prebuilt_voice_config=types.PrebuiltVoiceConfig(
+                voice_name="Zephyr"
+            )
         ),
-        tools=tools,
-    )
+        language_code="en-US"
+    ),
+    system_instruction=types.Content(
+        parts=[types.Part(text=prompt_text)]
+    ),
+    generation_config=types.GenerationConfig(
+        temperature=0.5,
+        top_k=64,
+        top_p=0.95,
+    ),
+    tools=TOOLS,
+)
+
+_client = None
+
+
+def get_client():
+    """Process-wide Gemini client (it is safe to share across sessions)."""
+    global _client
+    if _client is None:
+        _client = genai.Client(api_key=GOOGLE_API_KEY)
+    return _client
+
+
+def connect_live_session():
+    """Opens a Gemini live session; replace it (e.g. with benchmarks/fake_gemini.py) to run without Gemini."""
+    return get_client().aio.live.connect(model=MODEL, config=LIVE_CONFIG)
+
+
+# Looked up on every connect, so a replaced connect_live_session also feeds the pool
+session_pool = LiveSessionPool(lambda: connect_live_session(), size=LIVE_SESSION_POOL_SIZE,
+                               max_age=LIVE_SESSION_POOL_MAX_AGE) if LIVE_SESSION_POOL_SIZE > 0 else None
+
+
+@contextlib.asynccontextmanager
+async def open_live_session():
+    """Yields a live session, pre-connected from the pool when one is ready."""
+    lease = session_pool.acquire_nowait() if session_pool is not None else None
+    if lease is not None:
+        try:
+            yield lease.session
+        finally:
+            lease.release()
+        return
+    async with connect_live_session() as session:
+        yield session
+
+
+# Forwarders of the sessions currently open, for /stats
+active_forwarders = set()
+# Totals of the sessions that already ended, and what ended them
+finished_session_stats = {}
+session_end_reasons = collections.Counter()
+
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
+@app.get("/stats")
+async def stats_endpoint():
+    sessions = [forwarder.stats.as_dict() | forwarder.budget.as_dict() | {"audio_queue_depth": forwarder.audio_queue_depth}
+                for forwarder in active_forwarders]
+    return {
+        "tools": tool_executor.stats,
+        "active_sessions": len(sessions),
+        "sessions": sessions,
+        "finished_totals": finished_session_stats,
+        "end_reasons": session_end_reasons,
+        "session_pool": session_pool.stats if session_pool is not None else None,
+    }
 
+
+def record_finished_session(forwarder):
+    for key, value in vars(forwarder.stats).items():
+        if key.endswith("_max"):
+            finished_session_stats[key] = max(finished_session_stats.get(key, 0), value)
+        else:
+            finished_session_stats[key] = finished_session_stats.get(key, 0) + value
+
+@app.get("/load")
+async def load_endpoint():
+    """Load of this worker, polled by live_cluster.py to place new connections."""
+    return {
+        "pid": os.getpid(),
+        "active_sessions": active_sessions,
+        "max_sessions": LIVE_MAX_SESSIONS,
+        "accepting": active_sessions < LIVE_MAX_SESSIONS,
+    }
+
+
+# Sessions admitted on this worker, including those still connecting to Gemini
+active_sessions = 0
+
+
+@app.websocket("/ws/live")
+async def websocket_endpoint(websocket: WebSocket):
+    global active_sessions
+    await websocket.accept()
+    if active_sessions >= LIVE_MAX_SESSIONS:
+        # Turn the client away up front instead of degrading every open session
+        LIVE_SESSIONS_REJECTED.inc()
+        logger.warning("Rejecting session, worker is at capacity.", extra={"active_sessions": active_sessions})
+        await websocket.send_json({"type": "busy", "message": "Server is busy, please retry shortly.",
+                                   "retry_after_ms": LIVE_BUSY_RETRY_AFTER_MS})
+        await websocket.close(code=1013)  # Try Again Later
+        return
+
+    active_sessions += 1
     try:
-        async with client.aio.live.connect(model=model, config=config) as session:
+        await run_live_session(websocket)
+    finally:
+        active_sessions -= 1
+
+
+async def run_live_session(websocket: WebSocket):
+    # Clients opt into the binary frame protocol with /ws/live?protocol=binary
+    binary_protocol = websocket.query_params.get("protocol") == "binary"
+    logger.info("Client connected.", extra={"protocol": "binary" if binary_protocol else "json"})
+    await websocket.send_json({"type": "instantiating_connection"})
+
+    try:
+        async with open_live_session() as session:
             await websocket.send_json({"type": "successfully_connected"})
 
+            # Bounded queues between the client socket and Gemini (see realtime_forwarder.py)
+            forwarder = RealtimeForwarder(
+                session,
+                max_audio_chunks=LIVE_AUDIO_QUEUE_CHUNKS,
+                min_video_interval=LIVE_MIN_VIDEO_INTERVAL,
+            )
+            budget = SessionBudget(
+                max_duration=LIVE_MAX_SESSION_SECONDS,
+                idle_timeout=LIVE_IDLE_TIMEOUT,
+                max_bytes=LIVE_MAX_SESSION_BYTES,
+                heartbeat_interval=LIVE_HEARTBEAT_INTERVAL,
+            )
+            forwarder.budget = budget
+            active_forwarders.add(forwarder)
+            LIVE_SESSIONS.inc()
+
             async def send_to_gemini():
                 try:
                     while True:
                         message_event = await websocket.receive()
 
                         if message_event['type'] == 'websocket.receive':
+                            budget.client_activity(len(message_event.get('bytes') or message_event.get('text') or ''))
+                            # Binary frame: typed header + raw JPEG/PNG/PCM payload
+                            if binary_protocol and message_event.get('bytes') is not None:
+                                try:
+                                    frame = decode_frame(message_event['bytes'])
+                                except FrameError as e:
+                                    logger.warning("Dropping malformed frame", extra={"error": str(e), "sample": 100})
+                                    continue
+                                if frame.kind == KIND_AUDIO_STREAM_END:
+                                    await forwarder.put_audio_stream_end()
+                                elif frame.is_video:
+                                    forwarder.put_video(frame.payload, frame.mime_type, capture_ms=frame.timestamp_ms)
+                                else:
+                                    await forwarder.put_audio(frame.payload, frame.mime_type)
+
                             # Binary audio (raw stream)
-                            if 'bytes' in message_event:
+                            elif message_event.get('bytes') is not None:
                                 binary_message = message_event['bytes']
-                                print(f"[AUDIO RECEIVED] Length: {len(binary_message)} bytes")
-                                await session.send_realtime_input(
-                                    audio=types.Blob(
-                                        data=binary_message,
-                                        mime_type="audio/pcm;rate=16000",
-                                    )
-                                )
+                                logger.debug("[AUDIO RECEIVED]", extra={"bytes": len(binary_message), "sample": 100})
+                                await forwarder.put_audio(binary_message, "audio/pcm;rate=16000")
 
                             # JSON text (image, control events)
-                            elif 'text' in message_event:
+                            elif message_event.get('text') is not None:
                                 text_message = message_event['text']
                                 try:
                                     json_data = json.loads(text_message)
@@ -107,71 +283,113 @@ async def websocket_endpoint(websocket: WebSocket):
                                     if json_data.get("type") == "image_input":
                                         base64_image = json_data["image_data"]
                                         image_bytes = base64.b64decode(base64_image)
-                                        print(f"[VIDEO FRAME RECEIVED] Length: {len(image_bytes)} bytes, Type: {json_data.get('mime_type', 'image/jpeg')}")
-                                        await session.send_realtime_input(
-                                            **{
-                                                "video": types.Blob(
-                                                    data=image_bytes,
-                                                    mime_type=json_data.get("mime_type", "image/jpeg"), # Sending as JPEG MIME type
-                                                )
-                                            }
-                                        )
-                                        print(f"[VIDEO FRAME SENT] Length: {len(image_bytes)} bytes, Type: {json_data.get('mime_type', 'image/jpeg')}")
+                                        logger.debug("[VIDEO FRAME RECEIVED]", extra={"bytes": len(image_bytes), "sample": 20})
+                                        # Latest frame wins; it is sent once Gemini has caught up
+                                        forwarder.put_video(image_bytes, json_data.get("mime_type", "image/jpeg"))
 
 
                                     elif json_data.get("type") == "audio_stream_end":
-                                        print("[CONTROL] Frontend signaled audio stream end.")
-                                        await session.send_realtime_input(audio_stream_end=True)
+                                        logger.info("[CONTROL] Frontend signaled audio stream end.")
+                                        await forwarder.put_audio_stream_end()
+                                    elif json_data.get("type") == "heartbeat":
+                                        pass  # only keeps the session from going idle
                                     else:
-                                        print(f"[WARNING] Unhandled JSON message type: {json_data.get('type')}")
+                                        logger.warning(f"Unhandled JSON message type: {json_data.get('type')}")
                                 except Exception as e:
-                                    print(f"Error processing text message: {e}")
+                                    logger.error(f"Error processing text message: {e}")
 
                             else:
-                                print(f"[WARNING] Event with no text or bytes: {message_event}")
+                                logger.warning(f"Event with no text or bytes: {message_event}")
 
                         elif message_event['type'] == 'websocket.disconnect':
-                            print("Client disconnected (send stream).")
-                            return
+                            logger.info("Client disconnected (send stream).")
+                            return "client_disconnected"
                         else:
-                            print(f"[WARNING] Unhandled event type: {message_event['type']}")
+                            logger.warning(f"Unhandled event type: {message_event['type']}")
 
                 except WebSocketDisconnect:
-                    print("Client disconnected (send stream via exception).")
-                    return
+                    logger.info("Client disconnected (send stream via exception).")
+                    return "client_disconnected"
+                except Exception as e:
+                    logger.error(f"Error in send stream: {e}")
+                    return "client_error"
+                finally:
+                    forwarder.close()
+
+            async def forward_to_gemini():
+                try:
+                    await forwarder.run()
+                    return "forwarder_closed"
                 except Exception as e:
-                    print(f"Error in send stream: {e}")
+                    logger.error(f"Error forwarding to Gemini: {e}")
+                    return "gemini_error"
+
+            # Tool calls run as their own tasks so audio keeps streaming meanwhile
+            tool_tasks = set()
 
             async def receive_gemini_responses():
                 try:
                     while True:
                         async for response in session.receive():
                             if getattr(response.server_content, "interrupted", False):
-                                print("[GEMINI] Interrupted!")
+                                logger.info("[GEMINI] Interrupted!")
                                 await websocket.send_json({"type": "interrupted"})
                             
                             if getattr(response, "data", None):
+                                budget.sent(len(response.data))
                                 await websocket.send_bytes(response.data)
+                                LIVE_FRAMES.labels("audio", "returned").inc()
+                                LIVE_BYTES.labels("audio", "to_client").inc(len(response.data))
                             
                             if getattr(response.server_content, "turn_complete", False):
-                                print("[GEMINI] Turn complete!")
+                                logger.debug("[GEMINI] Turn complete!")
                                 await websocket.send_json({"type": "turn_complete"})
                             
-                            # Handle tool calls (function calling)
-                            await handle_tool_calls(response, session)
+                            # Handle tool calls (function calling) without waiting for them
+                            if getattr(response, "tool_call", None):
+                                task = asyncio.create_task(handle_tool_calls(response, session))
+                                tool_tasks.add(task)
+                                task.add_done_callback(tool_tasks.discard)
                                 
                 except WebSocketDisconnect:
-                    print("Client disconnected (Gemini response stream).")
-                    return
+                    logger.info("Client disconnected (Gemini response stream).")
+                    return "client_disconnected"
                 except Exception as e:
-                    print("Error in Gemini response stream:", e)
-
-            await asyncio.gather(
-                send_to_gemini(),
-                receive_gemini_responses(),
-            )
+                    logger.error(f"Error in Gemini response stream: {e}")
+                    return "gemini_error"
+
+            async def send_heartbeat():
+                await websocket.send_json({"type": "heartbeat"})
+
+            # Whichever side ends first ends the session: the others are cancelled, not awaited
+            tasks = [
+                asyncio.create_task(budget.watch(send_heartbeat)),
+                asyncio.create_task(send_to_gemini()),
+                asyncio.create_task(forward_to_gemini()),
+                asyncio.create_task(receive_gemini_responses()),
+            ]
+            reason = "cancelled"
+            try:
+                done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                # Tasks are listed by priority: a budget reason beats the disconnect it caused
+                reason = next(task.result() for task in tasks if task in done)
+                if reason in REAP_REASONS:
+                    logger.info("Reaping live session", extra={"reason": reason} | budget.as_dict())
+                    with contextlib.suppress(Exception):
+                        await websocket.send_json({"type": "session_ended", "reason": reason})
+                        await websocket.close(code=1000)
+            finally:
+                for task in [*tasks, *tool_tasks]:
+                    task.cancel()
+                await asyncio.gather(*tasks, *tool_tasks, return_exceptions=True)
+                active_forwarders.discard(forwarder)
+                record_finished_session(forwarder)
+                session_end_reasons[reason] += 1
+                LIVE_SESSIONS_ENDED.labels(reason).inc()
+                LIVE_SESSIONS.dec()
+                logger.info("Session stats", extra=forwarder.stats.as_dict() | budget.as_dict() | {"reason": reason})
     except Exception as e:
-        print(f"Error during Gemini session setup: {e}")
+        logger.error(f"Error during Gemini session setup: {e}")
         try:
             await websocket.send_json({
                 "type": "error",
@@ -213,7 +431,7 @@ async def websocket_endpoint(websocket: WebSocket):
 # Stub function for navigation requests
 def handle_navigation_request(destination: str, navigation_type: str = "directions"):
     """Stub function for handling navigation requests"""
-    print(f"Navigation request called - Destination: {destination}, Type: {navigation_type}")
+    logger.info("Navigation request called", extra={"destination": destination, "navigation_type": navigation_type})
     return {"status": "success", "message": f"Navigation request processed for {destination}"}
 
 
@@ -231,38 +449,24 @@ def handle_navigation_request(destination: str, navigation_type: str = "directio
 #
 
 
+tool_executor = ToolExecutor(max_workers=LIVE_TOOL_WORKERS, default_timeout=LIVE_TOOL_TIMEOUT)
+tool_executor.register(NAVIGATION_REQUEST["name"], handle_navigation_request,
+                       cache_ttl=LIVE_NAVIGATION_CACHE_TTL)
+
+
 async def handle_tool_calls(response, session):
     if hasattr(response, 'tool_call') and response.tool_call:
-        print("[GEMINI] Tool call received!")
-        function_responses = []
-        
+        logger.info("[GEMINI] Tool call received!")
         for fc in response.tool_call.function_calls:
-            print(f"[FUNCTION CALL] {fc.name} called with args: {fc.args}")
-            
-            if fc.name == "navigation_request":
-                # Extract arguments
-                destination = fc.args.get("destination", "")
-                navigation_type = fc.args.get("navigation_type", "directions")
-                
-                # Call our stub function
-                result = handle_navigation_request(destination, navigation_type)
-                
-                # Create function response
-                function_response = types.FunctionResponse(
-                    id=fc.id,
-                    name=fc.name,
-                    response=result
-                )
-            else:
-                # Handle unknown function calls
-                function_response = types.FunctionResponse(
-                    id=fc.id,
-                    name=fc.name,
-                    response={"error": f"Unknown function: {fc.name}"}
-                )
-            
-            function_responses.append(function_response)
-        
-        # Send tool responses back to Gemini
-        await session.send_tool_response(function_responses=function_responses)
-        print("[GEMINI] Tool responses sent!")
\ No newline at end of file
+            logger.info(f"[FUNCTION CALL] {fc.name} called", extra={"tool_args": fc.args})
+
+        # Runs as a detached task: nothing awaits it, so failures are logged here
+        try:
+            # All calls of this turn run concurrently, each with its own timeout
+            function_responses = await tool_executor.execute(response.tool_call.function_calls)
+
+            # Send tool responses back to Gemini
+            await session.send_tool_response(function_responses=function_responses)
+            logger.info("[GEMINI] Tool responses sent!")
+        except Exception as e:
+            logger.exception("[GEMINI] Could not answer tool call", extra={"error": f"{type(e).__name__}: {e}"})
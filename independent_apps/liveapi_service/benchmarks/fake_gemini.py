@@ -0,0 +1,77 @@
+"""
+In-process stand-in for a Gemini live session, for load tests without an API key.
+
+The google-genai SDK always opens its live socket over wss, so the fake sits
+at the connect level: `fake_connect` has the same shape as
+`client.aio.live.connect(...)` and yields a session that echoes every audio
+chunk back (after `latency` seconds) and completes the turn on audio_stream_end.
+`FakeClient` stands in for the genai client itself, so the app's own
+connect path (`client.aio.live.connect`) still runs.
+"""
+import asyncio
+import contextlib
+import types
+
+
+class FakeServerContent:
+    def __init__(self, interrupted=False, turn_complete=False):
+        self.interrupted = interrupted
+        self.turn_complete = turn_complete
+
+
+class FakeResponse:
+    def __init__(self, data=None, turn_complete=False):
+        self.data = data
+        self.server_content = FakeServerContent(turn_complete=turn_complete)
+        self.tool_call = None
+
+
+class FakeLiveSession:
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self._responses = asyncio.Queue()
+        self.stats = {"audio": 0, "video": 0, "stream_ends": 0, "tool_responses": 0}
+
+    async def send_realtime_input(self, audio=None, video=None, audio_stream_end=None):
+        if audio is not None:
+            self.stats["audio"] += 1
+            self._reply(FakeResponse(data=audio.data))
+        if video is not None:
+            self.stats["video"] += 1
+        if audio_stream_end:
+            self.stats["stream_ends"] += 1
+            self._reply(FakeResponse(turn_complete=True))
+
+    async def send_tool_response(self, function_responses=None):
+        self.stats["tool_responses"] += 1
+
+    def _reply(self, response):
+        if self.latency:
+            asyncio.get_running_loop().call_later(self.latency, self._responses.put_nowait, response)
+        else:
+            self._responses.put_nowait(response)
+
+    async def receive(self):
+        # Like the SDK, one receive() iterates a single turn
+        while True:
+            response = await self._responses.get()
+            yield response
+            if response.server_content.turn_complete:
+                return
+
+
+def fake_connect(latency=0.0):
+    """Returns a zero-argument callable usable in place of app.connect_live_session."""
+    @contextlib.asynccontextmanager
+    async def connect():
+        yield FakeLiveSession(latency)
+
+    return connect
+
+
+class FakeClient:
+    """Mimics genai.Client far enough for `client.aio.live.connect(model=..., config=...)`."""
+
+    def __init__(self, latency=0.0):
+        connect = fake_connect(latency)
+        self.aio = types.SimpleNamespace(live=types.SimpleNamespace(connect=lambda **kwargs: connect()))
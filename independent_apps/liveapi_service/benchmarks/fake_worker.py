@@ -0,0 +1,35 @@
+"""
+Runs the live service with Gemini replaced by benchmarks/fake_gemini.py.
+
+    python benchmarks/fake_worker.py --port 8101 --latency 0.05
+
+Everything else (admission control, forwarder, /load, /metrics) is the real app.
+"""
+import argparse
+import os
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+sys.path.insert(0, HERE)
+
+import uvicorn
+
+import app
+from fake_gemini import FakeClient
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8101)
+    parser.add_argument("--latency", type=float, default=0.0, help="echo delay of the fake session, seconds")
+    args = parser.parse_args()
+
+    # get_client() returns it, so app.connect_live_session and the session pool use the fake
+    app._client = FakeClient(args.latency)
+    uvicorn.run(app.app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
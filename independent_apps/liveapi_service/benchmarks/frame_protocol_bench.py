@@ -0,0 +1,60 @@
+"""
+Compares the legacy JSON/base64 video frames with the binary frame protocol:
+server CPU time to turn one WebSocket message into a payload, and bytes on the wire.
+
+    python benchmarks/frame_protocol_bench.py --frame-kb 40 --frames 5000
+"""
+import argparse
+import base64
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from frame_protocol import KIND_IMAGE_JPEG, decode_frame, encode_frame
+
+
+def legacy_decode(text_message):
+    json_data = json.loads(text_message)
+    return base64.b64decode(json_data["image_data"])
+
+
+def binary_decode(message):
+    return decode_frame(message).payload
+
+
+def measure(decode, message, frames):
+    start = time.process_time()
+    for _ in range(frames):
+        decode(message)
+    return (time.process_time() - start) / frames
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--frame-kb", type=int, default=40, help="JPEG frame size in KiB")
+    parser.add_argument("--frames", type=int, default=5000)
+    args = parser.parse_args()
+
+    jpeg = os.urandom(args.frame_kb * 1024)
+    legacy_message = json.dumps({
+        "type": "image_input",
+        "image_data": base64.b64encode(jpeg).decode("ascii"),
+        "mime_type": "image/jpeg",
+    })
+    binary_message = encode_frame(KIND_IMAGE_JPEG, jpeg, sequence=1, timestamp_ms=int(time.time() * 1000))
+    assert legacy_decode(legacy_message) == binary_decode(binary_message) == jpeg
+
+    results = [
+        ("json+base64", len(legacy_message.encode("utf-8")), measure(legacy_decode, legacy_message, args.frames)),
+        ("binary", len(binary_message), measure(binary_decode, binary_message, args.frames)),
+    ]
+    print(f"{'protocol':<12} {'bytes/frame':>12} {'cpu us/frame':>13}")
+    for name, size, cpu in results:
+        print(f"{name:<12} {size:>12} {cpu * 1e6:>13.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""
+Load test for /ws/live across several worker processes.
+
+Starts `--workers` fake-Gemini workers (benchmarks/fake_worker.py) behind
+live_cluster.py, then opens `--sessions` concurrent clients. Each client
+streams 20 ms PCM chunks over the binary protocol (the first bytes carry a
+send timestamp, echoed back by the fake) plus a JPEG-sized frame at ~2 fps,
+and the run reports echo latency, how many sessions were admitted or told
+"busy", and how sessions spread over the workers.
+
+    python benchmarks/live_load_test.py --workers 2 --sessions 50 --max-sessions 20 --duration 10
+"""
+import argparse
+import asyncio
+import json
+import os
+import struct
+import subprocess
+import sys
+import time
+import urllib.request
+
+import websockets
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SERVICE_DIR = os.path.dirname(HERE)
+sys.path.insert(0, SERVICE_DIR)
+
+from frame_protocol import KIND_AUDIO_PCM, KIND_IMAGE_JPEG, encode_frame
+
+AUDIO_CHUNK_BYTES = 640  # 20 ms of 16 kHz 16-bit mono
+AUDIO_CHUNK_SECONDS = 0.02
+VIDEO_INTERVAL_SECONDS = 0.5
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def stop_processes(processes):
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        try:
+            # uvicorn waits for open WebSockets on shutdown; do not hang on them
+            process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+
+def wait_for_http(url, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(url, timeout=1) as response:
+                return json.loads(response.read())
+        except Exception:
+            time.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up")
+
+
+async def run_client(url, duration, video_bytes, latencies):
+    """Returns "admitted" or "busy"."""
+    async with websockets.connect(url, max_size=None) as ws:
+        # instantiating_connection, then successfully_connected or busy
+        while True:
+            event = json.loads(await ws.recv())
+            if event["type"] == "busy":
+                return "busy"
+            if event["type"] == "successfully_connected":
+                break
+
+        async def receive():
+            async for message in ws:
+                if isinstance(message, bytes) and len(message) >= 8:
+                    (sent_at,) = struct.unpack_from("!d", message)
+                    latencies.append(time.perf_counter() - sent_at)
+
+        receiver = asyncio.create_task(receive())
+        padding = bytes(AUDIO_CHUNK_BYTES - 8)
+        video = bytes(video_bytes)
+        seq = 0
+        next_video = 0.0
+        started = time.perf_counter()
+        while time.perf_counter() - started < duration:
+            now = time.perf_counter()
+            await ws.send(encode_frame(KIND_AUDIO_PCM, struct.pack("!d", now) + padding, sequence=seq))
+            if now >= next_video:
+                # Vary the first bytes so the server does not skip the frame as unchanged
+                await ws.send(encode_frame(KIND_IMAGE_JPEG, struct.pack("!I", seq) + video[4:], sequence=seq))
+                next_video = now + VIDEO_INTERVAL_SECONDS
+            seq += 1
+            await asyncio.sleep(AUDIO_CHUNK_SECONDS)
+        await asyncio.sleep(0.2)
+        receiver.cancel()
+        return "admitted"
+
+
+async def drive(args, front_url, latencies):
+    ws_url = front_url.replace("http", "ws", 1) + "/ws/live?protocol=binary"
+    # Clients arrive over the first second rather than all in the same instant
+    tasks = []
+    for i in range(args.sessions):
+        tasks.append(asyncio.create_task(run_client(ws_url, args.duration, args.video_kb * 1024, latencies)))
+        await asyncio.sleep(1.0 / args.sessions)
+    # Sample the spread of sessions over workers while every client is connected
+    await asyncio.sleep(min(2.0, args.duration / 2))
+    load = await asyncio.to_thread(wait_for_http, front_url + "/load")
+    outcomes = await asyncio.gather(*tasks, return_exceptions=True)
+    return outcomes, load
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--sessions", type=int, default=40)
+    parser.add_argument("--max-sessions", type=int, default=25, help="LIVE_MAX_SESSIONS per worker")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds each client streams")
+    parser.add_argument("--latency", type=float, default=0.0, help="echo delay of the fake Gemini, seconds")
+    parser.add_argument("--video-kb", type=int, default=40)
+    parser.add_argument("--port", type=int, default=8200)
+    args = parser.parse_args()
+
+    env = dict(os.environ, LIVE_MAX_SESSIONS=str(args.max_sessions), LOG_LEVEL="WARNING")
+    worker_urls = [f"http://127.0.0.1:{args.port + 1 + i}" for i in range(args.workers)]
+    processes = [
+        subprocess.Popen([sys.executable, os.path.join(HERE, "fake_worker.py"), "--port", url.rsplit(":", 1)[1],
+                          "--latency", str(args.latency)], env=env)
+        for url in worker_urls
+    ]
+    attach = [arg for url in worker_urls for arg in ("--attach", url)]
+    processes.append(subprocess.Popen(
+        [sys.executable, os.path.join(SERVICE_DIR, "live_cluster.py"), "--host", "127.0.0.1",
+         "--port", str(args.port), *attach], cwd=SERVICE_DIR, env=env))
+
+    front_url = f"http://127.0.0.1:{args.port}"
+    try:
+        for url in worker_urls + [front_url]:
+            wait_for_http(url + "/load")
+        latencies = []
+        outcomes, load = asyncio.run(drive(args, front_url, latencies))
+    finally:
+        stop_processes(processes)
+
+    errors = [o for o in outcomes if isinstance(o, BaseException)]
+    print(f"sessions: {args.sessions}  admitted: {outcomes.count('admitted')}  "
+          f"busy: {outcomes.count('busy')}  errors: {len(errors)}")
+    print("sessions per worker: " + ", ".join(f"{w['url']}={w['active_sessions']}" for w in load["workers"]))
+    print(f"echo latency over {len(latencies)} chunks: p50 {percentile(latencies, 50) * 1000:.1f}ms  "
+          f"p95 {percentile(latencies, 95) * 1000:.1f}ms  p99 {percentile(latencies, 99) * 1000:.1f}ms")
+    if errors:
+        print(f"first error: {errors[0]!r}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,283 @@
+"""
+Replay benchmark for the /ws/live pipeline, without a Gemini key or a phone.
+
+A stream (20 ms PCM chunks plus JPEG frames) is synthesized, or loaded from
+a recording, and replayed over the binary protocol by `--sessions` concurrent
+clients against a worker whose Gemini client is benchmarks/fake_gemini.py.
+The fake echoes audio back. Reported per run:
+
+  * server CPU time per inbound frame (worker process CPU / frames sent)
+  * end-to-end audio latency, client send -> echo received (p50/p95/p99)
+  * worker memory per session (RSS growth over an idle worker / sessions)
+  * with --ramp, the largest step whose p95 stays under --max-p95-ms and
+    whose echoes all come back: the maximum sustainable session count
+
+    python benchmarks/live_replay.py --sessions 20 --duration 10
+    python benchmarks/live_replay.py --ramp 10,25,50,100 --speed 1 --output replay.json
+    python benchmarks/live_replay.py --save stream.rec --duration 30     # write the synthetic stream
+    python benchmarks/live_replay.py --replay stream.rec --speed 4       # replay it 4x faster
+
+Recordings are a header line followed by (offset seconds, frame kind, length)
+records and payloads; any capture of a client's frames in that format can be
+replayed. The first 8 bytes of each audio chunk are overwritten with the send
+time so the echo can be matched. Each step runs on a fresh worker process.
+Memory and CPU figures read /proc, so they are Linux only.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import struct
+import subprocess
+import sys
+import time
+import urllib.request
+
+import websockets
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+from frame_protocol import KIND_AUDIO_PCM, KIND_AUDIO_STREAM_END, KIND_IMAGE_JPEG, encode_frame
+
+RECORDING_HEADER = b"SEEFORME-LIVE-RECORDING 1\n"
+RECORD = struct.Struct("!dBI")
+SAMPLE_RATE = 16000
+CHUNK_SECONDS = 0.02
+TIMESTAMP = struct.Struct("!d")
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+# --- Streams ---
+def synthesize(duration, fps=2.0, frame_kb=40, seed=0):
+    """Returns [(offset, kind, payload)]: a 440 Hz tone in 20 ms chunks plus JPEG-sized frames."""
+    rng = random.Random(seed)
+    samples_per_chunk = int(SAMPLE_RATE * CHUNK_SECONDS)
+    entries = []
+    for n in range(int(duration / CHUNK_SECONDS)):
+        first = n * samples_per_chunk
+        chunk = struct.pack(f"<{samples_per_chunk}h", *(
+            int(8000 * math.sin(2 * math.pi * 440 * (first + i) / SAMPLE_RATE)) for i in range(samples_per_chunk)))
+        entries.append((n * CHUNK_SECONDS, KIND_AUDIO_PCM, chunk))
+    # A few distinct frames cycled, so the server does not skip them as unchanged
+    frames = [b"\xff\xd8" + rng.randbytes(frame_kb * 1024 - 4) + b"\xff\xd9" for _ in range(4)]
+    if fps > 0:
+        for n in range(int(duration * fps)):
+            entries.append((n / fps, KIND_IMAGE_JPEG, frames[n % len(frames)]))
+    entries.sort(key=lambda entry: entry[0])
+    return entries
+
+
+def save_recording(path, entries):
+    with open(path, "wb") as f:
+        f.write(RECORDING_HEADER)
+        for offset, kind, payload in entries:
+            f.write(RECORD.pack(offset, kind, len(payload)))
+            f.write(payload)
+
+
+def load_recording(path):
+    entries = []
+    with open(path, "rb") as f:
+        if f.readline() != RECORDING_HEADER:
+            raise ValueError(f"{path} is not a live recording")
+        while header := f.read(RECORD.size):
+            offset, kind, length = RECORD.unpack(header)
+            entries.append((offset, kind, f.read(length)))
+    return entries
+
+
+# --- Worker process ---
+def read_proc(pid):
+    """Returns (rss_bytes, cpu_seconds) of a process."""
+    with open(f"/proc/{pid}/status") as f:
+        rss = next(int(line.split()[1]) * 1024 for line in f if line.startswith("VmRSS:"))
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    cpu = (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    return rss, cpu
+
+
+def get_json(url, timeout=1.0):
+    with urllib.request.urlopen(url, timeout=timeout) as response:
+        return json.loads(response.read())
+
+
+def start_worker(port, latency):
+    env = dict(os.environ, LIVE_MAX_SESSIONS="100000", LOG_LEVEL="WARNING")
+    process = subprocess.Popen([sys.executable, os.path.join(HERE, "fake_worker.py"), "--port", str(port),
+                                "--latency", str(latency)], env=env)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            get_json(f"http://127.0.0.1:{port}/load")
+            return process
+        except Exception:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError("worker did not start")
+
+
+def stop_worker(process):
+    process.terminate()
+    try:
+        # uvicorn waits for open WebSockets on shutdown; do not hang on them
+        process.wait(timeout=5)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+# --- Clients ---
+async def replay_session(url, entries, speed, latencies, counts):
+    async with websockets.connect(url, max_size=None) as ws:
+        while json.loads(await ws.recv())["type"] != "successfully_connected":
+            pass
+        turn_complete = asyncio.Event()
+
+        async def receive():
+            async for message in ws:
+                if isinstance(message, bytes):
+                    (sent_at,) = TIMESTAMP.unpack_from(message)
+                    latencies.append(time.perf_counter() - sent_at)
+                    counts["echoed"] += 1
+                elif json.loads(message).get("type") == "turn_complete":
+                    turn_complete.set()
+
+        receiver = asyncio.create_task(receive())
+        started = time.perf_counter()
+        for sequence, (offset, kind, payload) in enumerate(entries):
+            if speed:
+                delay = started + offset / speed - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            if kind == KIND_AUDIO_PCM:
+                payload = TIMESTAMP.pack(time.perf_counter()) + payload[TIMESTAMP.size:]
+                counts["audio"] += 1
+            else:
+                counts["video"] += 1
+            await ws.send(encode_frame(kind, payload, sequence=sequence))
+        await ws.send(encode_frame(KIND_AUDIO_STREAM_END, sequence=len(entries)))
+        try:
+            # Every echo is queued before turn_complete, so this means all audio came back
+            await asyncio.wait_for(turn_complete.wait(), 10)
+        except asyncio.TimeoutError:
+            pass
+        receiver.cancel()
+
+
+async def run_step(port, pid, sessions, entries, speed):
+    url = f"ws://127.0.0.1:{port}/ws/live?protocol=binary"
+    latencies = []
+    counts = {"audio": 0, "video": 0, "echoed": 0}
+    load_url = f"http://127.0.0.1:{port}/load"
+    open_before = (await asyncio.to_thread(get_json, load_url))["active_sessions"]
+    rss_idle, cpu_before = read_proc(pid)
+    peak_rss = rss_idle
+    tasks = [asyncio.create_task(replay_session(url, entries, speed, latencies, counts)) for _ in range(sessions)]
+    all_done = asyncio.gather(*tasks, return_exceptions=True)
+    started = time.perf_counter()
+    while not all_done.done():
+        peak_rss = max(peak_rss, read_proc(pid)[0])
+        await asyncio.wait([all_done], timeout=0.25)
+    wall = time.perf_counter() - started
+    errors = [r for r in all_done.result() if isinstance(r, BaseException)]
+    cpu = read_proc(pid)[1] - cpu_before
+    await asyncio.sleep(0.5)
+    lingering = (await asyncio.to_thread(get_json, load_url))["active_sessions"] - open_before
+    frames = counts["audio"] + counts["video"]
+    return {
+        "sessions": sessions,
+        "errors": len(errors),
+        "first_error": repr(errors[0]) if errors else None,
+        "wall_seconds": round(wall, 2),
+        "frames_sent": frames,
+        "audio_chunks": counts["audio"],
+        "audio_echoed": counts["echoed"],
+        "server_cpu_us_per_frame": round(cpu / frames * 1e6, 1) if frames else 0.0,
+        "server_cpu_utilization": round(cpu / wall, 3),
+        "latency_p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "latency_p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "latency_p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "rss_idle_mb": round(rss_idle / 2**20, 1),
+        "memory_per_session_kb": round((peak_rss - rss_idle) / sessions / 1024, 1),
+        # Sessions the worker still holds after every client left
+        "lingering_sessions": lingering,
+    }
+
+
+def sustainable(result, max_p95_ms):
+    return (result["errors"] == 0 and result["audio_echoed"] >= result["audio_chunks"]
+            and result["latency_p95_ms"] <= max_p95_ms)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=10)
+    parser.add_argument("--ramp", help="comma-separated session counts; stops at the first unsustainable step")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds of synthesized stream")
+    parser.add_argument("--fps", type=float, default=2.0)
+    parser.add_argument("--frame-kb", type=int, default=40)
+    parser.add_argument("--speed", type=float, default=1.0, help="replay rate; 1 is real time, 0 is unthrottled")
+    parser.add_argument("--latency", type=float, default=0.0, help="echo delay of the fake Gemini, seconds")
+    parser.add_argument("--max-p95-ms", type=float, default=100.0,
+                        help="p95 echo latency (over --latency) a sustainable step must stay under")
+    parser.add_argument("--replay", help="recording to replay instead of a synthesized stream")
+    parser.add_argument("--save", help="write the synthesized stream to this file and exit")
+    parser.add_argument("--port", type=int, default=8400)
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    entries = load_recording(args.replay) if args.replay else synthesize(args.duration, args.fps, args.frame_kb)
+    if args.save:
+        save_recording(args.save, entries)
+        print(f"Wrote {len(entries)} frames to {args.save}")
+        return
+
+    steps = [int(n) for n in args.ramp.split(",")] if args.ramp else [args.sessions]
+    max_p95_ms = args.max_p95_ms + args.latency * 1000
+    results = []
+    for sessions in steps:
+        worker = start_worker(args.port, args.latency)
+        try:
+            # One short session first, so imports and first-use costs are not counted
+            asyncio.run(run_step(args.port, worker.pid, 1, entries[:50], 0))
+            result = asyncio.run(run_step(args.port, worker.pid, sessions, entries, args.speed))
+        finally:
+            stop_worker(worker)
+        results.append(result)
+        print(f"{sessions:>5} sessions: {result['server_cpu_us_per_frame']:>7.1f} us/frame  "
+              f"latency p50 {result['latency_p50_ms']:.1f} / p95 {result['latency_p95_ms']:.1f} / "
+              f"p99 {result['latency_p99_ms']:.1f} ms  {result['memory_per_session_kb']:.0f} KB/session  "
+              f"echoed {result['audio_echoed']}/{result['audio_chunks']}  errors {result['errors']}  "
+              f"lingering {result['lingering_sessions']}")
+        if args.ramp and not sustainable(result, max_p95_ms):
+            break
+
+    passing = [r["sessions"] for r in results if sustainable(r, max_p95_ms)]
+    max_sessions = max(passing) if passing else 0
+    if args.ramp:
+        print(f"Max sustainable sessions: {max_sessions} (p95 <= {max_p95_ms:g} ms, all audio echoed)")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({
+                "stream": {"frames": len(entries), "replay": args.replay, "speed": args.speed,
+                           "fps": args.fps, "frame_kb": args.frame_kb, "duration": args.duration},
+                "fake_latency": args.latency,
+                "cpus": os.cpu_count(),
+                "steps": results,
+                "max_sustainable_sessions": max_sessions if args.ramp else None,
+            }, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Checks LiveSessionPool against the fake Gemini session (benchmarks/fake_gemini.py):
+a ready session is handed out (hit) and replaced, an empty pool reports a miss,
+and a session older than max_age is recycled instead of handed out. Then the
+app's own pool is run with app.connect_live_session replaced by the fake.
+Exits with status 1 on the first check that fails.
+
+    python benchmarks/session_pool_check.py
+"""
+import asyncio
+import os
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+sys.path.insert(0, HERE)
+
+os.environ["LIVE_SESSION_POOL_SIZE"] = "1"
+
+import app
+from fake_gemini import FakeLiveSession, fake_connect
+from session_pool import LiveSessionPool
+
+
+async def wait_ready(pool, count, timeout=2.0):
+    for _ in range(int(timeout / 0.01)):
+        if len(pool._ready) >= count:
+            return True
+        await asyncio.sleep(0.01)
+    return False
+
+
+async def run_checks():
+    failures = []
+
+    def check(name, ok):
+        print(f"{'ok  ' if ok else 'FAIL'} {name}")
+        if not ok:
+            failures.append(name)
+
+    pool = LiveSessionPool(fake_connect(), size=1, max_age=0.3)
+    pool.start()
+    check("pool pre-connects a session", await wait_ready(pool, 1))
+
+    lease = pool.acquire_nowait()
+    check("ready session is handed out", lease is not None and isinstance(lease.session, FakeLiveSession))
+    check("hand-out counts as a hit", pool.stats["hits"] == 1)
+    lease.release()
+    check("used session is replaced", await wait_ready(pool, 1))
+
+    first = pool._ready[0]
+    await asyncio.sleep(0.35)
+    # Either the maintainer or acquire_nowait() itself recycles it
+    lease = pool.acquire_nowait()
+    check("session past max_age is recycled", first not in pool._ready and pool.stats["recycled"] >= 1)
+    check("session past max_age is not handed out", lease is not first and (lease is None or lease.age < pool.max_age))
+    check("recycled session is replaced", await wait_ready(pool, 1))
+
+    await pool.stop()
+
+    empty = LiveSessionPool(fake_connect(), size=0)
+    check("empty pool reports a miss", empty.acquire_nowait() is None and empty.stats["misses"] == 1)
+
+    app.connect_live_session = fake_connect()
+    app.session_pool.start()
+    await wait_ready(app.session_pool, 1)
+    async with app.open_live_session() as session:
+        check("app pool connects through a replaced connect_live_session", isinstance(session, FakeLiveSession))
+    check("app session came from the pool", app.session_pool.stats["hits"] == 1)
+    await app.session_pool.stop()
+    return failures
+
+
+def main():
+    failures = asyncio.run(run_checks())
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
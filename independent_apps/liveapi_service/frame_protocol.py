@@ -0,0 +1,73 @@
+"""
+Binary frame protocol for /ws/live (?protocol=binary).
+
+Every binary WebSocket message is a 12 byte header followed by the raw payload:
+
+    offset  size  field
+    0       1     version        (PROTOCOL_VERSION)
+    1       1     kind           (KIND_* below)
+    2       2     flags          (reserved, 0)
+    4       4     sequence       (per-stream counter, wraps at 2**32)
+    8       4     timestamp_ms   (client capture time, ms, wraps at 2**32)
+
+All fields are big-endian. Payloads are raw JPEG/PNG bytes or 16 kHz PCM,
+so frames cost no base64 inflation and no JSON parsing on the server.
+Text messages keep carrying the JSON control events.
+"""
+import struct
+
+PROTOCOL_VERSION = 1
+
+KIND_AUDIO_PCM = 1
+KIND_IMAGE_JPEG = 2
+KIND_IMAGE_PNG = 3
+KIND_AUDIO_STREAM_END = 4
+
+MIME_TYPES = {
+    KIND_AUDIO_PCM: "audio/pcm;rate=16000",
+    KIND_IMAGE_JPEG: "image/jpeg",
+    KIND_IMAGE_PNG: "image/png",
+}
+
+HEADER = struct.Struct("!BBHII")
+HEADER_SIZE = HEADER.size
+
+
+class FrameError(ValueError):
+    pass
+
+
+class Frame:
+    __slots__ = ("kind", "flags", "sequence", "timestamp_ms", "payload")
+
+    def __init__(self, kind, flags, sequence, timestamp_ms, payload):
+        self.kind = kind
+        self.flags = flags
+        self.sequence = sequence
+        self.timestamp_ms = timestamp_ms
+        self.payload = payload
+
+    @property
+    def mime_type(self):
+        return MIME_TYPES.get(self.kind)
+
+    @property
+    def is_video(self):
+        return self.kind in (KIND_IMAGE_JPEG, KIND_IMAGE_PNG)
+
+
+def decode_frame(message):
+    """Parses one binary WebSocket message. The payload is the only copy made."""
+    if len(message) < HEADER_SIZE:
+        raise FrameError(f"Frame shorter than header ({len(message)} bytes)")
+    version, kind, flags, sequence, timestamp_ms = HEADER.unpack_from(message)
+    if version != PROTOCOL_VERSION:
+        raise FrameError(f"Unsupported frame version {version}")
+    if kind not in MIME_TYPES and kind != KIND_AUDIO_STREAM_END:
+        raise FrameError(f"Unknown frame kind {kind}")
+    return Frame(kind, flags, sequence, timestamp_ms, message[HEADER_SIZE:])
+
+
+def encode_frame(kind, payload=b"", sequence=0, timestamp_ms=0, flags=0):
+    """Builds a binary message (used by clients, tests and benchmarks)."""
+    return HEADER.pack(PROTOCOL_VERSION, kind, flags, sequence & 0xFFFFFFFF, timestamp_ms & 0xFFFFFFFF) + payload
@@ -0,0 +1,278 @@
+"""
+Multi-worker deployment of the live service without any shared store.
+
+Starts N worker processes (`uvicorn app:app`, one port each) and a front
+process on the public port. The front polls every worker's /load and places
+each new /ws/live connection on the least-loaded worker that still accepts
+sessions, proxying the WebSocket to it. When every worker is full, the client
+gets the same "busy" event a worker would send; a worker that answers "busy"
+itself (its load changed since the last poll) is skipped for the next one.
+Clients that would rather skip the proxy hop can call GET /assign and connect
+to the returned URL.
+
+Connections placed since a worker's last poll are counted on top of the load
+it reported until a poll is known to include them, so a burst between two
+polls neither overfills a worker nor hides its free slots.
+
+    python live_cluster.py --workers 4 --port 8000
+    python live_cluster.py --port 8000 --attach http://127.0.0.1:8101 --attach http://127.0.0.1:8102
+
+Workers are plain uvicorn processes, so LIVE_MAX_SESSIONS and the other
+settings apply per worker.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import subprocess
+import sys
+import time
+import urllib.request
+
+import uvicorn
+import websockets
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse
+
+from observability import setup_logging
+
+logger = logging.getLogger(__name__)
+
+LOAD_POLL_INTERVAL = float(os.environ.get("LIVE_LOAD_POLL_INTERVAL_SECONDS", "0.5"))
+BUSY_RETRY_AFTER_MS = int(os.environ.get("LIVE_BUSY_RETRY_AFTER_MS", "2000"))
+# How long a GET /assign slot is held for a client that has not shown up in the worker's load
+ASSIGN_HOLD_SECONDS = float(os.environ.get("LIVE_ASSIGN_HOLD_SECONDS", "10"))
+
+
+class Assignment:
+    """A connection placed on a worker that the worker's reported load may not include yet."""
+
+    def __init__(self, worker):
+        self.worker = worker
+        self.assigned_at = time.monotonic()
+        # When the worker is known to have admitted it; set by the proxy
+        self.admitted_at = None
+
+    def admitted(self):
+        self.admitted_at = time.monotonic()
+
+    def cancel(self):
+        self.worker.pending.discard(self)
+
+
+class Worker:
+    def __init__(self, url):
+        self.url = url.rstrip("/")
+        self.ws_url = "ws" + self.url[len("http"):] + "/ws/live"
+        self.active_sessions = 0  # as of the last poll
+        self.max_sessions = 0
+        self.healthy = False
+        self.pending = set()
+
+    @property
+    def load(self):
+        return self.active_sessions + len(self.pending)
+
+    @property
+    def free_slots(self):
+        return self.max_sessions - self.load if self.healthy else 0
+
+
+class Coordinator:
+    """Tracks worker load and picks the worker for each new connection."""
+
+    def __init__(self, worker_urls, poll_interval=LOAD_POLL_INTERVAL):
+        self.workers = [Worker(url) for url in worker_urls]
+        self.poll_interval = poll_interval
+
+    def _fetch_load(self, worker):
+        with urllib.request.urlopen(worker.url + "/load", timeout=2) as response:
+            return json.loads(response.read())
+
+    async def poll_forever(self):
+        while True:
+            await self.refresh_all()
+            await asyncio.sleep(self.poll_interval)
+
+    async def refresh_all(self):
+        await asyncio.gather(*(self.refresh(worker) for worker in self.workers))
+
+    async def refresh(self, worker):
+        polled_at = time.monotonic()
+        try:
+            load = await asyncio.to_thread(self._fetch_load, worker)
+        except Exception:
+            worker.healthy = False
+            return
+        worker.active_sessions = load["active_sessions"]
+        worker.max_sessions = load["max_sessions"]
+        worker.healthy = True
+        # The reply counts what the worker had admitted when it was asked
+        worker.pending = {
+            assignment for assignment in worker.pending
+            if not (assignment.admitted_at is not None and assignment.admitted_at < polled_at)
+            and assignment.assigned_at >= polled_at - ASSIGN_HOLD_SECONDS
+        }
+
+    def pick(self, exclude=()):
+        """Returns an Assignment on the worker with the most free slots, or None if all are full."""
+        candidates = [w for w in self.workers if w not in exclude]
+        worker = max(candidates, key=lambda w: w.free_slots, default=None)
+        if worker is None or worker.free_slots <= 0:
+            return None
+        # Count it right away so a burst between two polls spreads across workers
+        assignment = Assignment(worker)
+        worker.pending.add(assignment)
+        return assignment
+
+    async def place(self, exclude=()):
+        """pick(), polling the workers first if the last poll leaves no room, before turning a client away."""
+        assignment = self.pick(exclude)
+        if assignment is None:
+            await self.refresh_all()
+            assignment = self.pick(exclude)
+        return assignment
+
+
+def create_front_app(coordinator):
+    @contextlib.asynccontextmanager
+    async def lifespan(app):
+        await coordinator.refresh_all()
+        poller = asyncio.create_task(coordinator.poll_forever())
+        yield
+        poller.cancel()
+
+    app = FastAPI(lifespan=lifespan)
+
+    @app.get("/load")
+    async def load_endpoint():
+        return {
+            "workers": [
+                {"url": w.url, "healthy": w.healthy, "active_sessions": w.active_sessions,
+                 "pending": len(w.pending), "max_sessions": w.max_sessions}
+                for w in coordinator.workers
+            ],
+            "free_slots": sum(w.free_slots for w in coordinator.workers),
+        }
+
+    @app.get("/assign")
+    async def assign_endpoint():
+        # Held until a poll shows the client connected, or for ASSIGN_HOLD_SECONDS
+        assignment = await coordinator.place()
+        if assignment is None:
+            return JSONResponse({"type": "busy", "retry_after_ms": BUSY_RETRY_AFTER_MS}, status_code=503)
+        return {"url": assignment.worker.ws_url}
+
+    @app.websocket("/ws/live")
+    async def proxy_endpoint(websocket: WebSocket):
+        await websocket.accept()
+        query = websocket.url.query
+        tried = []
+        while True:
+            assignment = await coordinator.place(exclude=tried)
+            if assignment is None:
+                await websocket.send_json({"type": "busy", "message": "Server is busy, please retry shortly.",
+                                           "retry_after_ms": BUSY_RETRY_AFTER_MS})
+                await websocket.close(code=1013)
+                return
+            worker = assignment.worker
+            tried.append(worker)
+            try:
+                async with websockets.connect(worker.ws_url + (f"?{query}" if query else ""), max_size=None) as upstream:
+                    # A worker sends its first event only after admitting or refusing the session
+                    first = await upstream.recv()
+                    if _is_busy(first):
+                        assignment.cancel()
+                        continue
+                    assignment.admitted()
+                    await (websocket.send_bytes(first) if isinstance(first, bytes) else websocket.send_text(first))
+                    await _pump(websocket, upstream)
+            except Exception as e:
+                assignment.cancel()
+                logger.error("Proxy to worker failed", extra={"worker": worker.url, "error": str(e)})
+            break
+        try:
+            await websocket.close()
+        except Exception:
+            pass
+
+    return app
+
+
+def _is_busy(message):
+    if isinstance(message, bytes):
+        return False
+    try:
+        return json.loads(message).get("type") == "busy"
+    except (ValueError, AttributeError):
+        return False
+
+
+async def _pump(client, upstream):
+    async def client_to_upstream():
+        try:
+            while True:
+                message = await client.receive()
+                if message["type"] == "websocket.disconnect":
+                    return
+                if message.get("bytes") is not None:
+                    await upstream.send(message["bytes"])
+                elif message.get("text") is not None:
+                    await upstream.send(message["text"])
+        except WebSocketDisconnect:
+            return
+
+    async def upstream_to_client():
+        async for message in upstream:
+            if isinstance(message, bytes):
+                await client.send_bytes(message)
+            else:
+                await client.send_text(message)
+
+    tasks = [asyncio.create_task(client_to_upstream()), asyncio.create_task(upstream_to_client())]
+    # When either side ends, tear down the other one too
+    await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--worker-base-port", type=int, default=8100)
+    parser.add_argument("--attach", action="append", default=[],
+                        help="URL of an already running worker (repeatable); no workers are started")
+    args = parser.parse_args()
+
+    setup_logging(os.environ.get("LOG_LEVEL", "INFO"))
+    processes = []
+    worker_urls = args.attach
+    if not worker_urls:
+        here = os.path.dirname(os.path.abspath(__file__))
+        for i in range(args.workers):
+            port = args.worker_base_port + i
+            processes.append(subprocess.Popen(
+                [sys.executable, "-m", "uvicorn", "app:app", "--host", "127.0.0.1", "--port", str(port)],
+                cwd=here,
+            ))
+            worker_urls.append(f"http://127.0.0.1:{port}")
+
+    try:
+        uvicorn.run(create_front_app(Coordinator(worker_urls)), host=args.host, port=args.port)
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Structured logging and Prometheus metrics for the live service.
+
+Logging: one JSON object per line, written by a background thread from a
+bounded queue, so the event loop never blocks on stdout (records are dropped
+and counted if the queue is full). Hot-path log calls pass
+`extra={"sample": N}` to emit only one in N of that message; the message
+must be a constant string (details go in `extra`), since it is the key.
+
+Metrics: live session count, per-kind frame and byte counters in both
+directions, drop counters and frame-age histograms, served on /metrics.
+(This service is deployed on its own, so it does not share the main
+backend's observability module.)
+"""
+import atexit
+import itertools
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+
+from prometheus_client import Counter, Gauge, Histogram
+
+LIVE_SESSIONS = Gauge('live_sessions', 'Open /ws/live sessions')
+LIVE_SESSIONS_REJECTED = Counter('live_sessions_rejected_total', 'Sessions turned away because the worker was full')
+LIVE_SESSIONS_ENDED = Counter('live_sessions_ended_total', 'Sessions that ended, by what ended them', ['reason'])
+LIVE_FRAMES = Counter('live_frames_total', 'Frames handled on /ws/live', ['kind', 'stage'])
+LIVE_BYTES = Counter('live_bytes_total', 'Payload bytes on /ws/live', ['kind', 'direction'])
+LIVE_FRAME_AGE = Histogram(
+    'live_video_frame_age_seconds', 'Time a video frame waited on the server before it was sent to Gemini',
+    buckets=(.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5),
+)
+LIVE_CAPTURE_AGE = Histogram(
+    'live_video_capture_age_seconds', 'Client capture to send-to-Gemini age of binary-protocol video frames',
+    buckets=(.025, .05, .1, .25, .5, 1, 2.5, 5, 10),
+)
+LIVE_TOOL_LATENCY = Histogram('live_tool_call_duration_seconds', 'Tool call latency', ['tool', 'outcome'])
+LOG_RECORDS_DROPPED = Counter('log_records_dropped_total', 'Log records dropped because the log queue was full')
+
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime', 'sample'}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'ts': round(record.created, 3),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Passes 1 in N records of a message when the call sets extra={"sample": N}."""
+
+    def __init__(self):
+        super().__init__()
+        self._counters = {}
+
+    def filter(self, record):
+        rate = getattr(record, 'sample', 1)
+        if rate <= 1:
+            return True
+        counter = self._counters.setdefault((record.name, record.msg), itertools.count())
+        return next(counter) % rate == 0
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS_DROPPED.inc()
+
+
+_listener = None
+
+
+def setup_logging(level='INFO', queue_size=10000):
+    global _listener
+    if _listener is not None:
+        return
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(JsonFormatter())
+    log_queue = queue.Queue(maxsize=queue_size)
+    queue_handler = DroppingQueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter())
+
+    root = logging.getLogger()
+    root.handlers[:] = [queue_handler]
+    root.setLevel(level)
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler)
+    _listener.start()
+    atexit.register(_listener.stop)
@@ -0,0 +1,165 @@
+"""
+Per-session forwarding of client audio and video to a Gemini live session.
+
+Audio (and control events like audio_stream_end) goes through a bounded FIFO
+queue and is never dropped: when it is full, the receive loop waits, which
+pushes back on the client's socket. Video uses a single "latest frame" slot:
+a newer frame replaces one that has not been sent yet, frames identical to the
+last one sent are skipped, and at most one frame is sent per
+`min_video_interval` seconds. So a slow Gemini link makes guidance skip
+frames instead of describing a scene from seconds ago.
+"""
+import asyncio
+import hashlib
+import time
+
+from google.genai import types
+
+from observability import LIVE_BYTES, LIVE_CAPTURE_AGE, LIVE_FRAME_AGE, LIVE_FRAMES
+
+
+class ForwarderStats:
+    def __init__(self):
+        self.audio_sent = 0
+        self.audio_bytes = 0
+        self.video_received = 0
+        self.video_sent = 0
+        self.video_bytes = 0
+        self.video_dropped_stale = 0
+        self.video_dropped_unchanged = 0
+        self.audio_queue_max = 0
+        self.video_age_ms_total = 0.0
+        self.video_age_ms_max = 0.0
+        self.capture_age_ms_total = 0.0
+        self.capture_age_samples = 0
+
+    def as_dict(self):
+        stats = dict(vars(self))
+        stats["video_age_ms_avg"] = self.video_age_ms_total / self.video_sent if self.video_sent else 0.0
+        stats["capture_age_ms_avg"] = (
+            self.capture_age_ms_total / self.capture_age_samples if self.capture_age_samples else 0.0
+        )
+        return stats
+
+
+class _VideoFrame:
+    __slots__ = ("data", "mime_type", "received_at", "capture_ms", "digest")
+
+    def __init__(self, data, mime_type, received_at, capture_ms, digest):
+        self.data = data
+        self.mime_type = mime_type
+        self.received_at = received_at
+        self.capture_ms = capture_ms
+        self.digest = digest
+
+
+class RealtimeForwarder:
+    def __init__(self, session, max_audio_chunks=64, min_video_interval=0.5):
+        self._session = session
+        self._audio = asyncio.Queue(maxsize=max_audio_chunks)
+        self._video = None
+        self._last_video_digest = None
+        self._next_video_at = 0.0
+        self.min_video_interval = min_video_interval
+        self._wakeup = asyncio.Event()
+        self._closed = False
+        self.stats = ForwarderStats()
+
+    @property
+    def audio_queue_depth(self):
+        return self._audio.qsize()
+
+    async def put_audio(self, data, mime_type="audio/pcm;rate=16000"):
+        """Queues an audio chunk, waiting while the queue is full."""
+        if not self._closed:
+            await self._audio.put(("audio", data, mime_type))
+            self._note_audio_put()
+
+    async def put_audio_stream_end(self):
+        if not self._closed:
+            await self._audio.put(("audio_stream_end", None, None))
+            self._note_audio_put()
+
+    def _note_audio_put(self):
+        self.stats.audio_queue_max = max(self.stats.audio_queue_max, self._audio.qsize())
+        self._wakeup.set()
+
+    def put_video(self, data, mime_type="image/jpeg", capture_ms=None):
+        """
+        Offers a video frame; never waits. `capture_ms` is the client's wall-clock
+        capture time (binary protocol), used for the end-to-end age metric.
+        """
+        self.stats.video_received += 1
+        LIVE_FRAMES.labels("video", "received").inc()
+        digest = hashlib.blake2b(data, digest_size=16).digest()
+        if self._video is not None:
+            self.stats.video_dropped_stale += 1
+            LIVE_FRAMES.labels("video", "dropped_stale").inc()
+        self._video = _VideoFrame(data, mime_type, time.monotonic(), capture_ms, digest)
+        self._wakeup.set()
+
+    def close(self):
+        self._closed = True
+        self._wakeup.set()
+
+    async def run(self):
+        """Sends queued input to the session until close(); audio always goes first."""
+        try:
+            while not self._closed:
+                self._wakeup.clear()
+                if not self._audio.empty():
+                    kind, data, mime_type = self._audio.get_nowait()
+                    if kind == "audio_stream_end":
+                        await self._session.send_realtime_input(audio_stream_end=True)
+                    else:
+                        await self._session.send_realtime_input(audio=types.Blob(data=data, mime_type=mime_type))
+                        self.stats.audio_sent += 1
+                        self.stats.audio_bytes += len(data)
+                        LIVE_FRAMES.labels("audio", "sent").inc()
+                        LIVE_BYTES.labels("audio", "to_gemini").inc(len(data))
+                    continue
+
+                timeout = None
+                if self._video is not None:
+                    now = time.monotonic()
+                    if now >= self._next_video_at:
+                        await self._send_video()
+                        continue
+                    timeout = self._next_video_at - now
+
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            # Unblock a receive loop waiting on a full queue; later puts are ignored
+            self._closed = True
+            while not self._audio.empty():
+                self._audio.get_nowait()
+
+    async def _send_video(self):
+        frame, self._video = self._video, None
+        if frame.digest == self._last_video_digest:
+            self.stats.video_dropped_unchanged += 1
+            LIVE_FRAMES.labels("video", "dropped_unchanged").inc()
+            return
+        await self._session.send_realtime_input(video=types.Blob(data=frame.data, mime_type=frame.mime_type))
+        self._last_video_digest = frame.digest
+        self._next_video_at = time.monotonic() + self.min_video_interval
+
+        stats = self.stats
+        stats.video_sent += 1
+        stats.video_bytes += len(frame.data)
+        age_ms = (time.monotonic() - frame.received_at) * 1000
+        stats.video_age_ms_total += age_ms
+        stats.video_age_ms_max = max(stats.video_age_ms_max, age_ms)
+        LIVE_FRAMES.labels("video", "sent").inc()
+        LIVE_BYTES.labels("video", "to_gemini").inc(len(frame.data))
+        LIVE_FRAME_AGE.observe(age_ms / 1000)
+        if frame.capture_ms is not None:
+            # Timestamps wrap at 2**32 ms; a "negative" age means the client clock runs ahead
+            capture_age_ms = (int(time.time() * 1000) - frame.capture_ms) & 0xFFFFFFFF
+            if capture_age_ms < 2 ** 31:
+                stats.capture_age_ms_total += capture_age_ms
+                stats.capture_age_samples += 1
+                LIVE_CAPTURE_AGE.observe(capture_age_ms / 1000)
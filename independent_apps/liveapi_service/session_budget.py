@@ -0,0 +1,76 @@
+"""
+Resource limits of one /ws/live session.
+
+A session may last at most `max_duration` seconds, stream at most `max_bytes`
+in both directions together, and go at most `idle_timeout` seconds without a
+message from the client (audio, video or a {"type": "heartbeat"} event).
+A limit of 0 disables it.
+
+`watch()` runs next to the forwarding tasks and returns the reason the
+session has to end. While waiting it sends a heartbeat event to the client
+every `heartbeat_interval` seconds: a socket whose peer is gone then shows
+up as a failed or stuck send instead of keeping the Gemini session open.
+"""
+import asyncio
+import time
+
+# Reasons returned by SessionBudget.watch()
+DURATION = "max_duration"
+IDLE = "idle_timeout"
+BYTES = "max_bytes"
+HEARTBEAT_FAILED = "heartbeat_failed"
+REAP_REASONS = (DURATION, IDLE, BYTES, HEARTBEAT_FAILED)
+
+
+class SessionBudget:
+    def __init__(self, max_duration=0.0, idle_timeout=0.0, max_bytes=0, heartbeat_interval=0.0):
+        self.max_duration = max_duration
+        self.idle_timeout = idle_timeout
+        self.max_bytes = max_bytes
+        self.heartbeat_interval = heartbeat_interval
+        self.started = time.monotonic()
+        self.last_client_activity = self.started
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def client_activity(self, size=0):
+        self.last_client_activity = time.monotonic()
+        self.bytes_in += size
+
+    def sent(self, size):
+        self.bytes_out += size
+
+    def exceeded(self):
+        """The limit this session is over, or None."""
+        now = time.monotonic()
+        if self.max_duration and now - self.started >= self.max_duration:
+            return DURATION
+        if self.idle_timeout and now - self.last_client_activity >= self.idle_timeout:
+            return IDLE
+        if self.max_bytes and self.bytes_in + self.bytes_out >= self.max_bytes:
+            return BYTES
+        return None
+
+    async def watch(self, send_heartbeat, tick=1.0):
+        """Returns the reason the session must end; runs until then."""
+        last_heartbeat = time.monotonic()
+        while True:
+            await asyncio.sleep(tick)
+            reason = self.exceeded()
+            if reason:
+                return reason
+            if self.heartbeat_interval and time.monotonic() - last_heartbeat >= self.heartbeat_interval:
+                last_heartbeat = time.monotonic()
+                try:
+                    # A send that cannot complete within one interval means the peer is not reading
+                    await asyncio.wait_for(send_heartbeat(), self.heartbeat_interval)
+                except Exception:
+                    return HEARTBEAT_FAILED
+
+    def as_dict(self):
+        return {
+            "duration_s": round(time.monotonic() - self.started, 3),
+            "idle_s": round(time.monotonic() - self.last_client_activity, 3),
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+        }
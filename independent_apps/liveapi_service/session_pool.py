@@ -0,0 +1,106 @@
+"""
+Pool of pre-connected Gemini live sessions.
+
+Opening a live session costs a WebSocket handshake plus session setup before
+the user can speak. The pool keeps `size` sessions connected ahead of time and
+hands one out per client connection; each used session is replaced in the
+background. Idle sessions are closed and replaced before `max_age` so clients
+never get one that the server is about to expire.
+
+`connect` is a zero-argument callable returning an async context manager that
+yields a session, e.g. `lambda: client.aio.live.connect(model=..., config=...)`,
+so a local fake can stand in for Gemini.
+"""
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class PooledSession:
+    def __init__(self, session):
+        self.session = session
+        self.created_at = time.monotonic()
+        self._done = asyncio.Event()
+
+    @property
+    def age(self):
+        return time.monotonic() - self.created_at
+
+    def release(self):
+        """Closes the underlying session (it is never reused by another client)."""
+        self._done.set()
+
+
+class LiveSessionPool:
+    def __init__(self, connect, size=2, max_age=300.0, retry_delay=5.0):
+        self._connect = connect
+        self.size = size
+        self.max_age = max_age
+        self.retry_delay = retry_delay
+        self._ready = []
+        self._holders = set()
+        self._maintainer = None
+        self.stats = {"hits": 0, "misses": 0, "recycled": 0, "connect_errors": 0}
+
+    def start(self):
+        for _ in range(self.size):
+            self._spawn()
+        self._maintainer = asyncio.create_task(self._maintain())
+
+    async def stop(self):
+        if self._maintainer is not None:
+            self._maintainer.cancel()
+        for lease in self._ready:
+            lease.release()
+        self._ready.clear()
+        for holder in list(self._holders):
+            holder.cancel()
+        await asyncio.gather(*self._holders, return_exceptions=True)
+
+    def acquire_nowait(self):
+        """Returns a ready PooledSession, or None if the pool is empty."""
+        while self._ready:
+            lease = self._ready.pop(0)
+            if lease.age < self.max_age:
+                self.stats["hits"] += 1
+                self._spawn()
+                return lease
+            self._recycle(lease)
+        self.stats["misses"] += 1
+        return None
+
+    def _spawn(self):
+        holder = asyncio.create_task(self._hold())
+        self._holders.add(holder)
+        holder.add_done_callback(self._holders.discard)
+
+    def _recycle(self, lease):
+        lease.release()
+        self.stats["recycled"] += 1
+        self._spawn()
+
+    async def _hold(self):
+        # The session's context manager is entered and exited by this same task
+        try:
+            async with self._connect() as session:
+                lease = PooledSession(session)
+                self._ready.append(lease)
+                await lease._done.wait()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.stats["connect_errors"] += 1
+            logger.error(f"[POOL] Could not pre-connect a live session: {e}")
+            await asyncio.sleep(self.retry_delay)
+            self._spawn()
+
+    async def _maintain(self):
+        while True:
+            await asyncio.sleep(min(30.0, self.max_age / 4))
+            for lease in list(self._ready):
+                # Refresh a little before max_age so a hand-out is never about to expire
+                if lease.age >= self.max_age * 0.9:
+                    self._ready.remove(lease)
+                    self._recycle(lease)
@@ -0,0 +1,105 @@
+"""
+Execution of Gemini function calls for the live service.
+
+Tools are registered by name with a handler that may be async or sync; sync
+handlers run on a thread pool so they never block the event loop. All calls
+of one tool_call message run concurrently, each under its own timeout, and
+results of cacheable tools are reused for identical arguments for a while
+(e.g. repeated navigation requests to the same destination).
+"""
+import asyncio
+import inspect
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from google.genai import types
+
+from observability import LIVE_TOOL_LATENCY
+
+
+class Tool:
+    def __init__(self, name, handler, timeout, cache_ttl):
+        self.name = name
+        self.handler = handler
+        self.timeout = timeout
+        self.cache_ttl = cache_ttl
+        self.is_async = inspect.iscoroutinefunction(handler)
+
+
+class ToolExecutor:
+    def __init__(self, max_workers=8, default_timeout=10.0, max_cache_entries=1024):
+        self._tools = {}
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tool")
+        self.default_timeout = default_timeout
+        self.max_cache_entries = max_cache_entries
+        self._cache = {}
+        self.stats = {"calls": 0, "cache_hits": 0, "timeouts": 0, "errors": 0}
+
+    def register(self, name, handler, timeout=None, cache_ttl=0):
+        """Registers handler(**args) as the tool `name`. cache_ttl=0 disables caching."""
+        self._tools[name] = Tool(name, handler, timeout or self.default_timeout, cache_ttl)
+
+    def _cache_get(self, key):
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
+        result, expires_at = entry
+        if expires_at < time.monotonic():
+            del self._cache[key]
+            return None
+        return result
+
+    def _cache_put(self, key, result, ttl):
+        if len(self._cache) >= self.max_cache_entries:
+            # Drop the oldest insertion; dicts keep insertion order
+            self._cache.pop(next(iter(self._cache)))
+        self._cache[key] = (result, time.monotonic() + ttl)
+
+    async def call(self, name, args):
+        """Runs one tool and returns its response dict; never raises."""
+        self.stats["calls"] += 1
+        tool = self._tools.get(name)
+        if tool is None:
+            return {"error": f"Unknown function: {name}"}
+
+        args = dict(args or {})
+        cache_key = None
+        if tool.cache_ttl:
+            cache_key = (name, json.dumps(args, sort_keys=True, default=str))
+            cached = self._cache_get(cache_key)
+            if cached is not None:
+                self.stats["cache_hits"] += 1
+                return cached
+
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            if tool.is_async:
+                result = await asyncio.wait_for(tool.handler(**args), tool.timeout)
+            else:
+                loop = asyncio.get_running_loop()
+                future = loop.run_in_executor(self._executor, lambda: tool.handler(**args))
+                result = await asyncio.wait_for(future, tool.timeout)
+            outcome = "ok"
+        except asyncio.TimeoutError:
+            outcome = "timeout"
+            self.stats["timeouts"] += 1
+            return {"error": f"{name} timed out after {tool.timeout:g}s"}
+        except Exception as e:
+            self.stats["errors"] += 1
+            return {"error": f"{name} failed: {type(e).__name__}: {e}"}
+        finally:
+            LIVE_TOOL_LATENCY.labels(name, outcome).observe(time.perf_counter() - started)
+
+        if cache_key is not None:
+            self._cache_put(cache_key, result, tool.cache_ttl)
+        return result
+
+    async def execute(self, function_calls):
+        """Runs all function calls concurrently; returns FunctionResponses in call order."""
+        results = await asyncio.gather(*(self.call(fc.name, fc.args) for fc in function_calls))
+        return [
+            types.FunctionResponse(id=fc.id, name=fc.name, response=result)
+            for fc, result in zip(function_calls, results)
+        ]
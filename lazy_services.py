@@ -0,0 +1,61 @@
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class LazyService:
+    """
+    A client (Mongo connection, Firebase app...) created on first use rather than at import.
+
+    `init` runs at most once per process: the pid is remembered, so a worker
+    forked from a parent that already initialized it runs `init` again. `init`
+    must then build a new client rather than return one the library keeps
+    registered (see app.connect_mongo). `init` may return None for "not
+    configured". If it raises, the error is kept for /ready and `get()`
+    returns None; it is retried after `retry_interval` seconds.
+    """
+
+    def __init__(self, name, init, retry_interval=30.0):
+        self.name = name
+        self._init = init
+        self.retry_interval = retry_interval
+        self._lock = threading.Lock()
+        self._pid = None
+        self._value = None
+        self._failed_at = None
+        self.error = None
+        self.init_seconds = None
+
+    def _current(self):
+        if self._pid != os.getpid():
+            return False
+        if self._failed_at is not None and time.monotonic() - self._failed_at >= self.retry_interval:
+            return False
+        return True
+
+    def get(self):
+        if self._current():
+            return self._value
+        with self._lock:
+            if not self._current():
+                started = time.perf_counter()
+                try:
+                    self._value = self._init()
+                    self.error = None
+                    self._failed_at = None
+                except Exception as e:
+                    logger.error(f"Could not initialize {self.name}: {type(e).__name__}: {e}")
+                    self._value = None
+                    self.error = f"{type(e).__name__}: {e}"
+                    self._failed_at = time.monotonic()
+                self.init_seconds = time.perf_counter() - started
+                self._pid = os.getpid()
+        return self._value
+
+    @property
+    def initialized(self):
+        """True if get() already ran in this process (whatever its outcome)."""
+        return self._pid == os.getpid()
@@ -0,0 +1,200 @@
+"""
+Structured logging and Prometheus metrics for the main backend.
+
+Logging: records are formatted as one JSON object per line and handed to a
+background thread through a bounded queue, so request threads never block on
+stdout (records are dropped and counted if the queue is full). Hot-path log
+calls can pass `extra={"sample": N}` to emit only one in N of that message;
+the message must be a constant string (details go in `extra`), since it is the key.
+
+Metrics: request latency per Flask route, MongoDB command timings (through a
+pymongo command listener), Firestore call timings and FCM batch results,
+served in Prometheus text format on /metrics. With several gunicorn workers,
+set PROMETHEUS_MULTIPROC_DIR so /metrics aggregates all of them.
+"""
+import atexit
+import itertools
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+from pymongo import monitoring
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess,
+)
+
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds', 'Flask request latency',
+    ['method', 'route', 'status'],
+)
+DB_CALL_LATENCY = Histogram(
+    'db_call_duration_seconds', 'MongoDB and Firestore call latency',
+    ['backend', 'operation', 'outcome'],
+    buckets=(.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5),
+)
+FCM_BATCHES = Counter('fcm_batches_total', 'FCM multicast batches sent', ['outcome'])
+FCM_MESSAGES = Counter('fcm_messages_total', 'FCM per-token send results', ['outcome'])
+FCM_BATCH_LATENCY = Histogram('fcm_batch_duration_seconds', 'FCM multicast batch latency')
+REFRESH_TOKEN_EVENTS = Counter('refresh_token_events_total', 'Refresh-token rotations, rejections and revocations', ['outcome'])
+LOG_RECORDS_DROPPED = Counter('log_records_dropped_total', 'Log records dropped because the log queue was full')
+
+# Attributes every LogRecord has; anything else came in through `extra`
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime', 'sample'}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'ts': round(record.created, 3),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Passes 1 in N records of a message when the call sets extra={"sample": N}."""
+
+    def __init__(self):
+        super().__init__()
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        rate = getattr(record, 'sample', 1)
+        if rate <= 1:
+            return True
+        key = (record.name, record.msg)
+        with self._lock:
+            counter = self._counters.get(key)
+            if counter is None:
+                counter = self._counters[key] = itertools.count()
+            return next(counter) % rate == 0
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS_DROPPED.inc()
+
+
+_listener = None
+
+
+def setup_logging(level='INFO', queue_size=10000):
+    """Routes the root logger through a non-blocking queue to JSON lines on stdout."""
+    global _listener
+    if _listener is not None:
+        return
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(JsonFormatter())
+    log_queue = queue.Queue(maxsize=queue_size)
+    queue_handler = DroppingQueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter())
+
+    root = logging.getLogger()
+    root.handlers[:] = [queue_handler]
+    root.setLevel(level)
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler)
+    _listener.start()
+    # Flush what is still queued when the process exits
+    atexit.register(_stop_listener)
+    # The listener thread does not survive a fork (gunicorn --preload); give each child its own
+    os.register_at_fork(after_in_child=lambda: _restart_listener(queue_handler, queue_size))
+
+
+def _restart_listener(queue_handler, queue_size):
+    global _listener
+    log_queue = queue.Queue(maxsize=queue_size)
+    queue_handler.queue = log_queue
+    _listener = logging.handlers.QueueListener(log_queue, *_listener.handlers)
+    _listener.start()
+
+
+def _stop_listener():
+    if _listener is not None:
+        _listener.stop()
+
+
+@contextmanager
+def timed(backend, operation):
+    """Records the duration of a database call under db_call_duration_seconds."""
+    start = time.perf_counter()
+    outcome = 'ok'
+    try:
+        yield
+    except Exception:
+        outcome = 'error'
+        raise
+    finally:
+        DB_CALL_LATENCY.labels(backend, operation, outcome).observe(time.perf_counter() - start)
+
+
+class MongoCommandTimer(monitoring.CommandListener):
+    """Times every MongoDB command issued by mongoengine/pymongo."""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        DB_CALL_LATENCY.labels('mongo', event.command_name, 'ok').observe(event.duration_micros / 1e6)
+
+    def failed(self, event):
+        DB_CALL_LATENCY.labels('mongo', event.command_name, 'error').observe(event.duration_micros / 1e6)
+
+
+def register_mongo_listener():
+    """Must run before the Mongo client is created."""
+    monitoring.register(MongoCommandTimer())
+
+
+def record_fcm_batch(duration, responses):
+    FCM_BATCH_LATENCY.observe(duration)
+    success_count = sum(1 for resp in responses if resp.success)
+    FCM_BATCHES.labels('ok' if success_count == len(responses) else 'partial' if success_count else 'failed').inc()
+    FCM_MESSAGES.labels('success').inc(success_count)
+    FCM_MESSAGES.labels('failure').inc(len(responses) - success_count)
+
+
+def instrument_flask(app):
+    """Adds per-route latency tracking and the /metrics endpoint to a Flask app."""
+    from flask import Response, g, request
+
+    @app.before_request
+    def _start_timer():
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def _record_latency(response):
+        started = g.pop('request_started', None)
+        if started is not None:
+            route = request.url_rule.rule if request.url_rule else 'unmatched'
+            REQUEST_LATENCY.labels(request.method, route, response.status_code).observe(
+                time.perf_counter() - started)
+        return response
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics_view():
+        return Response(metrics_payload(), mimetype=CONTENT_TYPE_LATEST)
+
+
+def metrics_payload():
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest()
@@ -0,0 +1,68 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+# Pool processes are never forked from the app process: by the time the pool
+# starts it may run gRPC (Firestore, the volunteer listener) and background
+# threads, which a forked child inherits in an unusable state.
+_START_METHOD = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+
+class PasswordHasher:
+    """
+    Runs werkzeug password hashing on a process pool, so the key derivation
+    does not occupy the request thread's worker.
+
+    `method` is a full werkzeug method spec ("scrypt:32768:8:1",
+    "pbkdf2:sha256:1000000"...). Hashes made with any other spec are reported
+    by needs_rehash(). With workers=0 hashing runs inline.
+    """
+
+    def __init__(self, method='scrypt:32768:8:1', workers=2):
+        self.method = method
+        self.workers = workers
+        self._pool = None
+        self._pool_pid = None
+        self._lock = threading.Lock()
+        self._prefix = None
+
+    def _get_pool(self):
+        # Created on first use in each process, so a pool is never inherited across a fork
+        if self._pool is None or self._pool_pid != os.getpid():
+            with self._lock:
+                if self._pool is None or self._pool_pid != os.getpid():
+                    self._pool = ProcessPoolExecutor(max_workers=self.workers,
+                                                     mp_context=multiprocessing.get_context(_START_METHOD))
+                    self._pool_pid = os.getpid()
+        return self._pool
+
+    def _run(self, fn, *args):
+        if self.workers <= 0:
+            return fn(*args)
+        return self._get_pool().submit(fn, *args).result()
+
+    def warm_up(self):
+        """Starts this process's hashing pool ahead of the first login."""
+        if self.workers > 0:
+            self._run(abs, 0)
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def hash_many(self, passwords):
+        """Hashes a batch of passwords across the pool's processes, preserving order."""
+        if self.workers <= 0:
+            return [generate_password_hash(password, self.method) for password in passwords]
+        return list(self._get_pool().map(generate_password_hash, passwords, [self.method] * len(passwords)))
+
+    def verify(self, password_hash, password):
+        return self._run(check_password_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        if self._prefix is None:
+            # Expands shorthand like "pbkdf2" to the spec werkzeug actually stores
+            self._prefix = generate_password_hash('', self.method).split('$', 1)[0]
+        return password_hash.split('$', 1)[0] != self._prefix
@@ -0,0 +1,159 @@
+import datetime
+import logging
+import os
+import threading
+import time
+import uuid
+
+import mongoengine
+
+from observability import REFRESH_TOKEN_EVENTS
+
+logger = logging.getLogger(__name__)
+
+
+class RefreshTokenError(Exception):
+    """A refresh token that must not be honoured. `reason` is 'unknown', 'revoked' or 'reused'."""
+
+    def __init__(self, reason):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class RefreshTokenFamily(mongoengine.Document):
+    """
+    One login session: every refresh token issued by rotating the first one
+    shares its family id. Only the latest token (`jti`) may be exchanged;
+    MongoDB deletes the document once the latest token has expired.
+    """
+    family = mongoengine.StringField(primary_key=True)
+    user_id = mongoengine.StringField(required=True)
+    jti = mongoengine.StringField(required=True)
+    created_at = mongoengine.DateTimeField(required=True)
+    expires_at = mongoengine.DateTimeField(required=True)
+    revoked_at = mongoengine.DateTimeField()
+
+    meta = {
+        'collection': 'refresh_tokens',
+        'indexes': [
+            {'fields': ['expires_at'], 'expireAfterSeconds': 0},
+            {'fields': ['revoked_at'], 'sparse': True},
+            'user_id',
+        ],
+    }
+
+
+class RefreshTokenStore:
+    """
+    Rotation and revocation of refresh-token families.
+
+    Rotating is a single conditional update on the family document, so of two
+    requests presenting the same token only one wins; a token that was already
+    rotated away is treated as stolen and its whole family is revoked.
+
+    Access tokens carry their family id (`sid`) and are checked against an
+    in-process set of revoked families, so authenticating a request costs no
+    database round trip. Revocations made by this process apply at once; a
+    background thread pulls those made by other workers every `sync_interval`
+    seconds. Entries are dropped once every access token they could match has
+    expired (`access_ttl`).
+    """
+
+    def __init__(self, refresh_ttl, access_ttl, sync_interval=5.0, clock_skew=5.0):
+        self.refresh_ttl = refresh_ttl
+        self.access_ttl = access_ttl
+        self.sync_interval = sync_interval
+        self.clock_skew = datetime.timedelta(seconds=clock_skew)
+        self._revoked = {}
+        self._lock = threading.Lock()
+        self._synced_until = None
+        self._sync_pid = None
+
+    def start_family(self, user_id):
+        """Records a new session for user_id and returns (family, jti) of its first refresh token."""
+        family, jti = uuid.uuid4().hex, uuid.uuid4().hex
+        now = datetime.datetime.utcnow()
+        RefreshTokenFamily(family=family, user_id=user_id, jti=jti, created_at=now,
+                           expires_at=now + self.refresh_ttl).save(force_insert=True)
+        return family, jti
+
+    def rotate(self, family, jti):
+        """
+        Exchanges refresh token `jti` of `family` for a new one and returns the new jti.
+        Raises RefreshTokenError if the token is unknown, revoked or was already used.
+        """
+        if not family or not jti:
+            REFRESH_TOKEN_EVENTS.labels('rejected').inc()
+            raise RefreshTokenError('unknown')
+        if self.is_revoked(family):
+            REFRESH_TOKEN_EVENTS.labels('rejected').inc()
+            raise RefreshTokenError('revoked')
+        new_jti = uuid.uuid4().hex
+        rotated = RefreshTokenFamily.objects(family=family, jti=jti, revoked_at=None).update_one(
+            set__jti=new_jti, set__expires_at=datetime.datetime.utcnow() + self.refresh_ttl)
+        if rotated:
+            REFRESH_TOKEN_EVENTS.labels('rotated').inc()
+            return new_jti
+
+        current = RefreshTokenFamily.objects(family=family).only('user_id', 'revoked_at').first()
+        if current is None:
+            REFRESH_TOKEN_EVENTS.labels('rejected').inc()
+            raise RefreshTokenError('unknown')
+        if current.revoked_at is not None:
+            self._remember(family, current.revoked_at)
+            REFRESH_TOKEN_EVENTS.labels('rejected').inc()
+            raise RefreshTokenError('revoked')
+        # An older token of a live family came back: someone else holds a copy
+        logger.warning("Refresh token reuse detected, revoking the session",
+                       extra={'user_id': current.user_id, 'family': family})
+        REFRESH_TOKEN_EVENTS.labels('reused').inc()
+        self.revoke(family)
+        raise RefreshTokenError('reused')
+
+    def revoke(self, family):
+        """Ends a session: its refresh token stops working and so do access tokens issued for it."""
+        now = datetime.datetime.utcnow()
+        RefreshTokenFamily.objects(family=family, revoked_at=None).update_one(set__revoked_at=now)
+        self._remember(family, now)
+        REFRESH_TOKEN_EVENTS.labels('revoked').inc()
+
+    def is_revoked(self, family):
+        self._ensure_syncing()
+        return family in self._revoked
+
+    def _remember(self, family, revoked_at):
+        with self._lock:
+            self._revoked[family] = revoked_at
+
+    # --- Revocations made by other workers ---
+    def _ensure_syncing(self):
+        if self._sync_pid == os.getpid():
+            return
+        with self._lock:
+            if self._sync_pid == os.getpid():
+                return
+            self._sync_pid = os.getpid()
+        threading.Thread(target=self._sync_loop, name='revocation-sync', daemon=True).start()
+
+    def _sync_loop(self):
+        pid = os.getpid()
+        while self._sync_pid == pid:
+            try:
+                self.sync()
+            except Exception as e:
+                logger.error(f"Could not sync revoked sessions: {type(e).__name__}: {e}")
+            time.sleep(self.sync_interval)
+
+    def sync(self):
+        """Pulls revocations newer than the last sync and drops the ones that can no longer matter."""
+        now = datetime.datetime.utcnow()
+        horizon = now - self.access_ttl - self.clock_skew
+        # Other workers stamp revoked_at with their own clocks, so overlap the previous window a little
+        since = horizon if self._synced_until is None else max(horizon, self._synced_until - self.clock_skew)
+        revoked = RefreshTokenFamily.objects(revoked_at__gt=since).only('family', 'revoked_at')
+        fetched = {doc.family: doc.revoked_at for doc in revoked}
+        with self._lock:
+            self._revoked.update(fetched)
+            for family in [f for f, revoked_at in self._revoked.items() if revoked_at < horizon]:
+                del self._revoked[family]
+        self._synced_until = now
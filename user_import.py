@@ -0,0 +1,252 @@
+import csv
+import datetime
+import io
+import json
+import logging
+import tempfile
+import threading
+import time
+import uuid
+
+import mongoengine
+from pymongo.errors import BulkWriteError
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ('csv', 'ndjson')
+# Account types an import may create; admins are only made by hand
+IMPORTABLE_ACCOUNT_TYPES = ('volunteer', 'blind')
+DUPLICATE_KEY_ERROR = 11000
+# States of an ImportJob
+RUNNING, DONE, FAILED = 'running', 'done', 'failed'
+
+
+def detect_format(content_type=None, filename=None):
+    """Picks 'csv' or 'ndjson' from a Content-Type header or a file name; None if neither says."""
+    content_type = (content_type or '').split(';')[0].strip().lower()
+    if content_type in ('text/csv', 'application/csv'):
+        return 'csv'
+    if content_type in ('application/x-ndjson', 'application/ndjson', 'application/jsonl'):
+        return 'ndjson'
+    if filename:
+        extension = filename.rsplit('.', 1)[-1].lower()
+        if extension == 'csv':
+            return 'csv'
+        if extension in ('ndjson', 'jsonl'):
+            return 'ndjson'
+    return None
+
+
+def read_records(stream, fmt):
+    """
+    Yields (line number, record dict) from a text stream, one row at a time.
+    CSV needs a header row naming the columns (name, email, password, account_type).
+    """
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for record in reader:
+            yield reader.line_num, record
+    elif fmt == 'ndjson':
+        for line_number, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record = None
+            yield line_number, record if isinstance(record, dict) else None
+    else:
+        raise ValueError(f"Unknown import format {fmt!r}, expected one of {FORMATS}")
+
+
+class ImportReport:
+    """Running totals of an import. Only the first `max_listed` problems are kept verbatim."""
+
+    def __init__(self, max_listed=100):
+        self.max_listed = max_listed
+        self.received = 0
+        self.inserted = 0
+        self.duplicate_count = 0
+        self.invalid_count = 0
+        self.duplicates = []
+        self.invalid = []
+        self.started = time.monotonic()
+
+    def duplicate(self, line, email):
+        self.duplicate_count += 1
+        if len(self.duplicates) < self.max_listed:
+            self.duplicates.append({'line': line, 'email': email})
+
+    def reject(self, line, error):
+        self.invalid_count += 1
+        if len(self.invalid) < self.max_listed:
+            self.invalid.append({'line': line, 'error': error})
+
+    def to_json(self):
+        return {
+            'received': self.received,
+            'inserted': self.inserted,
+            'duplicates': self.duplicate_count,
+            'invalid': self.invalid_count,
+            'duplicate_rows': self.duplicates,
+            'invalid_rows': self.invalid,
+            'seconds': round(time.monotonic() - self.started, 3),
+        }
+
+
+class UserImporter:
+    """
+    Creates users in bulk from CSV or NDJSON records.
+
+    Input is consumed `batch_size` rows at a time, so memory stays flat however
+    large the file is. Each batch is validated, its passwords are hashed across
+    the hasher's processes and it is written with one unordered insert_many.
+    Existing emails (and repeats within the file) are not looked up beforehand:
+    the unique email index rejects them and they are reported as duplicates.
+    """
+
+    def __init__(self, user_model, hasher, batch_size=500, max_listed=100):
+        self.user_model = user_model
+        self.hasher = hasher
+        self.batch_size = batch_size
+        self.max_listed = max_listed
+
+    def run(self, records, on_batch=None):
+        """Imports an iterable of (line, record) pairs; calls on_batch(report) after every batch."""
+        self.user_model.ensure_indexes()
+        report = ImportReport(self.max_listed)
+        batch = []
+        for line, record in records:
+            report.received += 1
+            user, password, error = self._build(record)
+            if error:
+                report.reject(line, error)
+                continue
+            batch.append((line, user, password))
+            if len(batch) >= self.batch_size:
+                self._insert(batch, report, on_batch)
+                batch = []
+        if batch:
+            self._insert(batch, report, on_batch)
+        logger.info("User import finished", extra=report.to_json())
+        return report
+
+    def _build(self, record):
+        if record is None:
+            return None, None, 'Not a JSON object'
+        name = str(record.get('name') or '').strip()
+        email = str(record.get('email') or '').strip()
+        password = str(record.get('password') or '')
+        account_type = str(record.get('account_type') or 'volunteer').strip()
+        if not all([name, email, password]):
+            return None, None, 'name, email and password are required'
+        if account_type not in IMPORTABLE_ACCOUNT_TYPES:
+            return None, None, f'account_type must be one of {", ".join(IMPORTABLE_ACCOUNT_TYPES)}'
+        # Validate everything but the hash before paying for it
+        user = self.user_model(name=name, email=email, account_type=account_type, password='-')
+        try:
+            user.validate()
+        except mongoengine.errors.ValidationError as e:
+            return None, None, ', '.join(f'{field}: {message}' for field, message in e.to_dict().items())
+        return user, password, None
+
+    def _insert(self, batch, report, on_batch):
+        hashes = self.hasher.hash_many([password for _, _, password in batch])
+        documents = []
+        for (_, user, _), password_hash in zip(batch, hashes):
+            user.password = password_hash
+            documents.append(user.to_mongo().to_dict())
+        inserted = len(documents)
+        try:
+            self.user_model._get_collection().insert_many(documents, ordered=False)
+        except BulkWriteError as e:
+            inserted = e.details.get('nInserted', 0)
+            for write_error in e.details.get('writeErrors', []):
+                line, user, _ = batch[write_error['index']]
+                if write_error.get('code') == DUPLICATE_KEY_ERROR:
+                    report.duplicate(line, user.email)
+                else:
+                    report.reject(line, write_error.get('errmsg', 'write failed'))
+        report.inserted += inserted
+        logger.info("User import batch written", extra={
+            'batch': len(batch), 'inserted': inserted, 'received': report.received, 'total_inserted': report.inserted})
+        if on_batch:
+            on_batch(report)
+
+
+class ImportJob(mongoengine.Document):
+    """Progress and outcome of one background import; MongoDB deletes it `JOB_TTL` after it started."""
+    JOB_TTL = datetime.timedelta(days=7)
+
+    job_id = mongoengine.StringField(primary_key=True)
+    status = mongoengine.StringField(required=True, choices=(RUNNING, DONE, FAILED))
+    format = mongoengine.StringField(required=True)
+    created_by = mongoengine.StringField()
+    report = mongoengine.DictField()
+    error = mongoengine.StringField()
+    created_at = mongoengine.DateTimeField(required=True)
+    updated_at = mongoengine.DateTimeField(required=True)
+
+    meta = {
+        'collection': 'user_imports',
+        'indexes': [{'fields': ['created_at'], 'expireAfterSeconds': int(JOB_TTL.total_seconds())}],
+    }
+
+    def to_json(self):
+        return {
+            'job_id': self.job_id,
+            'status': self.status,
+            'format': self.format,
+            'report': self.report or None,
+            'error': self.error,
+            'created_at': self.created_at.isoformat() + 'Z',
+            'updated_at': self.updated_at.isoformat() + 'Z',
+        }
+
+
+class ImportJobs:
+    """
+    Runs HTTP imports on a background thread of the worker that received them.
+
+    The upload is spooled first (in memory, on disk past `spool_bytes`), then
+    the request returns with the job id while the rows are hashed and written,
+    so a large file does not hold the request past the server's worker timeout.
+    The ImportJob document is updated after every batch; one whose status stays
+    'running' while updated_at stops moving was cut short by a worker restart.
+    """
+
+    def __init__(self, importer, spool_bytes=1024 * 1024):
+        self.importer = importer
+        self.spool_bytes = spool_bytes
+
+    def spool(self):
+        """A binary file to copy the upload into before handing it to start()."""
+        return tempfile.SpooledTemporaryFile(max_size=self.spool_bytes)
+
+    def start(self, body, fmt, created_by=None):
+        """Imports the spooled upload `body` in the background; the job closes it. Returns the ImportJob."""
+        now = datetime.datetime.utcnow()
+        job = ImportJob(job_id=uuid.uuid4().hex, status=RUNNING, format=fmt, created_by=created_by,
+                        created_at=now, updated_at=now)
+        job.save(force_insert=True)
+        body.seek(0)
+        threading.Thread(target=self._run, args=(job, body, fmt), name=f'user-import-{job.job_id}',
+                         daemon=True).start()
+        return job
+
+    def get(self, job_id):
+        return ImportJob.objects(job_id=job_id).first()
+
+    def _run(self, job, body, fmt):
+        def progress(report):
+            job.update(set__report=report.to_json(), set__updated_at=datetime.datetime.utcnow())
+
+        try:
+            with body:
+                stream = io.TextIOWrapper(body, encoding='utf-8-sig', newline='')
+                report = self.importer.run(read_records(stream, fmt), on_batch=progress)
+            job.update(set__status=DONE, set__report=report.to_json(), set__updated_at=datetime.datetime.utcnow())
+        except Exception as e:
+            logger.exception(f"User import {job.job_id} failed: {type(e).__name__}: {e}")
+            job.update(set__status=FAILED, set__error=f"{type(e).__name__}: {e}",
+                       set__updated_at=datetime.datetime.utcnow())
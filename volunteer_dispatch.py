@@ -0,0 +1,270 @@
+import logging
+import random
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from firebase_admin import firestore
+from google.api_core.exceptions import AlreadyExists
+
+from observability import timed
+
+logger = logging.getLogger(__name__)
+
+# Call states stored on calls/{meetingId}
+RINGING = 'ringing'
+ACCEPTED = 'accepted'
+UNANSWERED = 'unanswered'
+
+# Writes per Firestore transaction, leaving room for the call document itself
+RESERVATION_CHUNK = 499
+
+
+class CallExistsError(Exception):
+    """A call was already dispatched for this meetingId."""
+
+
+class DispatchScheduler:
+    """
+    Rings volunteers for a meeting in escalating waves instead of all at once.
+
+    Each wave reserves its volunteers (isAvailable -> False, reservedFor -> meetingId)
+    in a Firestore transaction that also checks the call is still ringing, so a
+    volunteer is never reserved twice and no wave goes out after someone accepted.
+    The call itself lives in `calls/{meetingId}`, so /accept works from any worker.
+    When the call ends, every volunteer still reserved for it is released.
+
+    Wave timers live in the dispatching process. If that process dies, the call
+    outlives its `expiresAt` and its volunteers their `reservedAt` plus the
+    ring timeout; sweep(), started in the background by dispatch() at most once
+    per wave interval, ends such calls and frees such volunteers.
+
+    `waves` are wave sizes; 0 means "everyone left".
+    """
+
+    def __init__(self, db_factory, available_volunteers, fanout, pruner=None, waves=(5, 20, 0),
+                 wave_interval=15.0, collection='volunteers', calls_collection='calls'):
+        self._db_factory = db_factory
+        self._available_volunteers = available_volunteers
+        self._fanout = fanout
+        self._pruner = pruner
+        self.waves = tuple(waves)
+        self.wave_interval = wave_interval
+        self._collection = collection
+        self._calls_collection = calls_collection
+        # Longest a call can ring: every wave plus one interval of slack
+        self.ring_timeout = timedelta(seconds=(len(self.waves) + 1) * wave_interval)
+        self._last_sweep = None
+        self._sweep_lock = threading.Lock()
+
+    def _call_ref(self, db, meeting_id):
+        return db.collection(self._calls_collection).document(meeting_id)
+
+    def dispatch(self, meeting_id, notification, data=None):
+        """
+        Starts ringing for meeting_id and sends the first wave.
+        Returns the number of volunteers notified (0 if nobody could be reserved).
+        Raises CallExistsError if meeting_id was dispatched before.
+        """
+        self._maybe_sweep()
+        db = self._db_factory()
+        try:
+            # create() fails if the document exists, so a repeated meetingId cannot reset a live call
+            self._call_ref(db, meeting_id).create({
+                'state': RINGING,
+                'reserved': [],
+                'notified': [],
+                'createdAt': firestore.SERVER_TIMESTAMP,
+                'expiresAt': datetime.now(timezone.utc) + self.ring_timeout,
+            })
+        except AlreadyExists:
+            raise CallExistsError(meeting_id)
+        notified = self._run_wave(meeting_id, 0, set(), notification, data)
+        if notified == 0:
+            self._finish(meeting_id, UNANSWERED)
+        return notified
+
+    def _run_wave(self, meeting_id, wave, already_notified, notification, data):
+        candidates = {vid: token for vid, token in self._available_volunteers().items()
+                      if vid not in already_notified}
+        size = self.waves[wave]
+        if size:
+            # Random picks, so concurrent calls do not all race for the same volunteers
+            candidates = dict(random.sample(list(candidates.items()), min(size, len(candidates))))
+
+        reserved = self._reserve(meeting_id, list(candidates))
+        if reserved is None:
+            return 0  # Call no longer ringing
+
+        tokens = {candidates[vid]: vid for vid in reserved}
+        if tokens:
+            future = self._fanout.submit(list(tokens), notification, data)
+            if self._pruner is not None:
+                self._pruner.track(future, tokens, notification, data)
+        already_notified = already_notified | set(reserved)
+        logger.info("Dispatch wave sent", extra={'meeting_id': meeting_id, 'wave': wave + 1, 'notified': len(reserved)})
+
+        timer = threading.Timer(self.wave_interval, self._next_wave,
+                                args=(meeting_id, wave + 1, already_notified, notification, data))
+        timer.daemon = True
+        timer.start()
+        return len(reserved)
+
+    def _next_wave(self, meeting_id, wave, already_notified, notification, data):
+        try:
+            if self.state(meeting_id) != RINGING:
+                return
+            if wave >= len(self.waves):
+                self._finish(meeting_id, UNANSWERED)
+                return
+            self._run_wave(meeting_id, wave, already_notified, notification, data)
+        except Exception as e:
+            logger.exception(f"Dispatch {meeting_id}: wave {wave + 1} failed: {type(e).__name__}: {e}")
+
+    def _reserve(self, meeting_id, volunteer_ids):
+        """
+        Reserves the still-available volunteers among volunteer_ids for meeting_id.
+        Returns the reserved ids, or None if the call is not ringing anymore.
+        """
+        db = self._db_factory()
+        call_ref = self._call_ref(db, meeting_id)
+
+        @firestore.transactional
+        def reserve_chunk(transaction, chunk):
+            call = call_ref.get(transaction=transaction)
+            if not call.exists or call.get('state') != RINGING:
+                return None
+            refs = [db.collection(self._collection).document(vid) for vid in chunk]
+            reserved = []
+            reserved_at = datetime.now(timezone.utc)
+            snapshots = db.get_all(refs, transaction=transaction) if refs else []
+            for snapshot in snapshots:
+                if snapshot.exists and (snapshot.to_dict() or {}).get('isAvailable') is True:
+                    transaction.update(snapshot.reference, {
+                        'isAvailable': False, 'reservedFor': meeting_id, 'reservedAt': reserved_at})
+                    reserved.append(snapshot.id)
+            if reserved:
+                # ArrayUnion rejects an empty list
+                transaction.update(call_ref, {
+                    'reserved': firestore.ArrayUnion(reserved),
+                    'notified': firestore.ArrayUnion(reserved),
+                })
+            return reserved
+
+        reserved = []
+        # Checking the call state even for an empty wave tells the caller if it ended
+        for i in range(0, max(len(volunteer_ids), 1), RESERVATION_CHUNK):
+            with timed('firestore', 'dispatch.reserve'):
+                chunk_reserved = reserve_chunk(db.transaction(), volunteer_ids[i:i + RESERVATION_CHUNK])
+            if chunk_reserved is None:
+                return reserved or None
+            reserved.extend(chunk_reserved)
+        return reserved
+
+    def accept(self, meeting_id, volunteer_id):
+        """
+        Marks the call accepted by volunteer_id if it is still ringing and the volunteer
+        was rung for it. Returns True on success; the other reserved volunteers are released.
+        """
+        db = self._db_factory()
+        call_ref = self._call_ref(db, meeting_id)
+
+        @firestore.transactional
+        def accept_call(transaction):
+            call = call_ref.get(transaction=transaction)
+            if not call.exists or call.get('state') != RINGING or volunteer_id not in call.get('notified'):
+                return None
+            transaction.update(call_ref, {'state': ACCEPTED, 'acceptedBy': volunteer_id, 'reserved': [],
+                                          'expiresAt': firestore.DELETE_FIELD})
+            # The volunteer is in the call now; sweep() must not free them
+            transaction.update(db.collection(self._collection).document(volunteer_id),
+                               {'reservedAt': firestore.DELETE_FIELD})
+            return call.get('reserved')
+
+        with timed('firestore', 'dispatch.accept'):
+            reserved = accept_call(db.transaction())
+        if reserved is None:
+            return False
+        self._release(db, meeting_id, [vid for vid in reserved if vid != volunteer_id])
+        return True
+
+    def state(self, meeting_id):
+        with timed('firestore', 'dispatch.state'):
+            call = self._call_ref(self._db_factory(), meeting_id).get()
+        return call.get('state') if call.exists else None
+
+    def _finish(self, meeting_id, state):
+        db = self._db_factory()
+        call_ref = self._call_ref(db, meeting_id)
+
+        @firestore.transactional
+        def end_call(transaction):
+            call = call_ref.get(transaction=transaction)
+            if not call.exists or call.get('state') != RINGING:
+                return None
+            transaction.update(call_ref, {'state': state, 'reserved': [], 'expiresAt': firestore.DELETE_FIELD})
+            return call.get('reserved')
+
+        with timed('firestore', 'dispatch.finish'):
+            reserved = end_call(db.transaction())
+        if reserved:
+            self._release(db, meeting_id, reserved)
+        logger.info("Dispatch finished", extra={'meeting_id': meeting_id, 'state': state})
+
+    def _release(self, db, meeting_id, volunteer_ids):
+        for i in range(0, len(volunteer_ids), RESERVATION_CHUNK):
+            batch = db.batch()
+            for vid in volunteer_ids[i:i + RESERVATION_CHUNK]:
+                batch.update(db.collection(self._collection).document(vid),
+                             {'isAvailable': True, 'reservedFor': firestore.DELETE_FIELD,
+                              'reservedAt': firestore.DELETE_FIELD})
+            with timed('firestore', 'dispatch.release'):
+                batch.commit()
+
+    # --- Recovery from lost wave timers ---
+    def _maybe_sweep(self):
+        with self._sweep_lock:
+            now = time.monotonic()
+            if self._last_sweep is not None and now - self._last_sweep < self.wave_interval:
+                return
+            self._last_sweep = now
+        threading.Thread(target=self._sweep_safely, name='dispatch-sweep', daemon=True).start()
+
+    def _sweep_safely(self):
+        try:
+            self.sweep()
+        except Exception as e:
+            logger.exception(f"Dispatch sweep failed: {type(e).__name__}: {e}")
+
+    def sweep(self):
+        """
+        Ends calls still ringing past their expiresAt and frees volunteers whose
+        reservation is older than any call can ring. Returns (calls ended, volunteers freed).
+        """
+        db = self._db_factory()
+        now = datetime.now(timezone.utc)
+        calls = db.collection(self._calls_collection).where(
+            filter=firestore.FieldFilter('expiresAt', '<', now))
+        with timed('firestore', 'dispatch.sweep_calls'):
+            expired = [call.id for call in calls.stream()]
+        for meeting_id in expired:
+            self._finish(meeting_id, UNANSWERED)
+
+        volunteers = db.collection(self._collection).where(
+            filter=firestore.FieldFilter('reservedAt', '<', now - self.ring_timeout))
+        with timed('firestore', 'dispatch.sweep_volunteers'):
+            stale = list(volunteers.stream())
+        freed = 0
+        for snapshot in stale:
+            try:
+                # Skip volunteers reserved again since the query
+                snapshot.reference.update(
+                    {'isAvailable': True, 'reservedFor': firestore.DELETE_FIELD, 'reservedAt': firestore.DELETE_FIELD},
+                    option=db.write_option(last_update_time=snapshot.update_time))
+                freed += 1
+            except Exception:
+                pass
+        if expired or freed:
+            logger.warning("Dispatch sweep released abandoned calls",
+                           extra={'calls': len(expired), 'volunteers': freed})
+        return len(expired), freed
@@ -0,0 +1,100 @@
+import logging
+import threading
+import time
+
+from observability import timed
+
+logger = logging.getLogger(__name__)
+
+
+class VolunteerRegistry:
+    """
+    In-memory view of available volunteers and their FCM tokens.
+
+    A Firestore on_snapshot listener on the "available volunteers" query keeps the
+    view up to date incrementally, so reading it costs no Firestore reads. While
+    the listener is not healthy (not started yet, no snapshot received, or the
+    watch stream died) callers fall back to streaming the query directly.
+
+    `query_factory` must return an object with `on_snapshot(callback)` and
+    `stream()`, so the registry works against a real client, the Firestore
+    emulator (FIRESTORE_EMULATOR_HOST) or a local fake.
+    """
+
+    def __init__(self, query_factory, restart_backoff=30.0):
+        self._query_factory = query_factory
+        self._restart_backoff = restart_backoff
+        self._volunteers = {}
+        self._lock = threading.Lock()
+        self._watch = None
+        self._synced = False
+        self._last_start = 0.0
+
+    def start(self):
+        """Attaches the snapshot listener. Safe to call again after a failure."""
+        with self._lock:
+            self._last_start = time.monotonic()
+            self._synced = False
+            watch = self._watch
+            self._watch = None
+        if watch is not None:
+            try:
+                watch.unsubscribe()
+            except Exception:
+                pass
+        try:
+            watch = self._query_factory().on_snapshot(self._on_snapshot)
+        except Exception as e:
+            logger.error(f"VolunteerRegistry: could not start listener: {type(e).__name__}: {e}")
+            return
+        with self._lock:
+            self._watch = watch
+
+    def stop(self):
+        with self._lock:
+            watch = self._watch
+            self._watch = None
+            self._synced = False
+            self._volunteers.clear()
+        if watch is not None:
+            watch.unsubscribe()
+
+    @property
+    def healthy(self):
+        with self._lock:
+            if not self._synced or self._watch is None:
+                return False
+            return getattr(self._watch, 'is_active', True)
+
+    def _on_snapshot(self, docs, changes, read_time):
+        with self._lock:
+            if not self._synced:
+                # First snapshot is the full result set
+                self._volunteers = {doc.id: (doc.to_dict() or {}).get('fcmToken') for doc in docs}
+                self._synced = True
+                return
+            for change in changes:
+                doc = change.document
+                if change.type.name == 'REMOVED':
+                    self._volunteers.pop(doc.id, None)
+                else:
+                    self._volunteers[doc.id] = (doc.to_dict() or {}).get('fcmToken')
+
+    def available(self):
+        """
+        Returns {volunteer_id: fcm_token} for available volunteers that have a token.
+        """
+        if self.healthy:
+            with self._lock:
+                return {vid: token for vid, token in self._volunteers.items() if isinstance(token, str) and token}
+
+        if time.monotonic() - self._last_start >= self._restart_backoff:
+            self.start()
+
+        available = {}
+        with timed('firestore', 'volunteers.stream'):
+            for volunteer_doc in self._query_factory().stream():
+                token = (volunteer_doc.to_dict() or {}).get('fcmToken')
+                if isinstance(token, str) and token:
+                    available[volunteer_doc.id] = token
+        return available